@@ -2,12 +2,31 @@
 This file contains the configuration for the LangSmith Python client.
 """
 import os
+import sys
+import asyncio
 import logging
+import weakref
+from functools import lru_cache
+import httpx
 from rich.logging import RichHandler
 from rich.console import Console
 from dotenv import load_dotenv
-from openai import OpenAI
-import phoenix as px
+
+# The modules shared by every harness live in the evals_common package at the repository root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+# pylint: disable=wrong-import-position
+from evals_common.judge_cache import JudgeCache
+from evals_common.fused_judge import parse_criteria
+from evals_common.cascade import parse_band
+from evals_common.journal import RunJournal
+from evals_common.session_registry import SessionRegistry
+from evals_common.subset import SUBSET_FRACTIONS, SubsetCache
+from evals_common.resilience import Resilience, RetryPolicy
+from evals_common.scheduler import ProviderLimiters
+from evals_common.tokens import TokenAccountant
+# pylint: enable=wrong-import-position
 
 # Load environment variables from .env file
 load_dotenv()
@@ -20,12 +39,161 @@ phoenix_client_headers = os.getenv("PHOENIX_CLIENT_HEADERS")
 openai_api_key = os.getenv("OPENAI_API_KEY")
 langflow_api_key = os.getenv("LANGFLOW_API_KEY")
 
-# initialize clients
-phoenix_client = px.Client(
-    endpoint=phoenix_endpoint,
-    api_key=phoenix_api_key,
+# Langflow connection settings
+langflow_url = os.getenv("LANGFLOW_URL", "http://127.0.0.1:7860")
+langflow_pool_size = int(os.getenv("LANGFLOW_POOL_SIZE", "10"))
+langflow_http2 = os.getenv("LANGFLOW_HTTP2", "false").lower() == "true"
+# Maximum number of Langflow calls in flight at once (overridable with --concurrency)
+langflow_concurrency = int(os.getenv("LANGFLOW_CONCURRENCY", "8"))
+
+# Retries of transient Langflow and judge failures (jittered exponential backoff),
+# and the circuit breaker that fails calls fast after consecutive failures
+retry_attempts = int(os.getenv("RETRY_ATTEMPTS", "4"))
+retry_base_delay = float(os.getenv("RETRY_BASE_DELAY", "0.5"))  # seconds
+retry_max_delay = float(os.getenv("RETRY_MAX_DELAY", "30"))  # seconds
+circuit_failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+circuit_reset_seconds = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Streaming run API settings (overridable with --stream). A streamed run is
+# cancelled once it exceeds the time or token-event budget (0 = unbounded).
+langflow_stream = os.getenv("LANGFLOW_STREAM", "false").lower() == "true"
+langflow_stream_max_seconds = float(os.getenv("LANGFLOW_STREAM_MAX_SECONDS", "30")) or None
+langflow_stream_max_tokens = int(os.getenv("LANGFLOW_STREAM_MAX_TOKENS", "0")) or None
+
+# Langflow response cache settings (mode overridable with --cache read|write|off)
+langflow_cache_mode = os.getenv("LANGFLOW_CACHE", "off")
+langflow_cache_path = os.getenv("LANGFLOW_CACHE_PATH", ".langflow_cache/responses.sqlite3")
+langflow_cache_ttl = float(os.getenv("LANGFLOW_CACHE_TTL", str(7 * 24 * 60 * 60)))  # seconds
+langflow_cache_max_mb = float(os.getenv("LANGFLOW_CACHE_MAX_MB", "256"))
+
+# LLM-as-judge verdict cache settings (read|write|off)
+judge_cache_mode = os.getenv("JUDGE_CACHE", "read")
+judge_cache_path = os.getenv("JUDGE_CACHE_PATH", ".langflow_cache/judges.sqlite3")
+judge_cache_max_mb = float(os.getenv("JUDGE_CACHE_MAX_MB", "64"))
+
+# Fused LLM-as-judge: score every criterion in one structured-output request per example
+judge_fused = os.getenv("JUDGE_FUSED", "false").lower() == "true"
+judge_criteria = parse_criteria(os.getenv("JUDGE_CRITERIA") or "helpfulness,conciseness,coherence")
+
+# Judge cascade: deterministic check, then the small judge, then the large judge only
+# for scores inside the uncertainty band (low,high on the 0-1 scale) or that disagree with the check
+judge_cascade = os.getenv("JUDGE_CASCADE", "false").lower() == "true"
+judge_small_model = os.getenv("JUDGE_SMALL_MODEL", "gpt-4.1-nano")
+judge_cascade_band = parse_band(os.getenv("JUDGE_CASCADE_BAND", "0.3,0.7"))
+
+# Stratified subset a run is limited to: smoke, medium or full (overridable with --subset).
+# Examples are stratified by these metadata keys, where "length" buckets the question
+dataset_subset = os.getenv("SUBSET", "full")
+if dataset_subset not in SUBSET_FRACTIONS:
+    raise ValueError(f"Invalid SUBSET '{dataset_subset}', expected one of {', '.join(SUBSET_FRACTIONS)}")
+subset_strata = tuple(
+    key.strip() for key in os.getenv("SUBSET_STRATA", "Unit,Rounding,length").split(",") if key.strip()
+)
+subset_cache_path = os.getenv("SUBSET_CACHE_PATH", ".langflow_cache/subsets.json")  # ids chosen per subset
+
+# Checkpoint journal of finished examples, replayed by a run started with --resume
+run_journal_path = os.getenv("RUN_JOURNAL_PATH", ".langflow_cache/journal.sqlite3")
+
+# Content hash and version of the last dataset file uploaded to each Phoenix dataset
+dataset_state_path = os.getenv("DATASET_STATE_PATH", ".langflow_cache/datasets.json")
+
+# Registry of the Langflow sessions each run creates, and whether a run deletes
+# its own sessions when it finishes (overridable with --cleanup-sessions)
+session_registry_path = os.getenv("SESSION_REGISTRY_PATH", ".langflow_cache/sessions.sqlite3")
+cleanup_sessions = os.getenv("LANGFLOW_CLEANUP_SESSIONS", "false").lower() == "true"
+
+# Clients are created on first use, so importing this module makes no network
+# calls and does not pay for the Phoenix and OpenAI SDK imports.
+@lru_cache(maxsize=None)
+def get_phoenix_client():
+    """Return the Phoenix client."""
+    # pylint: disable=import-outside-toplevel
+    import phoenix as px
+    return px.Client(
+        endpoint=phoenix_endpoint,
+        api_key=phoenix_api_key,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """Return the OpenAI client used by the judges."""
+    # pylint: disable=import-outside-toplevel
+    from openai import OpenAI
+    return OpenAI(api_key=openai_api_key)
+
+
+# Lazily created attributes, so `config.phoenix_client` keeps working
+LAZY_ATTRIBUTES = {
+    "phoenix_client": get_phoenix_client,
+    "openai_client": get_openai_client,
+}
+
+
+def __getattr__(name):
+    """Create a lazily initialized client the first time it is accessed."""
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Pooled, keep-alive HTTP clients shared by every Langflow call so that
+# examples reuse open connections instead of paying a new TCP/TLS handshake.
+langflow_client_settings = {
+    "base_url": langflow_url,
+    "headers": {"x-api-key": langflow_api_key} if langflow_api_key else {},
+    "limits": httpx.Limits(
+        max_connections=langflow_pool_size,
+        max_keepalive_connections=langflow_pool_size,
+    ),
+    "http2": langflow_http2,
+}
+langflow_client = httpx.Client(**langflow_client_settings)
+
+
+# Async clients per event loop: Phoenix runs the tasks and the evaluations of each
+# experiment in an event loop of their own, and pooled connections cannot be
+# shared between loops. A loop's clients are dropped together with the loop.
+_loop_clients = weakref.WeakKeyDictionary()
+
+
+def get_loop_client(name, factory):
+    """Return the async client `name` of the running event loop, created with `factory()` on first use."""
+    clients = _loop_clients.setdefault(asyncio.get_running_loop(), {})
+    if name not in clients:
+        clients[name] = factory()
+    return clients[name]
+
+
+def get_langflow_async_client():
+    """Return the pooled async Langflow client of the running event loop."""
+    return get_loop_client("langflow", lambda: httpx.AsyncClient(**langflow_client_settings))
+
+
+def get_async_openai_client():
+    """Return the async OpenAI client used by the judges in the running event loop."""
+    def create():
+        # pylint: disable=import-outside-toplevel
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=openai_api_key)
+    return get_loop_client("openai", create)
+
+
+# Shared cache of LLM-as-judge verdicts, so unchanged outputs are never re-judged
+judge_cache = JudgeCache(
+    judge_cache_path,
+    mode=judge_cache_mode,
+    max_bytes=int(judge_cache_max_mb * 1024 * 1024),
 )
-openai_client = OpenAI(api_key=openai_api_key)
+
+# Shared checkpoint journal, so an interrupted run can be resumed where it stopped
+run_journal = RunJournal(run_journal_path)
+
+# Cache of the example ids chosen for each subset
+subset_cache = SubsetCache(subset_cache_path)
+
+# Registry of the sessions created by this run, tagged with its run id
+session_registry = SessionRegistry(session_registry_path)
 
 # A list of models to test. You can add more models here.
 # The `provider` should match the provider name in Langflow.
@@ -59,6 +227,34 @@ MODELS_TO_TEST = [
     #}
 ]
 
+# Per-provider limits used by the matrix scheduler so that a slow or throttled
+# provider does not hold up the others. `concurrency` is the starting number of
+# calls in flight; it adapts (AIMD) between 1 and `max_concurrency` (default:
+# `concurrency`) as calls succeed, fail or slow down. `requests_per_minute` and
+# `tokens_per_minute` cap throughput (None = unlimited).
+PROVIDER_LIMITS = {
+    "OpenAI": {
+        "concurrency": 8,
+        "max_concurrency": 16,
+        "requests_per_minute": 500,
+        "tokens_per_minute": 200000,
+    },
+    "Google Generative AI": {
+        "concurrency": 8,
+        "max_concurrency": 16,
+        "requests_per_minute": 300,
+        "tokens_per_minute": 250000,
+    },
+    "Anthropic": {
+        "concurrency": 4,
+        "max_concurrency": 8,
+        "requests_per_minute": 50,
+        "tokens_per_minute": 40000,
+    },
+    "Qwen": {"concurrency": 2},  # local model server
+}
+DEFAULT_PROVIDER_LIMITS = {"concurrency": 4, "requests_per_minute": None, "tokens_per_minute": None}
+
 # ==============================================================================
 # LOGGING
 # ==============================================================================
@@ -76,7 +272,7 @@ console_handler = RichHandler(
 )
 
 # CREATE A FILE HANDLER FOR DETAILED DEBUG LOGS
-file_handler = logging.FileHandler("langflow_eval.log")
+file_handler = logging.FileHandler("langflow_eval.log", delay=True)  # opened on the first record
 file_handler.setLevel(logging.DEBUG)
 
 # CREATE A FORMATTER FOR THE FILE HANDLER
@@ -86,4 +282,21 @@ file_handler.setFormatter(formatter)
 # ADD THE HANDLERS TO THE LOGGER
 log.addHandler(console_handler)
 log.addHandler(file_handler)
+
+# ==============================================================================
+# RETRIES, PROVIDER LIMITS AND TOKEN ACCOUNTING
+# ==============================================================================
+# The shared modules take this harness's settings and logger; everything else imports these from here
+resilience = Resilience(
+    RetryPolicy(retry_attempts, retry_base_delay, retry_max_delay),
+    circuit_failure_threshold,
+    circuit_reset_seconds,
+    log,
+)
+call_with_retries, acall_with_retries = resilience.call, resilience.acall
+get_circuit_breaker, with_retries = resilience.circuit_breaker, resilience.wrap
+provider_limiters = ProviderLimiters(PROVIDER_LIMITS, DEFAULT_PROVIDER_LIMITS, log)
+get_provider_limiter = provider_limiters.get
+# Token counts of the current run, shared by every call in the harness
+token_accountant = TokenAccountant(log=log)
 # ==============================================================================
@@ -1,60 +1,100 @@
 """
 This script creates or fetches an eval dataset using Arize Pheonix for the Langflow agent.
+The examples live in a local JSONL (or Parquet) file that is uploaded to Phoenix
+in chunks, appending only the examples the dataset does not hold yet.
 """
-from config import phoenix_client, log # Arize client
-import pandas as pd
+import argparse
+import dataclasses
+import os
+from functools import lru_cache
+from config import dataset_state_path, get_phoenix_client, log, subset_cache, subset_strata # Arize client
+from dataset_upload import UPLOAD_CHUNK_SIZE, upload_dataset # Chunked, versioned dataset upload
+from evals_common.subset import subset_examples # Stratified, stable dataset subsets
 
-# Dataset name and description as they appear in LangSmith
+# Dataset name and description as they appear in Phoenix
 DATASET_NAME = "langflow-agent-evals"
 DATASET_DESC = "QA checks for our Langflow agent"
 
-# Define the examples ONCE
-examples = pd.DataFrame(
-    [
-        {
-            "question": "How do you define a function in Python?",
-            "answer": (
-                "In Python, you define a function using the 'def' keyword "
-                "followed by the function name,"
-                "parameters in parentheses, and a colon. The function body is indented below."
-            )
-        },
-        {
-            "question": "What is the difference between a list and a tuple in Python?",
-            "answer": (
-                "Lists are mutable (can be changed after creation) while tuples are immutable "
-                "(cannot be changed after creation)."
-                "Lists use square brackets [] and tuples use parentheses ()."
-            )
-        },
-        {
-            "question": "What does the 'self' parameter in Python class methods represent?",
-            "answer": (
-                "The 'self' parameter in Python class methods refers to the instance of the class."
-                "It allows access to the attributes and methods of the class."
-            )
-        },
-        {
-            "question": "What is a lambda function in Python?",
-            "answer": (
-                "A lambda function is an anonymous function defined using the 'lambda' keyword."
-                "It can take any number of arguments but can only have one expression."
-            )
-        }
-    ]
-)
-
-try:
-    # Check if the dataset already exists
-    dataset = phoenix_client.get_dataset(name=DATASET_NAME)
-    log.info("Dataset '%s' already exists. Using existing dataset.", DATASET_NAME)
-except ValueError:
-    log.info("Dataset '%s' not found. Creating a new dataset...", DATASET_NAME)
-    # If the dataset does not exist, upload it
-    dataset = phoenix_client.upload_dataset(
-        dataframe=examples,
-        dataset_name=DATASET_NAME,
-        input_keys=["question"],
-        output_keys=["answer"],
-    )
-    log.info("Successfully created dataset '%s'.", DATASET_NAME)
+# Define the examples ONCE, one {"inputs", "outputs"} record per line
+DATASET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples.jsonl")
+
+
+@lru_cache(maxsize=None)
+def get_dataset():
+    """
+    Upload the new examples of the eval dataset to Phoenix on first use and
+    return the dataset. Nothing is fetched when this module is imported.
+    """
+    dataset, _ = upload_dataset(
+        get_phoenix_client(), DATASET_NAME, DATASET_FILE, dataset_state_path, description=DATASET_DESC
+    )
+    return dataset
+
+
+def get_subset(subset):
+    """
+    Return the eval dataset limited to the examples of a stratified `subset`
+    ("smoke", "medium" or "full"). Phoenix runs an experiment on the examples of
+    the dataset it is given, so the subset keeps the dataset's id and version.
+    """
+    dataset = get_dataset()
+    if subset == "full":
+        return dataset
+    examples = subset_examples(
+        dataset.id,
+        dataset.version_id,
+        subset,
+        subset_cache,
+        subset_strata,
+        dataset.examples.values,
+        lambda ids: [dataset.examples[example_id] for example_id in ids if example_id in dataset.examples],
+    )
+    log.info("Running the %s subset: %d of %d example(s)", subset, len(examples), len(dataset.examples))
+    return dataclasses.replace(dataset, examples={example.id: example for example in examples})
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Upload a local JSONL/Parquet file to a Phoenix dataset.")
+    parser.add_argument(
+        "--file",
+        default=DATASET_FILE,
+        help=f"JSONL or Parquet file with the examples (default: {DATASET_FILE})"
+    )
+    parser.add_argument(
+        "--name",
+        default=DATASET_NAME,
+        help=f"Phoenix dataset name (default: {DATASET_NAME})"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=UPLOAD_CHUNK_SIZE,
+        help=f"Examples read and appended per request (default: {UPLOAD_CHUNK_SIZE})"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Compare the file with the dataset even if it matches the recorded content hash"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report how many examples would be added"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    upload_dataset(
+        get_phoenix_client(),
+        args.name,
+        args.file,
+        dataset_state_path,
+        description=DATASET_DESC,
+        dry_run=args.dry_run,
+        chunk_size=args.chunk_size,
+        force=args.force,
+    )
+    log.info("Upload %s.", "planned" if args.dry_run else "complete")
@@ -0,0 +1,164 @@
+"""
+This file contains the engine that uploads a large JSONL or Parquet file to a
+Phoenix dataset in chunks. The file is streamed, so it is never held in memory
+as a whole. Only the examples the dataset does not hold yet are appended, which
+adds a new dataset version. The hash of the uploaded file is recorded locally,
+so an unchanged file is not read or uploaded again.
+"""
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from config import log
+from evals_common.examples import HASH_KEY, hash_content, normalize_example
+
+# Examples read from the file and appended per upload request
+UPLOAD_CHUNK_SIZE = 1000
+
+
+def hash_file(path, block_size=1 << 20) -> str:
+    """Hash the bytes of a file, reading it in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_chunks(path, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Yield the examples of a JSONL file (one record per line) or a Parquet file
+    with the same columns, `chunk_size` examples at a time.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        chunk = []
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    chunk.append(normalize_example(json.loads(line)))
+                    if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = []
+        if chunk:
+            yield chunk
+    elif extension == ".parquet":
+        try:
+            import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+        except ImportError as e:
+            raise ImportError("Reading Parquet datasets requires pyarrow") from e
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield [normalize_example(record) for record in batch.to_pylist()]
+    else:
+        raise ValueError(f"Unsupported dataset file '{path}', expected .jsonl or .parquet")
+
+
+def example_hash(example) -> str:
+    """Return the content hash of a Phoenix dataset example, computing it for examples uploaded without one."""
+    metadata = dict(example.metadata or {})
+    content_hash = metadata.pop(HASH_KEY, None)
+    return content_hash or hash_content(
+        {"inputs": dict(example.input), "outputs": dict(example.output or {}), "metadata": metadata}
+    )
+
+
+def load_state(path) -> dict:
+    """Load the recorded {dataset name: {"content_hash", "version_id"}} uploads."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(path, state):
+    """Record the uploads, replacing the file atomically."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(state, file, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+@dataclass
+class UploadResult:
+    """How a file was uploaded to a dataset."""
+    added: int = 0
+    unchanged: int = 0
+    versions: int = 0
+    skipped: bool = False  # the file matched the recorded content hash and was not read
+
+
+def fetch_dataset(phoenix_client, dataset_name):
+    """Return the latest version of a dataset, or None when it does not exist."""
+    try:
+        return phoenix_client.get_dataset(name=dataset_name)
+    except ValueError:
+        return None
+
+
+def upload_dataset(phoenix_client, dataset_name, path, state_path, description=None, dry_run=False,
+                   chunk_size=UPLOAD_CHUNK_SIZE, force=False):
+    """
+    Append the examples of `path` the dataset does not hold yet, in requests of
+    about `chunk_size` examples, creating the dataset if needed. Phoenix makes
+    each append a new version of the dataset. Returns (dataset, result); with
+    `dry_run` nothing is written and the dataset is None when it does not exist yet.
+    """
+    content_hash = hash_file(path)
+    state = load_state(state_path)
+    recorded = state.get(dataset_name, {})
+    dataset = fetch_dataset(phoenix_client, dataset_name)
+    if dataset is not None and not force and recorded.get("content_hash") == content_hash:
+        log.info("Dataset '%s' is up to date with '%s'.", dataset_name, path)
+        return dataset, UploadResult(unchanged=len(dataset.examples), skipped=True)
+
+    known = set() if dataset is None else {example_hash(example) for example in dataset.examples.values()}
+    result = UploadResult()
+    pending = []
+
+    def flush():
+        nonlocal dataset
+        if dry_run:
+            return
+        upload = phoenix_client.append_to_dataset if dataset is not None else phoenix_client.upload_dataset
+        extra = {} if dataset is not None else {"dataset_description": description}
+        dataset = upload(
+            dataset_name=dataset_name,
+            inputs=[example["inputs"] for example in pending],
+            outputs=[example["outputs"] for example in pending],
+            metadata=[example["metadata"] for example in pending],
+            **extra,
+        )
+        result.versions += 1
+
+    for chunk in iter_chunks(path, chunk_size):
+        for example in chunk:
+            if example["metadata"][HASH_KEY] in known:
+                result.unchanged += 1
+                continue
+            known.add(example["metadata"][HASH_KEY])
+            pending.append(example)
+            result.added += 1
+        # New examples are buffered, so a small change is appended as a single version
+        if len(pending) >= chunk_size:
+            flush()
+            pending = []
+    if pending:
+        flush()
+    log.info(
+        "Dataset '%s': %d added in %d version(s), %d already uploaded",
+        dataset_name,
+        result.added,
+        result.versions,
+        result.unchanged,
+    )
+    if dry_run:
+        return dataset, result
+
+    if dataset is None:
+        raise ValueError(f"Dataset file '{path}' has no examples")
+    state[dataset_name] = {"content_hash": content_hash, "version_id": dataset.version_id}
+    save_state(state_path, state)
+    return dataset, result
@@ -1,22 +1,347 @@
 """
 This script defines an LLM-as-judge evaluator for the Langflow agent.
 """
+import json
+import time
+from types import MappingProxyType
 from typing import Any, Dict
-import openai
-from config import openai_client
+from opentelemetry import trace
+from config import (
+    acall_with_retries,
+    call_with_retries,
+    get_async_openai_client,
+    get_circuit_breaker,
+    get_openai_client,
+    judge_cache,
+    judge_cascade,
+    judge_cascade_band,
+    judge_criteria,
+    judge_fused,
+    judge_small_model,
+    run_journal,
+)
+from evals_common.cascade import JudgeCascade, cascade_stats, reference_check, reference_hint
+from evals_common.fused_judge import SharedVerdicts, fan_out, render_prompt, response_format
+from evals_common.journal import example_key
+from evals_common.metrics import METRICS, compute_metrics
+from evals_common.phases import latency_report
 from phoenix.experiments.evaluators import (
     create_evaluator,
     #HelpfulnessEvaluator,
     ConcisenessEvaluator,
     CoherenceEvaluator
 )
+from phoenix.experiments.evaluators.base import Evaluator
+from phoenix.experiments.types import AnnotatorKind, EvaluationResult
 from phoenix.evals import OpenAIModel
 
-openai_model = OpenAIModel(model="gpt-4.1-mini")
+JUDGE_MODEL = "gpt-4.1-mini"
+HELPFULNESS_PROMPT = """
+        You are grading the helpfulness of the following response on a scale of 0.0-1.0.
+        Question:
+        {question}
+        Reference answer:
+        {answer}
+        Predicted answer:
+        {output}
+        Respond with a single number from 0.0 (not helpful) to 1.0 (very helpful):
+        Score:
+    """
+
+class CachedEvaluator(Evaluator):
+    """
+    Wraps a Phoenix LLM evaluator so that its verdicts are served from the judge
+    cache when the same (input, output, expected) triple has been judged before.
+    """
+
+    def __init__(self, evaluator):
+        self._evaluator = evaluator
+        self._name = evaluator.name
+        self._kind = AnnotatorKind(evaluator.kind)
+        self._model = getattr(getattr(evaluator, "model", None), "model", JUDGE_MODEL)
+        self._template = getattr(evaluator, "template", type(evaluator).__name__)
+
+    def _rendered(self, output, expected, input):
+        return {"name": self._name, "input": dict(input), "output": output, "expected": expected}
+
+    @staticmethod
+    def _to_verdict(result: EvaluationResult) -> Dict[str, Any]:
+        return {
+            "score": result.score,
+            "label": result.label,
+            "explanation": result.explanation,
+            "metadata": dict(result.metadata or {}),
+        }
+
+    def evaluate(
+        self,
+        *,
+        output=None,
+        expected=None,
+        metadata=MappingProxyType({}),
+        input=MappingProxyType({}),
+        **kwargs: Any,
+    ) -> EvaluationResult:
+        verdict = judge_cache.verdict(
+            self._model,
+            self._template,
+            self._rendered(output, expected, input),
+            lambda: self._to_verdict(call_with_retries(
+                lambda: self._evaluator.evaluate(
+                    output=output, expected=expected, metadata=metadata, input=input, **kwargs
+                ),
+                get_circuit_breaker("judge", self._model),
+            )),
+        )
+        return EvaluationResult(**verdict)
+
+    async def async_evaluate(
+        self,
+        *,
+        output=None,
+        expected=None,
+        metadata=MappingProxyType({}),
+        input=MappingProxyType({}),
+        **kwargs: Any,
+    ) -> EvaluationResult:
+        async def judge():
+            result = await acall_with_retries(
+                lambda: self._evaluator.async_evaluate(
+                    output=output, expected=expected, metadata=metadata, input=input, **kwargs
+                ),
+                get_circuit_breaker("judge", self._model),
+            )
+            return self._to_verdict(result)
+
+        verdict = await judge_cache.averdict(
+            self._model,
+            self._template,
+            self._rendered(output, expected, input),
+            judge,
+        )
+        return EvaluationResult(**verdict)
+
+
+class TimedEvaluator(Evaluator):
+    """
+    Wraps a Phoenix evaluator so that its run time is recorded on the current span
+    and in the latency report as the `eval.<name>` phase of an (endpoint, provider, model) cell.
+    """
+
+    def __init__(self, evaluator, cell):
+        self._evaluator = evaluator
+        self._name = evaluator.name
+        self._kind = AnnotatorKind(evaluator.kind)
+        self._cell = cell
+
+    def _record(self, seconds):
+        phase = f"eval.{self._name}"
+        latency_report.record(self._cell, phase, seconds)
+        trace.get_current_span().set_attribute(f"phase.{phase}_s", round(seconds, 4))
+
+    def evaluate(self, **kwargs: Any) -> EvaluationResult:
+        start = time.perf_counter()
+        try:
+            return self._evaluator.evaluate(**kwargs)
+        finally:
+            self._record(time.perf_counter() - start)
+
+    async def async_evaluate(self, **kwargs: Any) -> EvaluationResult:
+        start = time.perf_counter()
+        try:
+            return await self._evaluator.async_evaluate(**kwargs)
+        finally:
+            self._record(time.perf_counter() - start)
+
+
+class JournaledEvaluator(Evaluator):
+    """
+    Wraps a Phoenix evaluator so that its result for an example is recorded in the
+    checkpoint journal of an (endpoint, provider, model) cell, and replayed without
+    running the evaluator when a resumed run reaches that example again. Verdicts
+    on runs without output (failed tasks) are not journaled.
+    """
+
+    def __init__(self, evaluator, cell):
+        self._evaluator = evaluator
+        self._name = evaluator.name
+        self._kind = AnnotatorKind(evaluator.kind)
+        self._cell = cell
+
+    def _entry(self, input):
+        return example_key(input), f"score.{self._name}"
+
+    def evaluate(self, *, input=MappingProxyType({}), **kwargs: Any) -> EvaluationResult:
+        key, entry = self._entry(input)
+        verdict = run_journal.get(self._cell, key, entry)
+        if verdict is None:
+            verdict = CachedEvaluator._to_verdict(self._evaluator.evaluate(input=input, **kwargs))
+            if kwargs.get("output") is not None:
+                run_journal.put(self._cell, key, entry, verdict)
+        return EvaluationResult(**verdict)
+
+    async def async_evaluate(self, *, input=MappingProxyType({}), **kwargs: Any) -> EvaluationResult:
+        key, entry = self._entry(input)
+        verdict = run_journal.get(self._cell, key, entry)
+        if verdict is None:
+            verdict = CachedEvaluator._to_verdict(await self._evaluator.async_evaluate(input=input, **kwargs))
+            if kwargs.get("output") is not None:
+                run_journal.put(self._cell, key, entry, verdict)
+        return EvaluationResult(**verdict)
+
+
+class FusedCriterionEvaluator(Evaluator):
+    """
+    Scores one criterion from the fused verdict of an example, in which every
+    criterion in `criteria` is judged in one structured-output request. The
+    evaluators of an experiment share their verdicts, so however many criteria
+    are configured, each example costs one judge request.
+    """
+
+    def __init__(self, name, criteria, verdicts, model=JUDGE_MODEL):
+        self._name = name
+        self._kind = AnnotatorKind.LLM
+        self._criteria = criteria
+        self._prompt = render_prompt(criteria)
+        self._verdicts = verdicts
+        self._model = model
+
+    def _rendered(self, output, expected, input):
+        return {"question": input.get("question"), "answer": (expected or {}).get("answer"), "output": output}
+
+    def _messages(self, rendered):
+        content = self._prompt.format(
+            inputs=rendered["question"], reference_outputs=rendered["answer"], outputs=rendered["output"]
+        )
+        return [{"role": "user", "content": content}]
+
+    def _result(self, verdict) -> EvaluationResult:
+        results = fan_out(verdict, (self._name,))
+        if not results:
+            raise ValueError(f"The fused judge returned no '{self._name}' score")
+        return EvaluationResult(score=results[0]["score"], explanation=results[0]["comment"])
+
+    def evaluate(self, *, output=None, expected=None, input=MappingProxyType({}), **kwargs: Any) -> EvaluationResult:
+        rendered = self._rendered(output, expected, input)
+
+        def judge():
+            response = call_with_retries(
+                lambda: get_openai_client().chat.completions.create(
+                    model=self._model,
+                    temperature=0,
+                    messages=self._messages(rendered),
+                    response_format=response_format(self._criteria),
+                ),
+                get_circuit_breaker("judge", self._model),
+            )
+            return json.loads(response.choices[0].message.content)
+
+        key = judge_cache.make_judge_key(self._model, self._prompt, rendered)
+        verdict = self._verdicts.get(key, lambda: judge_cache.verdict(self._model, self._prompt, rendered, judge))
+        return self._result(verdict)
+
+    async def async_evaluate(
+        self, *, output=None, expected=None, input=MappingProxyType({}), **kwargs: Any
+    ) -> EvaluationResult:
+        rendered = self._rendered(output, expected, input)
+
+        async def judge():
+            response = await acall_with_retries(
+                lambda: get_async_openai_client().chat.completions.create(
+                    model=self._model,
+                    temperature=0,
+                    messages=self._messages(rendered),
+                    response_format=response_format(self._criteria),
+                ),
+                get_circuit_breaker("judge", self._model),
+            )
+            return json.loads(response.choices[0].message.content)
+
+        key = judge_cache.make_judge_key(self._model, self._prompt, rendered)
+        verdict = await self._verdicts.aget(
+            key, lambda: judge_cache.averdict(self._model, self._prompt, rendered, judge)
+        )
+        return self._result(verdict)
+
+
+class CascadeEvaluator(Evaluator):
+    """
+    Scores one criterion through the judge cascade: the deterministic check, then
+    the fused verdict of the small judge, and the fused verdict of the large judge
+    only when the small score is uncertain or disagrees with the reference token F1.
+    """
+
+    def __init__(self, name, criteria, small_verdicts, large_verdicts):
+        self._name = name
+        self._kind = AnnotatorKind.LLM
+        self._small = FusedCriterionEvaluator(name, criteria, small_verdicts, judge_small_model)
+        self._large = FusedCriterionEvaluator(name, criteria, large_verdicts)
+        self._cascade = JudgeCascade(name, judge_cascade_band, cascade_stats)
+
+    def _check(self, output, expected):
+        """Return the (check result, hint) of the deterministic stage."""
+        answer = (expected or {}).get("answer")
+        return reference_check(self._name, output, answer), reference_hint(self._name, output, answer)
+
+    @staticmethod
+    def _as_result(result: EvaluationResult) -> Dict[str, Any]:
+        return {"score": result.score, "comment": result.explanation}
+
+    def evaluate(self, *, output=None, expected=None, **kwargs: Any) -> EvaluationResult:
+        check, hint = self._check(output, expected)
+        result = self._cascade.run(
+            [
+                ("check", lambda: check),
+                ("small", lambda: self._as_result(self._small.evaluate(output=output, expected=expected, **kwargs))),
+                ("large", lambda: self._as_result(self._large.evaluate(output=output, expected=expected, **kwargs))),
+            ],
+            hint=hint,
+        )
+        return EvaluationResult(score=result["score"], explanation=result["comment"])
+
+    async def async_evaluate(self, *, output=None, expected=None, **kwargs: Any) -> EvaluationResult:
+        check, hint = self._check(output, expected)
+
+        async def judge(evaluator):
+            return self._as_result(await evaluator.async_evaluate(output=output, expected=expected, **kwargs))
+
+        result = await self._cascade.arun(
+            [("check", lambda: check), ("small", lambda: judge(self._small)), ("large", lambda: judge(self._large))],
+            hint=hint,
+        )
+        return EvaluationResult(score=result["score"], explanation=result["comment"])
+
+
+class ReferenceMetricEvaluator(Evaluator):
+    """
+    Serves one local reference metric (see metrics.py) from the scores computed
+    for a whole experiment at once, keyed on the (output, reference answer) pair.
+    """
+
+    def __init__(self, name, scores):
+        self._name = name
+        self._kind = AnnotatorKind.CODE
+        self._scores = scores
+
+    def evaluate(self, *, output=None, expected=None, **kwargs: Any) -> EvaluationResult:
+        return EvaluationResult(score=self._scores.get((str(output or ""), (expected or {}).get("answer"))))
+
+
+def create_metric_evaluators(experiment):
+    """
+    Compute the local reference metrics for every run of a finished experiment in
+    NumPy batches, and return one evaluator per metric that serves the scores.
+    """
+    pairs = [
+        (str(run.output or ""), experiment.dataset.examples[run.dataset_example_id].output.get("answer"))
+        for run in experiment.runs.values()
+    ]
+    scores = compute_metrics([output for output, _ in pairs], [answer for _, answer in pairs])
+    return [
+        ReferenceMetricEvaluator(name, {pair: float(score) for pair, score in zip(pairs, scores[name])})
+        for name in METRICS
+    ]
 
-#helpfulness = HelpfulnessEvaluator(model=openai_model)
-conciseness = ConcisenessEvaluator(model=openai_model)
-coherence = CoherenceEvaluator(model=openai_model)
 
 # the decorator can be used to set display properties
 # `name` corresponds to the metric name shown in the UI
@@ -30,30 +355,51 @@ def wordiness(output: str, reference: Dict[str, Any]) -> float:
 
 
 @create_evaluator(kind="llm")
-def helpfulness(input: Dict[str, Any], output: str, expected: Dict[str, Any]) -> float:
+async def helpfulness(input: Dict[str, Any], output: str, expected: Dict[str, Any]) -> float:
     """Evaluates if the model's response is helpful."""
-    user_content = f"""
-        You are grading the helpfulness of the following response on a scale of 0.0-1.0.
-        Question:
-        {input["question"]}
-        Reference answer:
-        {expected["answer"]}
-        Predicted answer:
-        {output}
-        Respond with a single number from 0.0 (not helpful) to 1.0 (very helpful):
-        Score:
-    """
+    rendered = {"question": input["question"], "answer": expected["answer"], "output": output}
+    user_content = HELPFULNESS_PROMPT.format(**rendered)
+    # Reuse the verdict for an unchanged (question, reference, prediction) triple.
+    # Transient judge failures are retried; if they persist the error is raised,
+    # so Phoenix records a failed evaluation instead of a 0.0 score.
+    async def judge():
+        response = await acall_with_retries(
+            lambda: get_async_openai_client().chat.completions.create(
+                model=JUDGE_MODEL,
+                temperature=0,
+                messages=[
+                    {"role": "user", "content": user_content},
+                ],
+            ),
+            get_circuit_breaker("judge", JUDGE_MODEL),
+        )
+        return response.choices[0].message.content.strip()
+
+    response_score = await judge_cache.averdict(JUDGE_MODEL, HELPFULNESS_PROMPT, rendered, judge)
     try:
-        response_score = openai_client.chat.completions.create(
-            model="gpt-4.1-mini",
-            temperature=0,
-            messages=[
-                {"role": "user", "content": user_content},
-            ],
-        ).choices[0].message.content.strip()
         return float(response_score)
-    except openai.APIConnectionError as e:
-        print(f"Caught APIConnectionError: {e}")
-        return 0.0
     except ValueError:
         return 0.0
+
+
+def create_evaluators():
+    """
+    Create the evaluators of one experiment. With the fused judge, the criteria
+    in JUDGE_CRITERIA are scored in one judge request per example, and with the
+    judge cascade the large judge only sees the examples the small one is unsure of.
+    The judge models hold async clients bound to the event loop Phoenix runs the
+    evaluations in, so every experiment gets models of its own.
+    """
+    if judge_cascade:
+        small_verdicts, large_verdicts = SharedVerdicts(len(judge_criteria)), SharedVerdicts(len(judge_criteria))
+        return [CascadeEvaluator(name, judge_criteria, small_verdicts, large_verdicts) for name in judge_criteria]
+    if judge_fused:
+        verdicts = SharedVerdicts(len(judge_criteria))
+        return [FusedCriterionEvaluator(name, judge_criteria, verdicts) for name in judge_criteria]
+    openai_model = OpenAIModel(model=JUDGE_MODEL)
+    #helpfulness = HelpfulnessEvaluator(model=openai_model)
+    return [
+        helpfulness,
+        CachedEvaluator(ConcisenessEvaluator(model=openai_model)),
+        CachedEvaluator(CoherenceEvaluator(model=openai_model)),
+    ]
@@ -2,27 +2,53 @@
 This script runs a Langflow agent flow
 and evaluates its performance using Arize Phoenix.
 """
+import argparse
+import asyncio
+import time
 import uuid
-from functools import partial
 import os
-import requests
-import tiktoken
-import nest_asyncio
 from phoenix.otel import register
-from phoenix.experiments import run_experiment
+from phoenix.experiments import evaluate_experiment, run_experiment
 from opentelemetry import trace
 from openinference.semconv.trace import SpanAttributes
 from config import (
     log,
-    langflow_api_key,
-    MODELS_TO_TEST
+    langflow_client,
+    get_langflow_async_client,
+    langflow_concurrency,
+    langflow_stream,
+    langflow_stream_max_seconds,
+    langflow_stream_max_tokens,
+    langflow_cache_mode,
+    langflow_cache_path,
+    langflow_cache_ttl,
+    langflow_cache_max_mb,
+    MODELS_TO_TEST,
+    run_journal,
+    session_registry,
+    cleanup_sessions,
+    dataset_subset,
+    resilience,
+    provider_limiters,
+    get_provider_limiter,
+    token_accountant,
 )
-from dataset import dataset
+from dataset import get_subset
 from judge import (
-    helpfulness,
-    conciseness,
-    coherence
+    create_evaluators,
+    create_metric_evaluators,
+    JournaledEvaluator,
+    TimedEvaluator,
 )
+from evals_common.scheduler import estimate_tokens
+from evals_common.response_cache import NOT_LOOKED_UP, ResponseCache, CACHE_MODES
+from evals_common.streaming import LangflowStreamer
+from evals_common.phases import latency_report
+from evals_common.langflow import LangflowHooks, LangflowRunner
+from evals_common.cascade import cascade_stats
+from evals_common.journal import OUTPUT, example_key
+from evals_common.session_registry import delete_run_sessions
+from evals_common.subset import SUBSETS
 
 AGENT_ID = "Agent-20ggR"
 ENDPOINT_NAME = "evals_in_langflow"
@@ -40,97 +66,374 @@ tracer = tracer_provider.get_tracer(__name__)
 headers = os.getenv("OTEL_EXPORTER_OTLP_HEADERS")
 endpoint = os.getenv("PHOENIX_COLLECTOR_ENDPOINT")
 
-@tracer.llm
-#@tracer.chain
-def call_langflow_api(example, provider, model_name, api_key):
+# Persistent cache of Langflow responses (mode set with --cache)
+response_cache = ResponseCache(
+    langflow_cache_path,
+    mode=langflow_cache_mode,
+    ttl=langflow_cache_ttl,
+    max_bytes=int(langflow_cache_max_mb * 1024 * 1024),
+)
+
+# Streaming Langflow runs with time-to-first-token timings (enabled with --stream)
+langflow_streamer = LangflowStreamer(
+    enabled=langflow_stream,
+    max_seconds=langflow_stream_max_seconds,
+    max_tokens=langflow_stream_max_tokens,
+)
+
+
+def build_tweaks(provider, model_name, api_key):
     """
-    Call the Langflow API to run the evals_in_langflow flow.
+    Build the agent tweaks that select the provider and model in Langflow.
     """
-    input_value = example.input["question"]
-    log.debug("call_langflow_api input_value: %s", input_value)
-    url = f"http://127.0.0.1:7860/api/v1/run/{ENDPOINT_NAME}"
-    payload = {
+    return {
+        AGENT_ID: {
+            "agent_llm": provider,
+            "model_name": model_name,
+            "api_key": api_key,
+        }
+    }
+
+
+def build_payload(input_value, provider, model_name, api_key):
+    """
+    Build the Langflow run API request payload for one input.
+    """
+    return {
         "output_type": "chat",
         "input_type": "chat",
         "input_value": input_value,
         "session_id": str(uuid.uuid4()),
-        "tweaks": {
-            AGENT_ID: {
-                "agent_llm": provider,
-                "model_name": model_name,
-                "api_key": api_key,
-            }
-        },
+        "tweaks": build_tweaks(provider, model_name, api_key),
     }
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": langflow_api_key,
-    }
-    try:
-        result = requests.post(url, json=payload, headers=headers, timeout=30)
-        result.raise_for_status()
-        response_json = result.json()
-        output = (
-            response_json.get("outputs", [{}])[0]
-            .get("outputs", [{}])[0]
-            .get("results", {})
-            .get("message", {})
-            .get("data", {})
-            .get("text")
-        )
 
-        encoding = tiktoken.get_encoding("cl100k_base")
-        prompt_tokens = len(encoding.encode(input_value))
-        completion_tokens = len(encoding.encode(output))
-        total_tokens = prompt_tokens + completion_tokens
-
-        current_span = trace.get_current_span()
-        current_span.set_attributes(
-            {
-                SpanAttributes.LLM_PROVIDER: provider,
-                SpanAttributes.LLM_MODEL_NAME: model_name,
-                SpanAttributes.LLM_TOKEN_COUNT_PROMPT: prompt_tokens,
-                SpanAttributes.LLM_TOKEN_COUNT_COMPLETION: completion_tokens,
-                SpanAttributes.LLM_TOKEN_COUNT_TOTAL: total_tokens,
-            }
-        )
-        log.debug("call_langflow_api output: %s", output)
+
+def cache_key(input_value, provider, model_name, api_key):
+    """
+    Build the response cache key for one Langflow request.
+    """
+    tweaks = build_tweaks(provider, model_name, api_key)
+    return ResponseCache.make_key(ENDPOINT_NAME, tweaks, provider, model_name, input_value)
+
+
+def register_session(endpoint_name, payload):
+    """
+    Register the session of a Langflow request under this run.
+    """
+    session_registry.add(endpoint_name, payload["session_id"])
+
+
+def parse_output(response_json):
+    """
+    Extract the chat message text from a Langflow run API response.
+    """
+    return (
+        response_json.get("outputs", [{}])[0]
+        .get("outputs", [{}])[0]
+        .get("results", {})
+        .get("message", {})
+        .get("data", {})
+        .get("text")
+    )
+
+
+def record_llm_attributes(counts, provider, model_name, cached=False):
+    """
+    Record the provider, model, token counts (see tokens.py) and whether
+    the output came from the response cache on the current span.
+    """
+    current_span = trace.get_current_span()
+    current_span.set_attributes(
+        {
+            SpanAttributes.LLM_PROVIDER: provider,
+            SpanAttributes.LLM_MODEL_NAME: model_name,
+            SpanAttributes.LLM_TOKEN_COUNT_PROMPT: counts["prompt_tokens"],
+            SpanAttributes.LLM_TOKEN_COUNT_COMPLETION: counts["completion_tokens"],
+            SpanAttributes.LLM_TOKEN_COUNT_TOTAL: counts["total_tokens"],
+            "llm.token_count.source": counts["source"],
+            "cached": cached,
+        }
+    )
+
+
+def record_stream_attributes(timings):
+    """
+    Record time-to-first-token, inter-token latency and total time of a
+    streamed run on the current span.
+    """
+    trace.get_current_span().set_attributes(
+        {f"langflow.stream.{name}": value for name, value in timings.metrics().items() if value is not None}
+    )
+
+
+class PhoenixHooks(LangflowHooks):
+    """
+    Record each Langflow call on the current span: its provider, model, token
+    counts, whether it was cached, and its stream and phase timings.
+    """
+
+    def cached(self, cell, counts):
+        record_llm_attributes(counts, cell[1], cell[2], cached=True)
+
+    def sent(self, cell, payload):
+        register_session(cell[0], payload)
+
+    def streamed(self, cell, timings):
+        record_stream_attributes(timings)
+
+    def finished(self, cell, timer, counts):
+        trace.get_current_span().set_attributes(timer.metadata())
+        record_llm_attributes(counts, cell[1], cell[2])
+
+
+# Request, stream, parse, retry and cache path of every Langflow call
+langflow_runner = LangflowRunner(
+    langflow_streamer,
+    resilience,
+    provider_limiters,
+    token_accountant,
+    parse_output,
+    hooks=PhoenixHooks(),
+    timeout=30,
+    log=log,
+)
+
+
+@tracer.llm
+#@tracer.chain
+def call_langflow_api(example, provider, model_name, api_key):
+    """
+    Call the Langflow API to run the evals_in_langflow flow.
+    Raises LangflowCallError when the call failed after its retries.
+    """
+    input_value = example.input["question"]
+    return langflow_runner.call(
+        langflow_client,
+        response_cache,
+        (ENDPOINT_NAME, provider, model_name),
+        input_value,
+        build_payload(input_value, provider, model_name, api_key),
+        cache_key(input_value, provider, model_name, api_key),
+    )
+
+
+@tracer.llm
+async def acall_langflow_api(example, provider, model_name, api_key, cached=NOT_LOOKED_UP):
+    """
+    Async version of call_langflow_api using the pooled async Langflow client.
+    `cached` is the response the caller already looked up in the response cache
+    (None on a miss); by default it is looked up here, off the event loop.
+    """
+    input_value = example.input["question"]
+    return await langflow_runner.acall(
+        get_langflow_async_client(),
+        response_cache,
+        (ENDPOINT_NAME, provider, model_name),
+        input_value,
+        build_payload(input_value, provider, model_name, api_key),
+        cache_key(input_value, provider, model_name, api_key),
+        cached=cached,
+    )
+
+
+def create_task(provider, model_name, api_key, concurrency):
+    """
+    Create an async Phoenix task for the Langflow API.
+    Phoenix expects a task function with only (example) as input, and runs up to
+    `concurrency` async tasks at once. Calls wait on the provider limiter first,
+    and the semaphore bounds how many Langflow calls are in flight at once.
+    Cached responses skip both, and outputs already in the checkpoint journal
+    are replayed without calling Langflow at all.
+    A failed call raises LangflowCallError, so Phoenix records the run as failed.
+    """
+    limiter = get_provider_limiter(provider)
+    cell = (ENDPOINT_NAME, provider, model_name)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def task(example):
+        key = example_key(example.input)
+        output = run_journal.get(cell, key)
+        if output is not None:
+            trace.get_current_span().set_attribute("resumed", True)
+            return output
+        question = example.input["question"]
+        cached = await response_cache.aget(cache_key(question, provider, model_name, api_key))
+        if cached is not None:
+            output = await acall_langflow_api(example, provider, model_name, api_key, cached=cached)
+        else:
+            async with limiter.aslot(estimate_tokens(question)):
+                async with semaphore:
+                    output = await acall_langflow_api(example, provider, model_name, api_key, cached=None)
+                limiter.record_tokens(estimate_tokens(output))
+        run_journal.put(cell, key, OUTPUT, output)
         return output
-    except requests.exceptions.RequestException as e:
-        log.error("Error making API request: %s", e)
-        return None
-    except (ValueError, KeyError, IndexError) as e:
-        log.error("Error parsing response: %s", e)
-        return None
+    return task
 
 
-if __name__ == "__main__":
-    nest_asyncio.apply()
-    log.info("\n[bold]Starting Arize Phoenix Evals...[/bold]")
+def run_model_experiment(model_config, concurrency, dataset):
+    """
+    Run the Phoenix experiment for one model in MODELS_TO_TEST.
+    The task and the evaluators are async, so Phoenix runs up to `concurrency`
+    examples at once; this only happens on the main thread with no event loop
+    running, where Phoenix runs them in an event loop of its own.
+    Phoenix cannot add runs to an existing experiment, so a resumed run starts a
+    new experiment in which the journaled examples are replayed and only the
+    unfinished ones call Langflow and the judges.
+    The local reference metrics are then computed for all runs at once and
+    added to the experiment as evaluations of their own. Only the examples of
+    `dataset` are run, which may be a subset of the eval dataset.
+    """
+    provider = model_config["provider"]
+    model_name = model_config["model_name"]
+    api_key = model_config["api_key"]
+
+    task = create_task(provider, model_name, api_key, concurrency)
+    cell = (ENDPOINT_NAME, provider, model_name)
+
+    log.info(
+        "Running evaluation for [bold blue]%s[/bold blue] - [bold green]%s[/bold green]",
+        provider,
+        model_name,
+    )
+    experiment = run_experiment(
+        dataset=dataset,
+        task=task,
+        evaluators=[
+            TimedEvaluator(JournaledEvaluator(evaluator, cell), cell)
+            for evaluator in create_evaluators()
+        ],
+        experiment_name=f"{ENDPOINT_NAME}-{provider}-{model_name}",
+        concurrency=concurrency,
+    )
+    start = time.perf_counter()
+    metric_evaluators = create_metric_evaluators(experiment)
+    latency_report.record(cell, "eval.reference_metrics", time.perf_counter() - start)
+    experiment = evaluate_experiment(experiment, evaluators=metric_evaluators, concurrency=concurrency)
+    log.info("Experiment results: %s", experiment.url)
+    return experiment
+
+
+def run_experiments(dataset, concurrency):
+    """
+    Run the Phoenix experiment of every model in MODELS_TO_TEST, one after another.
+    Phoenix only runs an async task on the main thread: in a worker thread it falls
+    back to its sync executor, which rejects async tasks. So the experiments cannot
+    share the process side by side, and each instead keeps up to `concurrency`
+    examples in flight. The cost of running them in turn is logged: the total time
+    against the longest experiment, the least a concurrent matrix could take.
+    A failed model does not stop the others.
+    """
+    durations = []
+    start = time.perf_counter()
     for model_config in MODELS_TO_TEST:
-        PROVIDER = model_config["provider"]
-        MODEL_NAME = model_config["model_name"]
-        API_KEY = model_config["api_key"]
-
-        # Use partial to create a function with the model config
-        # because Phoenix expects a task function with only (example) as input.
-        # call_langflow_api expects (example, provider, model_name, and api_key)
-        task = partial(
-            call_langflow_api,
-            provider=PROVIDER,
-            model_name=MODEL_NAME,
-            api_key=API_KEY,
+        cell = (ENDPOINT_NAME, model_config["provider"], model_config["model_name"])
+        experiment_start = time.perf_counter()
+        try:
+            run_model_experiment(model_config, concurrency, dataset)
+        except Exception as e:  # pylint: disable=broad-except
+            log.error("Evaluation of %s - %s failed: %s", cell[1], cell[2], e)
+        durations.append(time.perf_counter() - experiment_start)
+        latency_report.record(cell, "experiment", durations[-1])
+    if len(durations) > 1:
+        log.info(
+            "Ran %d experiments one after another in %.1fs; concurrently they would take at least %.1fs",
+            len(durations),
+            time.perf_counter() - start,
+            max(durations),
         )
 
+
+def flush_traces():
+    """
+    Wait for the remaining Phoenix spans to be exported, recording
+    how long it took as the `trace_export` phase.
+    """
+    start = time.perf_counter()
+    tracer_provider.force_flush()
+    latency_report.record((ENDPOINT_NAME, "all", "all"), "trace_export", time.perf_counter() - start)
+
+
+def cleanup_run_sessions(cleanup, concurrency):
+    """
+    Delete the Langflow sessions this run created, or tell how to delete them later.
+    """
+    session_registry.flush()
+    if cleanup:
+        deleted, failed = delete_run_sessions(langflow_client, session_registry, concurrency=concurrency)
+        log.info("Deleted %d Langflow session(s) of run %s, %d failed", deleted, session_registry.run_id, failed)
+    else:
         log.info(
-            "Running evaluation for [bold blue]%s[/bold blue] - [bold green]%s[/bold green]",
-            PROVIDER,
-            MODEL_NAME,
+            "Langflow sessions of this run are registered as run %s. Delete them with: "
+            "python utils/delete_sessions.py --run %s --registry %s",
+            session_registry.run_id,
+            session_registry.run_id,
+            os.path.abspath(session_registry.path),
         )
-        experiment = run_experiment(
-            dataset=dataset,
-            task=task,
-            evaluators=[helpfulness, conciseness, coherence],
-            experiment_name=f"{ENDPOINT_NAME}-{PROVIDER}-{MODEL_NAME}",
+    session_registry.close()
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Run Arize Phoenix evals against a Langflow agent.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=langflow_concurrency,
+        help=f"Maximum number of Langflow calls in flight (default: {langflow_concurrency})"
+    )
+    parser.add_argument(
+        "--cache",
+        choices=CACHE_MODES,
+        default=langflow_cache_mode,
+        help=(
+            "Langflow response cache mode: 'read' serves and stores cached responses, "
+            "'write' refreshes them, 'off' bypasses the cache "
+            f"(default: {langflow_cache_mode})"
         )
-        log.info("Experiment results: %s", experiment.url)
+    )
+    parser.add_argument(
+        "--stream",
+        action=argparse.BooleanOptionalAction,
+        default=langflow_stream,
+        help="Use Langflow's streaming run API and record time-to-first-token (default: LANGFLOW_STREAM)"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the previous run: replay journaled outputs and scores, only running unfinished examples"
+    )
+    parser.add_argument(
+        "--subset",
+        choices=SUBSETS,
+        default=dataset_subset,
+        help=(
+            "Run a stratified, stable sample of the dataset: 'smoke' (5%%), 'medium' (25%%) "
+            f"or 'full' (default: {dataset_subset})"
+        )
+    )
+    parser.add_argument(
+        "--cleanup-sessions",
+        action=argparse.BooleanOptionalAction,
+        default=cleanup_sessions,
+        help="Delete the Langflow sessions this run created when it finishes (default: LANGFLOW_CLEANUP_SESSIONS)"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    response_cache.mode = args.cache
+    langflow_streamer.enabled = args.stream
+    log.info("\n[bold]Starting Arize Phoenix Evals...[/bold]")
+    dataset = get_subset(args.subset)  # fetch (or upload) the dataset once, before the first experiment
+    if not args.resume:
+        run_journal.reset()
+    run_experiments(dataset, args.concurrency)
+    cleanup_run_sessions(args.cleanup_sessions, args.concurrency)
+    langflow_client.close()
+    response_cache.close()
+    run_journal.close()
+    flush_traces()
+    latency_report.print_table()
+    token_accountant.print_table()
+    cascade_stats.print_table()
@@ -0,0 +1,9 @@
+"""
+Modules shared by the LangSmith, Arize Phoenix and single vs multi agent
+harnesses: the scheduler, resilience layer, caches, checkpoint journal, latency
+phases, token accounting, streaming client, judges' building blocks, reference
+metrics, dataset subsets and session registry. Each harness's config.py puts
+the repository root on the import path. The scheduler, resilience layer and
+token accountant read their settings from the `config` module of the harness
+that is running.
+"""
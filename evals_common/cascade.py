@@ -0,0 +1,160 @@
+"""
+This file contains the judge cascade. Each example is scored by a deterministic
+check first, then by a small, fast judge, and reaches the large judge only when
+the small judge's score falls inside the uncertainty band or disagrees with the
+reference overlap of the output. The stage that settled each example is counted,
+so the hit rate of every stage can be printed at the end of a run.
+"""
+import inspect
+import threading
+from collections import Counter, defaultdict
+from rich.console import Console
+from rich.table import Table
+
+# Stages in the order they run: deterministic check, small judge, large judge
+CASCADE_STAGES = ("check", "small", "large")
+# Criteria judged against the reference answer, which the deterministic check can settle
+REFERENCE_CRITERIA = ("correctness", "helpfulness")
+# Scores at or above this count as a pass when two stages are compared
+PASS_THRESHOLD = 0.5
+
+
+def parse_band(spec) -> tuple:
+    """Parse the "low,high" uncertainty band of the cascade, e.g. "0.3,0.7"."""
+    try:
+        low, high = (float(value) for value in spec.split(","))
+    except ValueError as e:
+        raise ValueError(f"Invalid cascade band '{spec}', expected 'low,high', e.g. '0.3,0.7'") from e
+    if not 0.0 <= low <= high <= 1.0:
+        raise ValueError(f"Invalid cascade band '{spec}', expected 0 <= low <= high <= 1")
+    return low, high
+
+
+def reference_check(criterion, output, answer):
+    """
+    Settle a reference-based criterion without a judge: an empty output fails and
+    an output with the same words as the reference answer passes. Returns a
+    {key, score, comment} result, or None when the judges have to decide.
+    """
+    if criterion not in REFERENCE_CRITERIA or not answer:
+        return None
+    from .metrics import tokenize  # pylint: disable=import-outside-toplevel
+    tokens = tokenize(output)
+    if not tokens:
+        return {"key": criterion, "score": 0.0, "comment": "Empty response"}
+    if tokens == tokenize(answer):
+        return {"key": criterion, "score": 1.0, "comment": "Same words as the reference answer"}
+    return None
+
+
+def reference_hint(criterion, output, answer):
+    """Token F1 of the output against the reference answer, or None for criteria without a reference."""
+    if criterion not in REFERENCE_CRITERIA or not answer:
+        return None
+    from .metrics import tokenize  # pylint: disable=import-outside-toplevel
+    output_tokens, reference_tokens = tokenize(output), tokenize(answer)
+    total = len(output_tokens) + len(reference_tokens)
+    overlap = sum((Counter(output_tokens) & Counter(reference_tokens)).values())
+    return 2 * overlap / total if total else 0.0
+
+
+class CascadeStats:
+    """Thread-safe count of the examples each cascade stage settled, per criterion."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(Counter)
+
+    def record(self, criterion, stage):
+        """Count one example of `criterion` settled by `stage`."""
+        with self._lock:
+            self._counts[criterion][stage] += 1
+
+    def hit_rates(self) -> dict:
+        """Return {criterion: {stage: share of the examples it settled}}."""
+        with self._lock:
+            counts = {criterion: dict(stages) for criterion, stages in self._counts.items()}
+        return {
+            criterion: {stage: stages.get(stage, 0) / sum(stages.values()) for stage in CASCADE_STAGES}
+            for criterion, stages in counts.items()
+        }
+
+    def print_table(self, console=None):
+        """Print how many examples each stage settled, per criterion."""
+        with self._lock:
+            counts = {criterion: dict(stages) for criterion, stages in self._counts.items()}
+        if not counts:
+            return
+        table = Table(title="Judge cascade hit rate")
+        table.add_column("Criterion")
+        for column in ("N", *CASCADE_STAGES):
+            table.add_column(column, justify="right")
+        for criterion in sorted(counts):
+            total = sum(counts[criterion].values())
+            table.add_row(
+                criterion,
+                str(total),
+                *(f"{counts[criterion].get(stage, 0)} ({counts[criterion].get(stage, 0) / total:.0%})"
+                  for stage in CASCADE_STAGES),
+            )
+        (console or Console()).print(table)
+
+
+class JudgeCascade:
+    """
+    Runs the stages of one criterion. Each stage returns a {key, score, comment}
+    result with a score from 0.0 to 1.0, or None when it has no verdict. A result
+    settles the example when its score is outside the uncertainty `band` and
+    agrees with the hint (an earlier score outside the band); the last stage
+    always settles it.
+    """
+
+    def __init__(self, criterion, band, stats):
+        self.criterion = criterion
+        self.band = band
+        self.stats = stats
+
+    def uncertain(self, score) -> bool:
+        """Whether a score falls inside the uncertainty band."""
+        return self.band[0] <= score <= self.band[1]
+
+    def settles(self, score, hint) -> bool:
+        """Whether a score settles the example, given the hint of the earlier stages."""
+        if self.uncertain(score):
+            return False
+        return hint is None or self.uncertain(hint) or (score >= PASS_THRESHOLD) == (hint >= PASS_THRESHOLD)
+
+    def _settle(self, stage, result, hint, last):
+        """Return (settled, hint) after `stage` returned `result`."""
+        if result is None:
+            return False, hint
+        if last or self.settles(result["score"], hint):
+            self.stats.record(self.criterion, stage)
+            return True, hint
+        return False, hint if hint is not None and not self.uncertain(hint) else result["score"]
+
+    def run(self, stages, hint=None):
+        """Run `stages`, a list of (stage, judge) pairs, until one settles the example."""
+        result = None
+        for i, (stage, judge) in enumerate(stages):
+            result = judge()
+            settled, hint = self._settle(stage, result, hint, i == len(stages) - 1)
+            if settled:
+                return result
+        return result
+
+    async def arun(self, stages, hint=None):
+        """Async version of run, where a judge may return an awaitable."""
+        result = None
+        for i, (stage, judge) in enumerate(stages):
+            result = judge()
+            if inspect.isawaitable(result):
+                result = await result
+            settled, hint = self._settle(stage, result, hint, i == len(stages) - 1)
+            if settled:
+                return result
+        return result
+
+
+# Stage hits of the current run, shared by every cascade in the harness
+cascade_stats = CascadeStats()
@@ -0,0 +1,30 @@
+"""
+This file contains the content hashing of dataset examples shared by the
+LangSmith dataset sync and the Phoenix dataset upload. A local record is
+normalized into an example whose metadata carries the hash of its content,
+so an example is only pushed again when its content changed.
+"""
+import hashlib
+import json
+
+# Example metadata key holding the hash of the uploaded content
+HASH_KEY = "content_hash"
+
+
+def hash_content(value) -> str:
+    """Hash a JSON-serializable value independently of key order."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def normalize_example(record: dict) -> dict:
+    """
+    Turn a `{"inputs": ..., "outputs": ..., "metadata": ...}` record into an example
+    whose metadata carries the hash of its content.
+    """
+    if not isinstance(record.get("inputs"), dict):
+        raise ValueError(f"Dataset record has no 'inputs' object: {record}")
+    inputs = record["inputs"]
+    outputs = record.get("outputs") or {}
+    metadata = {key: value for key, value in (record.get("metadata") or {}).items() if key != HASH_KEY}
+    content_hash = hash_content({"inputs": inputs, "outputs": outputs, "metadata": metadata})
+    return {"inputs": inputs, "outputs": outputs, "metadata": {**metadata, HASH_KEY: content_hash}}
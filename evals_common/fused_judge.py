@@ -0,0 +1,151 @@
+"""
+This file contains the fused LLM-as-judge, which scores every configured
+criterion in one structured-output request per example instead of one request
+per criterion. The verdict is fanned out into one result per criterion, so
+each criterion is still recorded as its own feedback key or annotation.
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Criteria the fused judge can score, each from 0.0 (fails) to 1.0 (fully meets it)
+CRITERIA = {
+    "correctness": "Is the response factually accurate and consistent with the reference answer?",
+    "conciseness": "Does the response answer without unnecessary detail, repetition or filler?",
+    "hallucination": "Is every claim in the response supported by the question or the reference answer? "
+                     "(1.0 means nothing is made up)",
+    "helpfulness": "Does the response fully and usefully answer the question?",
+    "coherence": "Is the response well organized, logically consistent and easy to follow?",
+}
+
+FUSED_PROMPT = """
+        You are grading a response on several criteria at once.
+        Score every criterion independently, from 0.0 (fails the criterion) to 1.0 (fully meets it),
+        and give a one-sentence reasoning for each score.
+        Criteria:
+{criteria}
+        Question:
+        {inputs}
+        Reference answer:
+        {reference_outputs}
+        Response:
+        {outputs}
+    """
+
+
+def parse_criteria(spec) -> tuple:
+    """Parse a comma-separated list of criteria, e.g. "correctness,conciseness"."""
+    criteria = tuple(name.strip() for name in spec.split(",") if name.strip())
+    unknown = [name for name in criteria if name not in CRITERIA]
+    if unknown or not criteria:
+        raise ValueError(
+            f"Invalid judge criteria '{spec}', expected a comma-separated list of {', '.join(CRITERIA)}"
+        )
+    return criteria
+
+
+def render_prompt(criteria) -> str:
+    """
+    Return the fused prompt template for `criteria`. The {inputs}, {outputs} and
+    {reference_outputs} placeholders are left for the judge to fill in.
+    """
+    lines = "\n".join(f"        - {name}: {CRITERIA[name]}" for name in criteria)
+    return FUSED_PROMPT.replace("{criteria}", lines)
+
+
+def fused_schema(criteria) -> dict:
+    """JSON schema of the fused verdict: a {reasoning, score} object per criterion."""
+    verdict = {
+        "type": "object",
+        "properties": {
+            "reasoning": {"type": "string"},
+            "score": {"type": "number"},
+        },
+        "required": ["reasoning", "score"],
+        "additionalProperties": False,
+    }
+    return {
+        "title": "fused_verdict",
+        "description": "One score from 0.0 to 1.0, with its reasoning, per criterion.",
+        "type": "object",
+        "properties": {name: verdict for name in criteria},
+        "required": list(criteria),
+        "additionalProperties": False,
+    }
+
+
+def response_format(criteria) -> dict:
+    """OpenAI structured-output `response_format` for the fused verdict."""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "fused_verdict", "strict": True, "schema": fused_schema(criteria)},
+    }
+
+
+def fan_out(verdict, criteria) -> list:
+    """
+    Turn a fused verdict into one {key, score, comment} result per criterion.
+    Scores are clamped to [0, 1]; criteria the judge left out or scored with
+    something other than a number are skipped.
+    """
+    results = []
+    for name in criteria:
+        entry = (verdict or {}).get(name)
+        try:
+            score = min(1.0, max(0.0, float(entry["score"])))
+        except (KeyError, TypeError, ValueError):
+            continue
+        results.append({"key": name, "score": score, "comment": entry.get("reasoning")})
+    return results
+
+
+class SharedVerdicts:
+    """
+    Shares the fused verdict of an example between the per-criterion evaluators
+    that read it, so the judge is called once per example even when they run at
+    the same time. A verdict is dropped once each of its `readers` has read it.
+    """
+
+    def __init__(self, readers, max_entries=1024):
+        self.readers = readers
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> [future, reads left]
+        self._lock = threading.Lock()
+
+    def _claim(self, key, create_future):
+        """Return (future, owner), where the owner is the reader that has to call the judge."""
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = [create_future(), self.readers]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            entry[1] -= 1
+            if entry[1] <= 0:
+                self._entries.pop(key, None)
+            return entry[0], owner
+
+    def get(self, key, judge):
+        """Return the verdict for `key`, calling `judge()` only for its first reader."""
+        future, owner = self._claim(key, Future)
+        if owner:
+            try:
+                future.set_result(judge())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    async def aget(self, key, judge):
+        """Async version of get, where `judge()` returns an awaitable."""
+        future, owner = self._claim(key, asyncio.get_running_loop().create_future)
+        if owner:
+            try:
+                future.set_result(await judge())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                if not future.done():
+                    future.cancel()
+        return await future
@@ -0,0 +1,130 @@
+"""
+This file contains the checkpoint journal that makes harness runs resumable.
+Every finished example is recorded per (endpoint, provider, model) cell, with
+the agent's output, the evaluator scores and the experiment it was sent to.
+A run started with --resume serves the recorded results instead of calling
+Langflow or a judge again, so an interrupted run only redoes unfinished work.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Name of the entry that holds an example's output; scores are stored as `score.<evaluator>`
+OUTPUT = "output"
+
+
+def example_key(inputs) -> str:
+    """Hash the inputs of a dataset example into a key that is stable across runs."""
+    content = json.dumps(dict(inputs), sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class RunJournal:
+    """
+    On-disk journal of finished examples, keyed by (cell, example, entry).
+    The SQLite database is opened on first use and is safe to share between threads.
+    Entries are JSON values; None is never recorded, so a failed call is retried on resume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @staticmethod
+    def _cell(cell) -> str:
+        return json.dumps(list(cell))
+
+    def _connect(self):
+        """Open the database and create the tables on first use."""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    cell TEXT NOT NULL,
+                    example TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (cell, example, name)
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS experiments (
+                    cell TEXT PRIMARY KEY,
+                    experiment TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+        return self._conn
+
+    def get(self, cell, example, name=OUTPUT):
+        """Return the recorded entry of an example, or None when it has not finished."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM entries WHERE cell = ? AND example = ? AND name = ?",
+                (self._cell(cell), example, name),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, cell, example, name, value):
+        """Record an entry of a finished example."""
+        if value is None:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (cell, example, name, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                (self._cell(cell), example, name, json.dumps(value, default=str), time.time()),
+            )
+            conn.commit()
+
+    def finished(self, cell) -> int:
+        """Number of examples of `cell` with a recorded output."""
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM entries WHERE cell = ? AND name = ?", (self._cell(cell), OUTPUT)
+            ).fetchone()[0]
+
+    def experiment(self, cell):
+        """Return the experiment `cell` was last sent to, or None."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT experiment FROM experiments WHERE cell = ?", (self._cell(cell),)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def set_experiment(self, cell, experiment):
+        """Record the experiment `cell` is being sent to."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO experiments (cell, experiment, created_at) VALUES (?, ?, ?)",
+                (self._cell(cell), str(experiment), time.time()),
+            )
+            conn.commit()
+
+    def reset(self):
+        """Forget every recorded example and experiment, for a run that starts from scratch."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM experiments")
+            conn.commit()
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,74 @@
+"""
+This file contains the cache of LLM-as-judge verdicts.
+Verdicts are keyed on (judge model, prompt template hash, rendered inputs), so
+re-running an experiment or re-scoring unchanged outputs makes no judge calls.
+"""
+import functools
+import hashlib
+import json
+from .response_cache import ResponseCache
+
+
+class JudgeCache(ResponseCache):
+    """
+    On-disk cache of judge verdicts with size-based LRU eviction.
+    Verdicts are stored as JSON, so any JSON-serializable result can be cached.
+    """
+
+    @staticmethod
+    def make_judge_key(model, prompt_template, inputs) -> str:
+        """Hash the judge model, the prompt template and the rendered inputs."""
+        content = json.dumps(
+            {
+                "model": model,
+                "template": hashlib.sha256(str(prompt_template).encode("utf-8")).hexdigest(),
+                "inputs": inputs,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def lookup(self, model, prompt_template, inputs):
+        """Return (key, cached verdict or None) for a judge call."""
+        key = self.make_judge_key(model, prompt_template, inputs)
+        cached = self.get(key)
+        return key, (json.loads(cached) if cached is not None else None)
+
+    def store(self, key, verdict):
+        """Store a verdict returned by the judge."""
+        self.put(key, json.dumps(verdict, default=str))
+
+    def verdict(self, model, prompt_template, inputs, judge):
+        """Return the cached verdict for these inputs, or call `judge()` and cache its result."""
+        key, cached = self.lookup(model, prompt_template, inputs)
+        if cached is not None:
+            return cached
+        result = judge()
+        self.store(key, result)
+        return result
+
+    async def averdict(self, model, prompt_template, inputs, judge):
+        """Async version of verdict, where `judge()` returns an awaitable."""
+        key, cached = self.lookup(model, prompt_template, inputs)
+        if cached is not None:
+            return cached
+        result = await judge()
+        self.store(key, result)
+        return result
+
+    def wrap(self, evaluator, model, prompt_template):
+        """
+        Wrap an evaluator called as evaluator(inputs=..., outputs=..., reference_outputs=...)
+        (e.g. an openevals LLM-as-judge) so that its results are cached.
+        """
+        @functools.wraps(evaluator)
+        def cached_evaluator(*, inputs=None, outputs=None, reference_outputs=None, **kwargs):
+            rendered = {"inputs": inputs, "outputs": outputs, "reference_outputs": reference_outputs, **kwargs}
+            return self.verdict(
+                model,
+                prompt_template,
+                rendered,
+                lambda: evaluator(inputs=inputs, outputs=outputs, reference_outputs=reference_outputs, **kwargs),
+            )
+        return cached_evaluator
@@ -0,0 +1,184 @@
+"""
+This file contains the Langflow run API call shared by the harnesses.
+A call counts its prompt tokens in the background, is served from the response
+cache when possible, and otherwise is sent (streamed or not) through the retry
+policy, circuit breaker and provider limiter of its (endpoint, provider) pair.
+Its phase timings go to the latency report and its output to the response cache.
+What each harness records on its tracer is left to its LangflowHooks.
+"""
+import logging
+from contextlib import contextmanager
+import httpx
+from evals_common.phases import PhaseTimer, latency_report
+from evals_common.resilience import CircuitOpenError, LangflowCallError
+from evals_common.response_cache import NOT_LOOKED_UP
+from evals_common.streaming import StreamError
+from evals_common.tokens import extract_usage
+
+# Logger used when the harness does not pass its own
+logger = logging.getLogger(__name__)
+
+
+class LangflowHooks:
+    """
+    What a harness records about each Langflow call on its tracer. `cell` is the
+    (endpoint, provider, model) of the call. The default records nothing.
+    """
+
+    def cached(self, cell, counts):
+        """The output was served from the response cache; `counts` are its token counts."""
+
+    def sent(self, cell, payload):
+        """The request `payload` is about to be sent to Langflow."""
+
+    def streamed(self, cell, timings):
+        """A streamed run ended with these streaming.StreamTimings."""
+
+    def finished(self, cell, timer, counts):
+        """The call returned, with the phases of `timer` and the token `counts` of the run."""
+
+
+@contextmanager
+def langflow_errors(log):
+    """Log a failed Langflow call and raise it again as LangflowCallError."""
+    try:
+        yield
+    except httpx.HTTPError as e:
+        log.error("Error making API request: %s", e)
+        raise LangflowCallError(f"API Error: {e}") from e
+    except CircuitOpenError as e:
+        log.error("Skipped API request: %s", e)
+        raise LangflowCallError(f"API Error: {e}") from e
+    except StreamError as e:
+        log.error("Langflow run failed: %s", e)
+        raise LangflowCallError(f"Langflow run error: {e}") from e
+    except (KeyError, IndexError, AttributeError, ValueError, TypeError) as e:
+        log.error("Error parsing API response: %s", e)
+        raise LangflowCallError(f"Response parsing error: {e}") from e
+    except Exception as e:
+        log.error("Unexpected error: %s", e)
+        raise LangflowCallError(f"Unexpected error: {e}") from e
+
+
+class LangflowRunner:
+    """
+    Sends Langflow run API calls for one harness. `resilience` (a resilience.Resilience),
+    `limiters` (a scheduler.ProviderLimiters) and `tokens` (a tokens.TokenAccountant) are
+    the harness's shared objects; `parse_output` reads the answer out of a run response.
+    The client and response cache are passed with each call, as the sync and async
+    paths use different clients. A failed call raises LangflowCallError.
+    """
+
+    def __init__(self, streamer, resilience, limiters, tokens, parse_output, hooks=None, timeout=300, log=logger):
+        self.streamer = streamer
+        self.resilience = resilience
+        self.limiters = limiters
+        self.tokens = tokens
+        self.parse_output = parse_output
+        self.hooks = hooks or LangflowHooks()
+        self.timeout = timeout
+        self.log = log
+
+    def _finish(self, cell, timer, counts, output, cancelled):
+        """
+        Record a finished call. A streamed run cancelled over its time or token budget
+        raises LangflowCallError, so its partial output is neither scored, cached nor journaled.
+        """
+        latency_report.record_phases(cell, timer.finish())
+        self.hooks.finished(cell, timer, counts)
+        if cancelled:
+            self.log.warning("Cancelled streamed run after %.1fs", timer.phases["total"])
+            raise LangflowCallError(f"Langflow run cancelled after {timer.phases['total']:.1f}s over its stream budget")
+        self.log.debug("Langflow output: %s", output)
+
+    def call(self, client, cache, cell, input_value, payload, key):
+        """
+        Run `payload` on the endpoint of `cell` with the sync `client`, serving
+        and storing the output under `key` in `cache`. Returns the output.
+        """
+        endpoint_name, provider, model_name = cell
+        self.log.debug("Langflow input_value: %s", input_value)
+        # Count the prompt tokens in the background while the request is in flight
+        prompt_tokens = self.tokens.count(provider, model_name, input_value)
+        cached = cache.get(key)
+        if cached is not None:
+            self.hooks.cached(cell, self.tokens.measure(cell, provider, model_name, prompt_tokens, cached))
+            self.log.debug("Langflow cached output: %s", cached)
+            return cached
+
+        self.hooks.sent(cell, payload)
+        url = f"/api/v1/run/{endpoint_name}"
+        timer = PhaseTimer()
+
+        def send():
+            if self.streamer.enabled:
+                # Stream the run to time the first token and cancel runaway runs
+                output, timings = self.streamer.run(
+                    client, url, payload, self.timeout, self.parse_output, extensions=timer.extensions()
+                )
+                self.hooks.streamed(cell, timings)
+                return output, extract_usage(timings.response), timings.cancelled
+            # Send API request over the shared keep-alive connection pool
+            result = client.post(url, json=payload, timeout=self.timeout, extensions=timer.extensions())
+            result.raise_for_status()
+            with timer.phase("parse"):
+                response_json = result.json()
+                return self.parse_output(response_json), extract_usage(response_json), False
+
+        with langflow_errors(self.log):
+            # Retry transient failures, failing fast while Langflow or the provider is down
+            output, usage, cancelled = self.resilience.call(
+                send,
+                self.resilience.circuit_breaker(endpoint_name, provider),
+                self.limiters.get(provider),
+                on_backoff=timer.backoff,
+            )
+            counts = self.tokens.measure(cell, provider, model_name, prompt_tokens, output, usage)
+        self._finish(cell, timer, counts, output, cancelled)
+        cache.put(key, output)
+        return output
+
+    async def acall(self, client, cache, cell, input_value, payload, key, cached=NOT_LOOKED_UP):
+        """
+        Async version of call() with an async `client`. `cached` is the response the
+        caller already looked up in `cache` (None on a miss); by default it is looked
+        up here, off the event loop.
+        """
+        endpoint_name, provider, model_name = cell
+        self.log.debug("Langflow input_value: %s", input_value)
+        prompt_tokens = self.tokens.count(provider, model_name, input_value)
+        if cached is NOT_LOOKED_UP:
+            cached = await cache.aget(key)
+        if cached is not None:
+            self.hooks.cached(cell, await self.tokens.ameasure(cell, provider, model_name, prompt_tokens, cached))
+            self.log.debug("Langflow cached output: %s", cached)
+            return cached
+
+        self.hooks.sent(cell, payload)
+        url = f"/api/v1/run/{endpoint_name}"
+        timer = PhaseTimer()
+
+        async def send():
+            if self.streamer.enabled:
+                output, timings = await self.streamer.arun(
+                    client, url, payload, self.timeout, self.parse_output, extensions=timer.aextensions()
+                )
+                self.hooks.streamed(cell, timings)
+                return output, extract_usage(timings.response), timings.cancelled
+            result = await client.post(url, json=payload, timeout=self.timeout, extensions=timer.aextensions())
+            result.raise_for_status()
+            with timer.phase("parse"):
+                response_json = result.json()
+                return self.parse_output(response_json), extract_usage(response_json), False
+
+        with langflow_errors(self.log):
+            output, usage, cancelled = await self.resilience.acall(
+                send,
+                self.resilience.circuit_breaker(endpoint_name, provider),
+                self.limiters.get(provider),
+                on_backoff=timer.backoff,
+            )
+            counts = await self.tokens.ameasure(cell, provider, model_name, prompt_tokens, output, usage)
+        self._finish(cell, timer, counts, output, cancelled)
+        await cache.aput(key, output)
+        return output
@@ -0,0 +1,111 @@
+"""
+This file contains the reference metrics that are computed locally, without a
+judge: exact match, token F1, ROUGE-L, TF-IDF cosine similarity and the length
+ratio of each output to its reference answer. They are computed with NumPy for
+a whole experiment at once, one chunk of examples at a time, so they add no
+judge calls and next to no time to a run.
+"""
+import math
+import re
+from collections import Counter
+import numpy as np
+
+# Metrics returned by compute_metrics, each scored per example
+METRICS = ("exact_match", "token_f1", "rouge_l", "tfidf_cosine", "length_ratio")
+# Examples scored per NumPy batch, which bounds the size of the count matrices
+METRICS_CHUNK_SIZE = 256
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text) -> list:
+    """Lowercase a text and split it into word tokens, dropping punctuation."""
+    return TOKEN_PATTERN.findall(str(text or "").lower())
+
+
+def _counts(token_lists, vocabulary) -> np.ndarray:
+    """Token count matrix with one row per text and one column per vocabulary token."""
+    lengths = [len(tokens) for tokens in token_lists]
+    counts = np.zeros((len(token_lists), len(vocabulary)))
+    rows = np.repeat(np.arange(len(token_lists)), lengths)
+    columns = np.fromiter((vocabulary[token] for tokens in token_lists for token in tokens), int, sum(lengths))
+    np.add.at(counts, (rows, columns), 1)
+    return counts
+
+
+def _padded_ids(token_lists, vocabulary, pad) -> np.ndarray:
+    """Token id matrix with one row per text, padded with `pad` to the longest text."""
+    lengths = np.array([len(tokens) for tokens in token_lists])
+    ids = np.full((len(token_lists), int(lengths.max(initial=0))), pad)
+    mask = np.arange(ids.shape[1]) < lengths[:, None]
+    ids[mask] = [vocabulary[token] for tokens in token_lists for token in tokens]
+    return ids
+
+
+def _lcs(outputs, references, vocabulary) -> np.ndarray:
+    """
+    Longest common subsequence length of every (output, reference) pair.
+    The dynamic programming table is filled one output token at a time for all
+    pairs at once: a row is the running maximum of the previous row and of the
+    previous row shifted by one plus the token matches.
+    """
+    output_ids = _padded_ids(outputs, vocabulary, -1)
+    reference_ids = _padded_ids(references, vocabulary, -2)
+    table = np.zeros((len(outputs), reference_ids.shape[1] + 1), dtype=np.int32)
+    for i in range(output_ids.shape[1]):
+        matches = output_ids[:, i:i + 1] == reference_ids
+        row = np.maximum(table[:, 1:], table[:, :-1] + matches)
+        table[:, 1:] = np.maximum.accumulate(row, axis=1)
+    return table[:, -1]
+
+
+def _f1(overlap, predicted, reference) -> np.ndarray:
+    """Harmonic mean of overlap/predicted and overlap/reference, 0 where either is empty."""
+    total = predicted + reference
+    return np.divide(2 * overlap, total, out=np.zeros(len(total)), where=total > 0)
+
+
+def _cosine(a, b) -> np.ndarray:
+    """Row-wise cosine similarity, 0 where either row is all zeros."""
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return np.divide((a * b).sum(axis=1), norms, out=np.zeros(len(norms)), where=norms > 0)
+
+
+def compute_metrics(outputs, references, chunk_size=METRICS_CHUNK_SIZE) -> dict:
+    """
+    Score every output against its reference answer and return one array of
+    scores per metric in METRICS. Exact match ignores case and punctuation, and
+    the TF-IDF weights come from the outputs and references of the whole batch.
+    """
+    outputs = [tokenize(output) for output in outputs]
+    references = [tokenize(reference) for reference in references]
+    document_frequency = Counter()
+    for tokens in outputs + references:
+        document_frequency.update(set(tokens))
+    documents = 2 * len(outputs)
+
+    scores = {name: np.zeros(len(outputs)) for name in METRICS}
+    for start in range(0, len(outputs), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        chunk_outputs, chunk_references = outputs[chunk], references[chunk]
+        tokens = sorted({token for text in chunk_outputs + chunk_references for token in text})
+        vocabulary = {token: i for i, token in enumerate(tokens)}
+        idf = np.array([math.log((1 + documents) / (1 + document_frequency[token])) + 1 for token in tokens])
+        output_counts = _counts(chunk_outputs, vocabulary)
+        reference_counts = _counts(chunk_references, vocabulary)
+        output_lengths = output_counts.sum(axis=1)
+        reference_lengths = reference_counts.sum(axis=1)
+
+        scores["exact_match"][chunk] = [
+            output == reference for output, reference in zip(chunk_outputs, chunk_references)
+        ]
+        scores["token_f1"][chunk] = _f1(
+            np.minimum(output_counts, reference_counts).sum(axis=1), output_lengths, reference_lengths
+        )
+        scores["rouge_l"][chunk] = _f1(
+            _lcs(chunk_outputs, chunk_references, vocabulary), output_lengths, reference_lengths
+        )
+        scores["tfidf_cosine"][chunk] = _cosine(output_counts * idf, reference_counts * idf)
+        scores["length_ratio"][chunk] = np.divide(
+            output_lengths, reference_lengths, out=np.zeros(len(output_lengths)), where=reference_lengths > 0
+        )
+    return scores
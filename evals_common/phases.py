@@ -0,0 +1,152 @@
+"""
+This file contains the per-phase latency instrumentation of a harness run.
+Each Langflow call is split into phases (connect, send, server, receive, parse)
+using httpx's `trace` request extension, evaluator and trace export times are
+added by the harness, and every timing is collected per (endpoint, provider, model)
+so a p50/p90/p99 table can be printed at the end of a run.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from rich.console import Console
+from rich.table import Table
+
+# httpcore trace operations and the phase they count towards
+TRACE_PHASES = {
+    "connect_tcp": "connect",  # includes DNS resolution
+    "connect_unix": "connect",
+    "start_tls": "connect",
+    "send_connection_init": "send",
+    "send_request_headers": "send",
+    "send_request_body": "send",
+    "receive_response_headers": "server",  # time to first byte, i.e. the agent run
+    "receive_response_body": "receive",
+}
+# Order in which phases are reported
+PHASE_ORDER = ["connect", "send", "server", "receive", "parse", "backoff", "total"]
+
+
+class PhaseTimer:
+    """
+    Collects the phase timings of one Langflow call.
+    Pass `extensions()` (or `aextensions()` for an async client) with the request
+    so httpx reports connection and transfer events, and time other phases with `phase()`.
+    Waits between retry attempts are added as the `backoff` phase with `backoff()`
+    and left out of the total, so the total is the time spent on the attempts themselves.
+    """
+
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self._start = time.perf_counter()
+        self._started = {}
+
+    def add(self, name, seconds):
+        """Add time spent in a phase."""
+        self.phases[name] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as (part of) a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def trace(self, event_name, info):
+        """httpcore trace hook: turn `<prefix>.<operation>.started|complete` events into phases."""
+        operation, _, status = event_name.partition(".")[2].rpartition(".")
+        phase = TRACE_PHASES.get(operation)
+        if phase is None:
+            return
+        now = time.perf_counter()
+        if status == "started":
+            self._started[operation] = now
+        elif operation in self._started:
+            self.add(phase, now - self._started.pop(operation))
+
+    def backoff(self, seconds):
+        """Record a wait between retry attempts."""
+        self.add("backoff", seconds)
+
+    async def atrace(self, event_name, info):
+        """Async version of the trace hook, required by async httpx clients."""
+        self.trace(event_name, info)
+
+    def extensions(self):
+        """Request extensions for a sync httpx client."""
+        return {"trace": self.trace}
+
+    def aextensions(self):
+        """Request extensions for an async httpx client."""
+        return {"trace": self.atrace}
+
+    def finish(self):
+        """Record the total time of the call, without its retry backoff."""
+        self.phases["total"] = time.perf_counter() - self._start - self.phases.get("backoff", 0.0)
+        return self.phases
+
+    def metadata(self) -> dict:
+        """Phase timings as flat `phase.<name>_s` metadata."""
+        return {f"phase.{name}_s": round(seconds, 4) for name, seconds in self.phases.items()}
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of `values` (q in 0-100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class LatencyReport:
+    """Thread-safe collection of phase timings per (endpoint, provider, model) cell."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = defaultdict(lambda: defaultdict(list))
+
+    def record(self, cell, phase, seconds):
+        """Record one timing of `phase` for `cell`."""
+        with self._lock:
+            self._timings[tuple(cell)][phase].append(seconds)
+
+    def record_phases(self, cell, phases):
+        """Record every phase of one call."""
+        for phase, seconds in phases.items():
+            self.record(cell, phase, seconds)
+
+    def rows(self):
+        """Return (cell, phase, count, p50, p90, p99) rows in report order."""
+        def phase_key(phase):
+            return (PHASE_ORDER.index(phase), phase) if phase in PHASE_ORDER else (len(PHASE_ORDER), phase)
+
+        with self._lock:
+            timings = {cell: dict(phases) for cell, phases in self._timings.items()}
+        rows = []
+        for cell in sorted(timings):
+            for phase in sorted(timings[cell], key=phase_key):
+                values = timings[cell][phase]
+                rows.append((cell, phase, len(values), *(percentile(values, q) for q in (50, 90, 99))))
+        return rows
+
+    def print_table(self, console=None):
+        """Print the p50/p90/p99 table of every phase per (endpoint, provider, model)."""
+        rows = self.rows()
+        if not rows:
+            return
+        table = Table(title="Latency by phase (seconds)")
+        for column in ("Endpoint", "Provider", "Model", "Phase"):
+            table.add_column(column)
+        for column in ("N", "p50", "p90", "p99"):
+            table.add_column(column, justify="right")
+        for (endpoint, provider, model), phase, count, p50, p90, p99 in rows:
+            table.add_row(endpoint, provider, model, phase, str(count), f"{p50:.3f}", f"{p90:.3f}", f"{p99:.3f}")
+        (console or Console()).print(table)
+
+
+# Timings of the current run, shared by every call in the harness
+latency_report = LatencyReport()
@@ -0,0 +1,251 @@
+"""
+This file contains the resilience layer shared by the Langflow and judge calls.
+Transient failures (connection errors, timeouts, 408/425/429 and 5xx responses)
+are retried with jittered exponential backoff, honouring `Retry-After`. Every
+(endpoint, provider) pair has a circuit breaker: after a run of consecutive
+failures its calls fail fast until a single probe call succeeds again. Call
+outcomes are reported to the provider's adaptive concurrency limiter.
+"""
+import asyncio
+import functools
+import logging
+import random
+import threading
+import time
+import httpx
+
+# Logger used when the harness does not pass its own
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# Connection errors of SDKs that do not raise httpx errors (e.g. openai.APIConnectionError)
+CONNECTION_ERRORS = {"APIConnectionError", "APITimeoutError"}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a call while its circuit breaker is open."""
+
+
+class LangflowCallError(Exception):
+    """
+    Raised when a Langflow call failed after its retries, so the eval framework
+    records the run as failed rather than scoring an empty output, and the
+    checkpoint journal does not keep it, so --resume retries it.
+    """
+
+
+def status_code(exc):
+    """Return the HTTP status of a failed call, or None when it had no response."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc) -> bool:
+    """Whether a failed call is worth retrying."""
+    if isinstance(exc, httpx.TransportError):
+        return True
+    status = status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return type(exc).__name__ in CONNECTION_ERRORS
+
+
+def retry_after(exc):
+    """Seconds the server asked us to wait before retrying, or None."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, capped at `max_delay` seconds per wait."""
+
+    def __init__(self, attempts=4, base_delay=0.5, max_delay=30.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, exc=None) -> float:
+        """Seconds to wait after failed attempt number `attempt` (0-based)."""
+        wait = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hinted = retry_after(exc)
+        if hinted is not None:
+            wait = min(self.max_delay, max(wait, hinted))
+        return wait
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after `failure_threshold` consecutive failures. Once
+    `reset_seconds` have passed a single probe call is let through: its success
+    closes the breaker again, its failure re-opens it. State changes are logged to `log`.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_seconds=30.0, log=logger):
+        self.name = name
+        self.log = log
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may be made now."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half-open"
+                self._probing = False
+            if self.state == "half-open" and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpenError(f"Circuit breaker for {self.name} is open")
+
+    def record_success(self):
+        """Report a successful call."""
+        with self._lock:
+            if self.state != "closed":
+                self.log.info("Circuit breaker for %s closed", self.name)
+            self.state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """Report a failed call."""
+        with self._lock:
+            self._failures += 1
+            if self.state == "half-open" or (self.state == "closed" and self._failures >= self.failure_threshold):
+                self.log.warning(
+                    "Circuit breaker for %s opened after %d failure(s), failing fast for %.0fs",
+                    self.name,
+                    self._failures,
+                    self.reset_seconds,
+                )
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+def _report(exc, breaker, limiter, seconds):
+    """Report a call outcome; returns whether the failure (if any) should be retried."""
+    retryable = exc is not None and is_retryable(exc)
+    if retryable:
+        breaker.record_failure()
+    else:
+        # The endpoint answered, even if the call itself failed (e.g. a 400)
+        breaker.record_success()
+    if limiter is not None and (exc is None or retryable):
+        limiter.record_result(seconds, ok=exc is None)
+    return retryable
+
+
+def call_with_retries(fn, breaker, limiter=None, policy=None, log=logger, on_backoff=None):
+    """
+    Call `fn()` through `breaker`, retrying transient failures, and report each
+    attempt to `limiter` (a scheduler.ProviderLimiter). `on_backoff(seconds)` is
+    called with each wait between attempts. The last error is re-raised.
+    """
+    policy = policy or RetryPolicy()
+    attempt = 0
+    while True:
+        breaker.before_call()
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            retryable = _report(e, breaker, limiter, time.perf_counter() - start)
+            if not retryable or attempt + 1 >= policy.attempts:
+                raise
+            wait = policy.delay(attempt, e)
+            log.warning("%s call failed (%s), retrying in %.1fs", breaker.name, e, wait)
+            if on_backoff is not None:
+                on_backoff(wait)
+            time.sleep(wait)
+            attempt += 1
+        else:
+            _report(None, breaker, limiter, time.perf_counter() - start)
+            return result
+
+
+async def acall_with_retries(fn, breaker, limiter=None, policy=None, log=logger, on_backoff=None):
+    """
+    Async version of call_with_retries(): `fn()` returns an awaitable,
+    and the waits between attempts do not block the event loop.
+    """
+    policy = policy or RetryPolicy()
+    attempt = 0
+    while True:
+        breaker.before_call()
+        start = time.perf_counter()
+        try:
+            result = await fn()
+        except Exception as e:
+            retryable = _report(e, breaker, limiter, time.perf_counter() - start)
+            if not retryable or attempt + 1 >= policy.attempts:
+                raise
+            wait = policy.delay(attempt, e)
+            log.warning("%s call failed (%s), retrying in %.1fs", breaker.name, e, wait)
+            if on_backoff is not None:
+                on_backoff(wait)
+            await asyncio.sleep(wait)
+            attempt += 1
+        else:
+            _report(None, breaker, limiter, time.perf_counter() - start)
+            return result
+
+
+class Resilience:
+    """
+    The retry policy and circuit breakers of a harness. Every key such as
+    (endpoint, provider) gets one shared breaker, created on first use with
+    `failure_threshold` and `reset_seconds`; retries and breakers log to `log`.
+    """
+
+    def __init__(self, policy=None, failure_threshold=5, reset_seconds=30.0, log=logger):
+        self.policy = policy or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.log = log
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def circuit_breaker(self, *key) -> CircuitBreaker:
+        """Return the shared circuit breaker for a key such as (endpoint, provider)."""
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(
+                    " - ".join(str(part) for part in key),
+                    self.failure_threshold,
+                    self.reset_seconds,
+                    self.log,
+                )
+            return self._breakers[key]
+
+    def call(self, fn, breaker, limiter=None, on_backoff=None):
+        """call_with_retries() with this harness's policy and logger."""
+        return call_with_retries(fn, breaker, limiter, self.policy, self.log, on_backoff)
+
+    async def acall(self, fn, breaker, limiter=None, on_backoff=None):
+        """acall_with_retries() with this harness's policy and logger."""
+        return await acall_with_retries(fn, breaker, limiter, self.policy, self.log, on_backoff)
+
+    def wrap(self, fn, *key):
+        """
+        Wrap a sync function (e.g. a judge) so that every call goes through
+        call() with the circuit breaker of `key`.
+        """
+        breaker = self.circuit_breaker(*key)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self.call(lambda: fn(*args, **kwargs), breaker)
+        return wrapper
@@ -0,0 +1,143 @@
+"""
+This file contains a persistent, content-addressed cache of Langflow flow responses.
+Responses are keyed by a hash of everything that determines the agent's answer
+(endpoint, agent tweaks, provider, model and input text), so re-running an
+experiment or changing an evaluator does not run the agent again.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# read  - serve cached responses and store new ones
+# write - always call Langflow and refresh the stored responses
+# off   - bypass the cache entirely
+CACHE_MODES = ("read", "write", "off")
+# Passed instead of a looked-up response when the cache has not been looked up yet
+NOT_LOOKED_UP = object()
+
+
+class ResponseCache:
+    """
+    On-disk cache of Langflow responses with a TTL and size-based LRU eviction.
+    The SQLite database is opened on first use and is safe to share between threads.
+    Any string value can be stored, so the same store also backs the judge cache.
+    """
+
+    def __init__(self, path, mode="off", ttl=None, max_bytes=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @staticmethod
+    def make_key(endpoint_name, tweaks, provider, model_name, input_value) -> str:
+        """Hash the parts of a Langflow request that determine its response."""
+        content = json.dumps(
+            {
+                "endpoint": endpoint_name,
+                "tweaks": tweaks,
+                "provider": provider,
+                "model": model_name,
+                "input": input_value,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        """Open the database and create the table on first use."""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        return self._conn
+
+    def get(self, key):
+        """Return the cached response for `key`, or None on a miss (or when not in read mode)."""
+        if self.mode != "read":
+            return None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            now = time.time()
+            if self.ttl is not None and now - created_at > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return value
+
+    async def aget(self, key):
+        """Async version of get, which runs the SQLite lookup off the event loop."""
+        if self.mode != "read":
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key, value):
+        """Async version of put, which runs the SQLite write off the event loop."""
+        if self.mode == "off" or value is None:
+            return
+        await asyncio.to_thread(self.put, key, value)
+
+    def put(self, key, value):
+        """Store a response, then evict expired and least recently used entries."""
+        if self.mode == "off" or value is None:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now):
+        """Drop expired entries, then the least recently used ones until the cache fits in max_bytes."""
+        if self.ttl is not None:
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        if self.max_bytes is None:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evict_keys = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            evict_keys.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", evict_keys)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,230 @@
+"""
+This file contains the scheduler that runs the (endpoint x model) matrix
+concurrently while enforcing separate limits for each provider.
+Each provider's concurrency adapts to how it is coping (AIMD): it grows by
+about one slot per round of healthy calls, and is halved when calls fail,
+get throttled or slow down sharply.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# Logger used when the harness does not pass its own
+logger = logging.getLogger(__name__)
+
+# Length of the sliding window used for the per-minute limits, in seconds
+RATE_WINDOW = 60.0
+# How long to wait before re-checking a limiter that is at its concurrency cap
+POLL_INTERVAL = 0.05
+# Factor the concurrency limit is multiplied by on failure, throttling or a latency spike
+DECREASE_FACTOR = 0.5
+# A call slower than this multiple of the usual latency counts as a latency spike
+LATENCY_BACKOFF = 3.0
+# Smoothing of the recent (fast) and usual (slow) latency averages
+FAST_ALPHA = 0.3
+SLOW_ALPHA = 0.05
+
+
+def estimate_tokens(text) -> int:
+    """Roughly estimate the number of tokens in a piece of text (~4 characters per token)."""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+class ProviderLimiter:
+    """
+    Concurrency, requests-per-minute and tokens-per-minute limits for one provider.
+    The limiter is thread-safe and can be used from sync code (`slot`) as well as
+    from any event loop (`aslot`), so every harness can share one per provider.
+    The concurrency limit starts at `concurrency` and moves between `min_concurrency`
+    and `max_concurrency` (default: `concurrency`) as results are reported with `record_result`.
+    Concurrency changes are logged to `log`.
+    """
+
+    def __init__(
+        self,
+        provider,
+        concurrency,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        min_concurrency=1,
+        max_concurrency=None,
+        log=logger,
+    ):
+        self.provider = provider
+        self.log = log
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_concurrency = min(min_concurrency, concurrency)
+        self.max_concurrency = max(max_concurrency or concurrency, concurrency)
+        self.limit = float(concurrency)  # current, adaptive concurrency limit
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._fast_latency = None
+        self._slow_latency = None
+        self._last_decrease = 0.0
+        self._requests = deque()  # timestamps of requests in the current window
+        self._tokens = deque()  # (timestamp, tokens) spent in the current window
+
+    def ensure_concurrency(self, concurrency):
+        """Raise the limits so at least `concurrency` calls can always run at once."""
+        with self._lock:
+            self.concurrency = max(self.concurrency, concurrency)
+            self.min_concurrency = max(self.min_concurrency, concurrency)
+            self.max_concurrency = max(self.max_concurrency, concurrency)
+            self.limit = max(self.limit, float(concurrency))
+
+    def _expire(self, now):
+        """Drop requests and tokens that have left the sliding window."""
+        while self._requests and now - self._requests[0] >= RATE_WINDOW:
+            self._requests.popleft()
+        while self._tokens and now - self._tokens[0][0] >= RATE_WINDOW:
+            self._tokens.popleft()
+
+    def _try_acquire(self, tokens) -> float:
+        """Reserve a slot if every limit allows it. Returns 0 on success, otherwise seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if self._in_flight >= int(self.limit):
+                return POLL_INTERVAL
+            if self.requests_per_minute and len(self._requests) >= self.requests_per_minute:
+                return max(POLL_INTERVAL, self._requests[0] + RATE_WINDOW - now)
+            if self.tokens_per_minute and self._tokens:
+                used = sum(spent for _, spent in self._tokens)
+                if used + tokens > self.tokens_per_minute:
+                    return max(POLL_INTERVAL, self._tokens[0][0] + RATE_WINDOW - now)
+            self._in_flight += 1
+            self._requests.append(now)
+            if tokens:
+                self._tokens.append((now, tokens))
+            return 0.0
+
+    def acquire(self, tokens=0):
+        """Block until a request spending `tokens` tokens is allowed."""
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self, tokens=0):
+        """Wait, without blocking the event loop, until a request spending `tokens` tokens is allowed."""
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self):
+        """Release a slot taken with acquire/aacquire."""
+        with self._lock:
+            self._in_flight -= 1
+
+    def record_tokens(self, tokens):
+        """Count tokens that were only known after the request (e.g. the completion)."""
+        if tokens:
+            with self._lock:
+                self._tokens.append((time.monotonic(), tokens))
+
+    def record_result(self, seconds, ok=True):
+        """
+        Report how a call went. A success grows the limit by 1/limit (about one slot
+        per round of calls); a failure or a call much slower than usual halves it,
+        at most once per recent call duration so one burst of errors counts once.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if ok:
+                if self._fast_latency is None:
+                    self._fast_latency = self._slow_latency = seconds
+                else:
+                    self._fast_latency += FAST_ALPHA * (seconds - self._fast_latency)
+                    self._slow_latency += SLOW_ALPHA * (seconds - self._slow_latency)
+                if self._fast_latency <= LATENCY_BACKOFF * self._slow_latency:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                    return
+            if now - self._last_decrease < max(1.0, self._fast_latency or 0.0):
+                return
+            self._last_decrease = now
+            previous = int(self.limit)
+            self.limit = max(self.min_concurrency, self.limit * DECREASE_FACTOR)
+            if int(self.limit) != previous:
+                self.log.warning(
+                    "%s is %s, lowering its concurrency to %d",
+                    self.provider,
+                    "slowing down" if ok else "failing",
+                    int(self.limit),
+                )
+
+    @contextmanager
+    def slot(self, tokens=0):
+        """Hold one slot for the duration of a sync Langflow call."""
+        self.acquire(tokens)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, tokens=0):
+        """Hold one slot for the duration of an async Langflow call."""
+        await self.aacquire(tokens)
+        try:
+            yield self
+        finally:
+            self.release()
+
+
+class ProviderLimiters:
+    """
+    The shared limiter of every provider of a harness. `limits` maps a provider to the
+    ProviderLimiter arguments it overrides; the others come from `defaults`.
+    """
+
+    def __init__(self, limits=None, defaults=None, log=logger):
+        self.limits = limits or {}
+        self.defaults = defaults or {"concurrency": 4}
+        self.log = log
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider) -> ProviderLimiter:
+        """Return the limiter of a provider, creating it on first use."""
+        with self._lock:
+            if provider not in self._limiters:
+                limits = {**self.defaults, **self.limits.get(provider, {})}
+                self._limiters[provider] = ProviderLimiter(provider, log=self.log, **limits)
+            return self._limiters[provider]
+
+
+def describe_cell(cell) -> str:
+    """Human readable name for a matrix cell."""
+    return " - ".join(str(part) for part in cell)
+
+
+async def run_matrix(cells, run_cell, log=logger):
+    """
+    Run `run_cell(cell)` for every cell of the matrix at once on the current event loop.
+    A failing cell is logged to `log` and does not stop the others. Returns the results in cell order,
+    with None for cells that failed.
+    """
+    async def timed(cell):
+        start = time.perf_counter()
+        try:
+            result = await run_cell(cell)
+        except Exception as e:
+            log.error("Matrix cell %s failed: %s", describe_cell(cell), e)
+            return None
+        log.info("Matrix cell %s finished in %.1fs", describe_cell(cell), time.perf_counter() - start)
+        return result
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed(cell) for cell in cells))
+    log.info("Ran %d matrix cell(s) in %.1fs", len(cells), time.perf_counter() - start)
+    return results
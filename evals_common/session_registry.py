@@ -0,0 +1,152 @@
+"""
+This file contains the local registry of the Langflow sessions a harness run creates.
+Every session id sent to Langflow is recorded with the id of the run (and the
+experiment, when known) that created it, so the sessions of one run can be
+deleted directly, at the end of the run or later with
+`utils/delete_sessions.py --run <id>`, without scanning the flow's message history.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+
+# Sessions buffered in memory before they are written to the registry
+FLUSH_EVERY = 50
+
+
+def new_run_id() -> str:
+    """Return a sortable, unique id for a harness run."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+class SessionRegistry:
+    """
+    On-disk registry of the sessions created by harness runs, keyed by run id.
+    Sessions are buffered and written in batches; the SQLite database is opened
+    on first use and is safe to share between threads.
+    """
+
+    def __init__(self, path, run_id=None, flush_every=FLUSH_EVERY):
+        self.path = path
+        self.run_id = run_id or new_run_id()
+        self.flush_every = flush_every
+        self._pending = []
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        """Open the database and create the table on first use."""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    run_id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    experiment TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (run_id, session_id)
+                )
+                """
+            )
+        return self._conn
+
+    def add(self, endpoint_name, session_id, experiment=None):
+        """Register a session created by this run."""
+        with self._lock:
+            self._pending.append((self.run_id, session_id, endpoint_name, experiment, time.time()))
+            if len(self._pending) >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        if self._pending:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR IGNORE INTO sessions (run_id, session_id, endpoint, experiment, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                self._pending,
+            )
+            conn.commit()
+            self._pending = []
+
+    def flush(self):
+        """Write the buffered sessions to the registry."""
+        with self._lock:
+            self._flush()
+
+    def sessions(self, run_id=None) -> list:
+        """Return the registered session ids of a run (this run by default)."""
+        with self._lock:
+            self._flush()
+            rows = self._connect().execute(
+                "SELECT session_id FROM sessions WHERE run_id = ? ORDER BY created_at", (run_id or self.run_id,)
+            ).fetchall()
+        return [session_id for (session_id,) in rows]
+
+    def latest_run(self):
+        """Return the id of the run that registered the most recent session, or None."""
+        with self._lock:
+            self._flush()
+            row = self._connect().execute("SELECT run_id FROM sessions ORDER BY created_at DESC LIMIT 1").fetchone()
+        return None if row is None else row[0]
+
+    def forget(self, session_ids, run_id=None):
+        """Remove deleted sessions from the registry."""
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "DELETE FROM sessions WHERE run_id = ? AND session_id = ?",
+                [(run_id or self.run_id, session_id) for session_id in session_ids],
+            )
+            conn.commit()
+
+    def close(self):
+        """Write the buffered sessions and close the database connection."""
+        with self._lock:
+            if self._pending:
+                self._flush()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def delete_session(client: httpx.Client, session_id) -> bool:
+    """Delete the stored messages of one Langflow session."""
+    try:
+        response = client.delete(f"/api/v1/monitor/messages/session/{session_id}", timeout=30)
+    except httpx.HTTPError:
+        return False
+    # A 204 No Content status is a success for DELETE operations.
+    return response.status_code in (200, 204)
+
+
+async def adelete_session(client: httpx.AsyncClient, session_id) -> bool:
+    """Async version of `delete_session`."""
+    try:
+        response = await client.delete(f"/api/v1/monitor/messages/session/{session_id}", timeout=30)
+    except httpx.HTTPError:
+        return False
+    return response.status_code in (200, 204)
+
+
+def delete_run_sessions(client: httpx.Client, registry: SessionRegistry, run_id=None, concurrency=8):
+    """
+    Delete every registered session of a run (this run by default) over the pooled
+    Langflow client and drop the deleted ones from the registry.
+    Returns the (deleted, failed) counts.
+    """
+    session_ids = registry.sessions(run_id)
+    if not session_ids:
+        return 0, 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = list(pool.map(lambda session_id: delete_session(client, session_id), session_ids))
+    deleted = [session_id for session_id, ok in zip(session_ids, results) if ok]
+    registry.forget(deleted, run_id)
+    return len(deleted), len(session_ids) - len(deleted)
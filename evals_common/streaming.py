@@ -0,0 +1,189 @@
+"""
+This file contains the streaming client for Langflow's run API.
+With `?stream=true` Langflow sends the run as newline-delimited JSON events
+(`add_message`, `token`, `end`, `error`), so the answer can be read as it is
+generated. The streamer times the first token, the gaps between tokens and the
+whole run, and stops reading (closing the connection) when a run goes past its
+time or token budget, so runaway agent loops are cancelled early.
+"""
+import asyncio
+import json
+import time
+import httpx
+
+
+class StreamError(Exception):
+    """Raised when Langflow reports an error event in the stream."""
+
+
+class StreamTimings:
+    """Time-to-first-token, inter-token latency and total time of one streamed run."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.token_times = []
+        self.end = None
+        self.cancelled = False
+        self.response = None  # final run response from the `end` event
+
+    def token(self):
+        """Record the arrival of a token event."""
+        self.token_times.append(time.perf_counter())
+
+    def finish(self):
+        """Record the end of the run."""
+        self.end = time.perf_counter()
+
+    def elapsed(self):
+        """Seconds since the request was sent."""
+        return time.perf_counter() - self.start
+
+    def metrics(self) -> dict:
+        """Return the timings in seconds (None when no token was streamed)."""
+        end = self.end if self.end is not None else time.perf_counter()
+        gaps = [later - earlier for earlier, later in zip(self.token_times, self.token_times[1:])]
+        return {
+            "ttft_s": self.token_times[0] - self.start if self.token_times else None,
+            "inter_token_latency_s": sum(gaps) / len(gaps) if gaps else None,
+            "max_inter_token_latency_s": max(gaps) if gaps else None,
+            "total_s": end - self.start,
+            "token_events": len(self.token_times),
+            "cancelled": self.cancelled,
+        }
+
+
+def parse_stream_event(line):
+    """Parse one line of the Langflow event stream, returning None for blank or malformed lines."""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) else None
+
+
+class LangflowStreamer:
+    """
+    Runs Langflow flows through the streaming run API.
+    `max_seconds` and `max_tokens` bound a run (None = unbounded): once either is
+    exceeded the stream is closed and the partial answer is returned, marked as cancelled.
+    """
+
+    def __init__(self, enabled=False, max_seconds=None, max_tokens=None):
+        self.enabled = enabled
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+
+    def _over_budget(self, timings):
+        if self.max_seconds is not None and timings.elapsed() > self.max_seconds:
+            return True
+        return self.max_tokens is not None and len(timings.token_times) >= self.max_tokens
+
+    def _remaining(self, timings):
+        """Seconds left of the time budget, None when it is unbounded."""
+        if self.max_seconds is None:
+            return None
+        return max(0.0, self.max_seconds - timings.elapsed())
+
+    def _handle(self, event, chunks, timings):
+        """Apply one event; return the final run response on `end`, else None."""
+        kind = event.get("event")
+        data = event.get("data") or {}
+        if kind == "token":
+            timings.token()
+            chunks.append(data.get("chunk") or "")
+        elif kind == "error":
+            raise StreamError(data.get("error") or data.get("text") or str(data))
+        elif kind == "end":
+            return data.get("result") or {}
+        return None
+
+    def _result(self, result, chunks, timings, parse_output):
+        """Build (output, timings) from the final run response, falling back to the streamed tokens."""
+        timings.finish()
+        timings.response = result
+        output = None
+        if result:
+            try:
+                output = parse_output(result)
+            except (KeyError, IndexError, AttributeError, TypeError):
+                output = None
+        if output is None:
+            output = "".join(chunks)
+        return output, timings
+
+    def _read(self, lines, chunks, timings):
+        """Read events until the `end` event or the budget; return the final run response or None."""
+        for line in lines:
+            event = parse_stream_event(line)
+            if event is not None:
+                result = self._handle(event, chunks, timings)
+                if result is not None:
+                    return result
+            if self._over_budget(timings):
+                timings.cancelled = True
+                return None
+        return None
+
+    async def _aread(self, lines, chunks, timings):
+        """Async version of `_read`."""
+        async for line in lines:
+            event = parse_stream_event(line)
+            if event is not None:
+                result = self._handle(event, chunks, timings)
+                if result is not None:
+                    return result
+            if self._over_budget(timings):
+                timings.cancelled = True
+                return None
+        return None
+
+    def run(self, client, url, payload, timeout, parse_output, extensions=None):
+        """
+        Stream a run with a sync httpx client and return (output, timings).
+        A sync read cannot be interrupted, so the read timeout is lowered to the
+        time budget: a stream that goes silent is cut off once a read waits that long.
+        """
+        timings = StreamTimings()
+        chunks = []
+        result = None
+        read_timeout = timeout if self.max_seconds is None else min(timeout, self.max_seconds)
+        with client.stream(
+            "POST",
+            url,
+            params={"stream": "true"},
+            json=payload,
+            timeout=httpx.Timeout(timeout, read=read_timeout),
+            extensions=extensions,
+        ) as response:
+            response.raise_for_status()
+            try:
+                result = self._read(response.iter_lines(), chunks, timings)
+            except httpx.ReadTimeout:
+                if self._remaining(timings):
+                    raise
+                timings.cancelled = True
+        return self._result(result, chunks, timings, parse_output)
+
+    async def arun(self, client, url, payload, timeout, parse_output, extensions=None):
+        """
+        Stream a run with an async httpx client and return (output, timings).
+        Reading the stream is bounded by what is left of the time budget, so a
+        stream that goes silent is cancelled on time too.
+        """
+        timings = StreamTimings()
+        chunks = []
+        result = None
+        async with client.stream(
+            "POST", url, params={"stream": "true"}, json=payload, timeout=timeout, extensions=extensions
+        ) as response:
+            response.raise_for_status()
+            try:
+                result = await asyncio.wait_for(
+                    self._aread(response.aiter_lines(), chunks, timings), self._remaining(timings)
+                )
+            except asyncio.TimeoutError:
+                timings.cancelled = True
+        return self._result(result, chunks, timings, parse_output)
@@ -0,0 +1,167 @@
+"""
+This file contains the subset builder for fast iteration runs. A subset is a
+stratified sample of the dataset: the examples are grouped by their metadata
+(e.g. Unit and Rounding) and the length of their question, each group gets its
+share of the subset, and the examples of a group are picked by a hash of their
+inputs, so the same examples are chosen run after run. The chosen ids are
+cached locally and reused until a new version of the dataset is made.
+"""
+import hashlib
+import json
+import math
+import os
+from .journal import example_key
+
+# Share of the dataset each subset runs; "full" runs every example
+SUBSET_FRACTIONS = {"smoke": 0.05, "medium": 0.25, "full": 1.0}
+SUBSETS = tuple(SUBSET_FRACTIONS)
+# Stratum key computed from the question instead of the metadata
+LENGTH_KEY = "length"
+# Upper bounds (in words) of the question length buckets; longer questions are "long"
+LENGTH_BUCKETS = ((12, "short"), (40, "medium"))
+# Example ids read from LangSmith per request when loading a cached subset
+READ_BATCH_SIZE = 100
+
+
+def length_bucket(text) -> str:
+    """Bucket a question by its number of words."""
+    words = len(str(text or "").split())
+    for limit, name in LENGTH_BUCKETS:
+        if words <= limit:
+            return name
+    return "long"
+
+
+def example_record(example) -> tuple:
+    """
+    Return the (id, inputs, metadata) of a LangSmith or Phoenix example. The
+    metadata of the example is merged with the "metadata" of its inputs, where
+    the Math Dataset keeps its Unit and Rounding.
+    """
+    inputs = dict(getattr(example, "inputs", None) or getattr(example, "input", None) or {})
+    metadata = {**(getattr(example, "metadata", None) or {}), **(inputs.get("metadata") or {})}
+    return str(example.id), inputs, metadata
+
+
+def stratum(inputs, metadata, keys) -> tuple:
+    """The stratum of an example: its value of each key, "-" where it has none."""
+    values = []
+    for key in keys:
+        if key == LENGTH_KEY:
+            values.append(length_bucket(inputs.get("question")))
+        else:
+            value = metadata.get(key)
+            values.append("-" if value in (None, "") else str(value))
+    return tuple(values)
+
+
+def allocate(sizes, total) -> dict:
+    """
+    Split `total` picks across strata in proportion to their `sizes`, with the
+    largest remainders rounded up. Every stratum gets at least one pick when
+    there are enough picks to go around.
+    """
+    counts = {name: 1 if total >= len(sizes) else 0 for name in sizes}
+    left = total - sum(counts.values())
+    capacity = {name: size - counts[name] for name, size in sizes.items()}
+    quotas = {name: left * size / sum(capacity.values()) if left > 0 else 0.0 for name, size in capacity.items()}
+    for name, quota in quotas.items():
+        counts[name] += math.floor(quota)
+    rest = total - sum(counts.values())
+    for name in sorted(quotas, key=lambda name: (math.floor(quotas[name]) - quotas[name], name))[:rest]:
+        counts[name] += 1
+    return counts
+
+
+def select_subset(records, fraction, keys) -> list:
+    """
+    Return the ids of a stratified sample of about `fraction` of `records`, a list
+    of (id, inputs, metadata). Within a stratum the examples with the lowest hash
+    of their inputs are chosen, so the sample only changes where the data does.
+    """
+    strata = {}
+    for record_id, inputs, metadata in records:
+        rank = hashlib.sha256(example_key(inputs).encode("utf-8")).hexdigest()
+        strata.setdefault(stratum(inputs, metadata, keys), []).append((rank, record_id))
+    total = min(len(records), max(1, math.ceil(fraction * len(records)))) if records else 0
+    counts = allocate({name: len(members) for name, members in strata.items()}, total)
+    return sorted(record_id for name, members in strata.items() for _, record_id in sorted(members)[:counts[name]])
+
+
+class SubsetCache:
+    """
+    JSON file of the chosen example ids, keyed by dataset id and subset name,
+    with the dataset version and subset settings they were chosen for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self) -> dict:
+        """Load the recorded {dataset id: {subset: {"version", "fraction", "keys", "ids"}}} subsets."""
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def save(self, state):
+        """Record the subsets, replacing the file atomically."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(state, file, indent=2)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def get(self, dataset_id, version, subset, keys) -> list:
+        """Return the cached ids of `subset`, or None unless they were chosen from this version with these keys."""
+        cached = self.load().get(str(dataset_id), {}).get(subset)
+        if cached is None or cached["version"] != str(version):
+            return None
+        if cached["fraction"] != SUBSET_FRACTIONS[subset] or cached["keys"] != list(keys):
+            return None
+        return cached["ids"]
+
+    def put(self, dataset_id, version, subset, keys, ids):
+        """Record the ids chosen for `subset` of a dataset version."""
+        state = self.load()
+        state.setdefault(str(dataset_id), {})[subset] = {
+            "version": str(version), "fraction": SUBSET_FRACTIONS[subset], "keys": list(keys), "ids": ids,
+        }
+        self.save(state)
+
+
+def subset_examples(dataset_id, version, subset, cache, keys, list_examples, read_examples) -> list:
+    """
+    Return the examples of `subset` of a dataset version. `list_examples()`
+    returns every example and is only called for the full dataset or when the
+    subset has to be chosen again; cached ids are fetched with `read_examples(ids)`.
+    """
+    fraction = SUBSET_FRACTIONS[subset]
+    if fraction >= 1.0:
+        return list(list_examples())
+    ids = cache.get(dataset_id, version, subset, keys)
+    if ids is not None:
+        return list(read_examples(ids))
+    examples = list(list_examples())
+    ids = select_subset([example_record(example) for example in examples], fraction, keys)
+    cache.put(dataset_id, version, subset, keys, ids)
+    chosen = set(ids)
+    return [example for example in examples if str(example.id) in chosen]
+
+
+def langsmith_subset(client, dataset, subset, cache, keys) -> list:
+    """
+    Return the examples of `subset` of a LangSmith dataset. Its latest version is
+    read first, so the whole dataset is only listed when that version has no cached subset.
+    """
+    def read_examples(ids):
+        # The ids go in the query string, so they are read a batch at a time
+        for start in range(0, len(ids), READ_BATCH_SIZE):
+            yield from client.list_examples(dataset_id=dataset.id, example_ids=ids[start:start + READ_BATCH_SIZE])
+
+    version = client.read_dataset_version(dataset_id=dataset.id, tag="latest").as_of.isoformat()
+    return subset_examples(
+        dataset.id, version, subset, cache, keys, lambda: client.list_examples(dataset_id=dataset.id), read_examples
+    )
@@ -0,0 +1,225 @@
+"""
+This file contains the token accounting shared by the harnesses.
+A call's token counts come from the usage Langflow reports when there is one.
+Otherwise the prompt and completion are counted with the tokenizer of the model:
+tiktoken for OpenAI models, a character estimate for providers whose tokenizer
+is not available locally. Encoders are loaded once per model, and texts are
+counted on a background thread that encodes everything queued at once with
+tiktoken's batch API, so counting does not run on the request thread or the
+event loop. Counts are summed per (endpoint, provider, model) for the run report.
+"""
+import asyncio
+import logging
+import queue
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from functools import lru_cache
+from rich.console import Console
+from rich.table import Table
+
+# Providers whose models are tokenized with tiktoken
+TIKTOKEN_PROVIDERS = {"OpenAI", "Azure OpenAI"}
+# Encoding for OpenAI models that tiktoken does not know yet
+DEFAULT_ENCODING = "o200k_base"
+# Characters per token when the provider's tokenizer is not available
+CHARS_PER_TOKEN = 4
+# Most texts encoded in one batch
+MAX_BATCH = 256
+# Sources of a call's counts, in report order
+SOURCES = ("langflow", "tiktoken", "estimate")
+# Logger used when the harness does not pass its own
+logger = logging.getLogger(__name__)
+
+
+def estimate_token_count(text) -> int:
+    """Roughly estimate the number of tokens in a piece of text."""
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+@lru_cache(maxsize=None)
+def get_encoder(provider, model_name, log=logger):
+    """
+    Return the tiktoken encoder of a model, or None when its tokens have to be estimated.
+    Loading an encoding may download it once, so this is only called from the counting thread.
+    """
+    if provider not in TIKTOKEN_PROVIDERS:
+        return None
+    try:
+        import tiktoken  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        log.warning("tiktoken is not installed, estimating token counts for %s", model_name)
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:  # pylint: disable=broad-except
+        log.warning("Could not load the tokenizer of %s, estimating token counts: %s", model_name, e)
+        return None
+
+
+def normalize_usage(usage):
+    """Turn an OpenAI- or LangChain-style usage dict into token counts, or None."""
+    if not isinstance(usage, dict):
+        return None
+    prompt = usage.get("input_tokens", usage.get("prompt_tokens"))
+    completion = usage.get("output_tokens", usage.get("completion_tokens"))
+    if not isinstance(prompt, int) or not isinstance(completion, int):
+        return None
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": usage.get("total_tokens") or prompt + completion,
+        "source": "langflow",
+    }
+
+
+def extract_usage(response_json):
+    """Return the token usage Langflow reported for a run, or None when it reported none."""
+    try:
+        message = response_json["outputs"][0]["outputs"][0]["results"]["message"]
+    except (KeyError, IndexError, TypeError):
+        return None
+    if not isinstance(message, dict):
+        return None
+    data = message.get("data") or {}
+    for holder in (message, data, data.get("properties") or {}, message.get("properties") or {}):
+        counts = normalize_usage(holder.get("usage")) if isinstance(holder, dict) else None
+        if counts is not None:
+            return counts
+    return None
+
+
+class TokenAccountant:
+    """
+    Counts tokens on a background thread and sums them per (endpoint, provider, model).
+    `count()` queues a text and returns a future, so the prompt can be counted while
+    the Langflow request is in flight. `measure()` / `ameasure()` combine the counts
+    of one call (preferring the usage Langflow reported) and add them to the report.
+    Tokenizer problems are logged to `log`.
+    """
+
+    def __init__(self, max_batch=MAX_BATCH, log=logger):
+        self.max_batch = max_batch
+        self.log = log
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._totals = defaultdict(lambda: defaultdict(int))
+
+    def count(self, provider, model_name, text) -> Future:
+        """Queue `text` for counting and return a future of (tokens, source)."""
+        future = Future()
+        if not text:
+            future.set_result((0, "estimate"))
+            return future
+        self._ensure_worker()
+        self._queue.put((provider, model_name, text, future))
+        return future
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="token-accountant", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._count_batch(items)
+
+    def _count_batch(self, items):
+        """Count a batch of queued texts, one batch call per model."""
+        by_model = defaultdict(list)
+        for provider, model_name, text, future in items:
+            by_model[(provider, model_name)].append((text, future))
+        for (provider, model_name), pending in by_model.items():
+            texts = [str(text) for text, _ in pending]
+            encoder = get_encoder(provider, model_name, self.log)
+            counts, source = None, "estimate"
+            if encoder is not None:
+                try:
+                    tokens = encoder.encode_ordinary_batch(texts, num_threads=min(8, len(texts)))
+                    counts, source = [len(encoded) for encoded in tokens], "tiktoken"
+                except Exception as e:  # pylint: disable=broad-except
+                    self.log.warning("Token counting failed for %s, estimating instead: %s", model_name, e)
+            if counts is None:
+                counts = [estimate_token_count(text) for text in texts]
+            for (_, future), count in zip(pending, counts):
+                future.set_result((count, source))
+
+    def _combine(self, cell, prompt, completion, usage):
+        if usage is not None:
+            counts = usage
+        else:
+            (prompt_tokens, source), (completion_tokens, _) = prompt, completion
+            counts = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "source": source,
+            }
+        self.record(cell, counts)
+        return counts
+
+    def measure(self, cell, provider, model_name, prompt_future, output, usage=None) -> dict:
+        """Return the token counts of one call and add them to the report of `cell`."""
+        if usage is not None:
+            return self._combine(cell, None, None, usage)
+        completion = self.count(provider, model_name, output)
+        return self._combine(cell, prompt_future.result(), completion.result(), None)
+
+    async def ameasure(self, cell, provider, model_name, prompt_future, output, usage=None) -> dict:
+        """Async version of measure() that waits for the counts without blocking the event loop."""
+        if usage is not None:
+            return self._combine(cell, None, None, usage)
+        completion = self.count(provider, model_name, output)
+        prompt, completion = await asyncio.gather(asyncio.wrap_future(prompt_future), asyncio.wrap_future(completion))
+        return self._combine(cell, prompt, completion, None)
+
+    def record(self, cell, counts):
+        """Add the counts of one call to the totals of `cell`."""
+        with self._lock:
+            totals = self._totals[tuple(cell)]
+            totals["calls"] += 1
+            totals[counts["source"]] += 1
+            for name in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                totals[name] += counts[name]
+
+    def rows(self):
+        """Return (cell, totals) rows sorted by cell."""
+        with self._lock:
+            return [(cell, dict(totals)) for cell, totals in sorted(self._totals.items())]
+
+    def print_table(self, console=None):
+        """Print the token totals per (endpoint, provider, model)."""
+        rows = self.rows()
+        if not rows:
+            return
+        table = Table(title="Token usage")
+        for column in ("Endpoint", "Provider", "Model"):
+            table.add_column(column)
+        for column in ("Calls", "Prompt", "Completion", "Total", "Source"):
+            table.add_column(column, justify="right")
+        for (endpoint, provider, model), totals in rows:
+            sources = ", ".join(f"{source} {totals[source]}" for source in SOURCES if totals.get(source))
+            table.add_row(
+                endpoint,
+                provider,
+                model,
+                str(totals["calls"]),
+                str(totals["prompt_tokens"]),
+                str(totals["completion_tokens"]),
+                str(totals["total_tokens"]),
+                sources,
+            )
+        (console or Console()).print(table)
@@ -1,74 +1,64 @@
 """
 This script creates or fetches an eval dataset using LangSmith for the Langflow agent.
+The examples live in a local JSONL (or Parquet) file and are synced to LangSmith,
+pushing only the examples that were added or changed. Remote examples missing from
+the file are only deleted when this script is run from the command line.
 """
-from config import ls_client, log # LangSmith client
+import argparse
+import os
+from functools import lru_cache
+from config import get_ls_client, log # LangSmith client
+from dataset_sync import load_examples, sync_dataset # Hash-diffed bulk dataset sync
 
 # Dataset name and description as they appear in LangSmith
 DATASET_NAME = "langflow-agent-evals"
 DATASET_DESC = "QA checks for our Langflow agent"
 
-# Define the examples ONCE
-examples = [
-    {
-        "inputs": {"question": "How do you define a function in Python?"},
-        "outputs": {
-            "answer": (
-                "In Python, you define a function using the 'def' keyword "
-                "followed by the function name,"
-                "parameters in parentheses, and a colon. The function body is indented below."
-            )
-        },
-    },
-    {
-        "inputs": {"question": "What is the difference between a list and a tuple in Python?"},
-        "outputs": {
-            "answer": (
-                "Lists are mutable (can be changed after creation) while tuples are immutable "
-                "(cannot be changed after creation)."
-                "Lists use square brackets [] and tuples use parentheses ()."
-            )
-        },
-    },
-    {
-        "inputs": {"question": "What does the 'self' parameter in Python class methods represent?"},
-        "outputs": {
-            "answer": (
-                "The 'self' parameter in Python class methods refers to the instance of the class."
-                "It allows access to the attributes and methods of the class."
-            )
-        },
-    },
-    {
-        "inputs": {"question": "What is a lambda function in Python?"},
-        "outputs": {
-            "answer": (
-                "A lambda function is an anonymous function defined using the 'lambda' keyword."
-                "It can take any number of arguments but can only have one expression."
-            )
-        },
-    }
-]
+# Define the examples ONCE, one {"inputs", "outputs"} record per line
+DATASET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples.jsonl")
 
-datasets = ls_client.list_datasets()
-log.info("LangSmith datasets found: %s", [d.name for d in datasets])
-log.info("Has dataset? %s", ls_client.has_dataset(dataset_name=DATASET_NAME))
 
-if ls_client.has_dataset(dataset_name=DATASET_NAME):
-    dataset = ls_client.read_dataset(dataset_name=DATASET_NAME)
-    # Check if dataset is empty
-    examples_list = list(ls_client.list_examples(dataset_id=dataset.id))
-    log.info("Number of examples: %s", len(examples_list))
-    if not examples_list:
-        log.info("Dataset is empty, populating examples...")
-        for ex in examples:
-            ls_client.create_example(inputs=ex["inputs"], outputs=ex["outputs"], dataset_id=dataset.id)
-    else:
-        log.info("Dataset exists and is not empty. No action needed.")
-else:
-    log.info("Dataset does not exist. Creating and populating examples...")
-    dataset = ls_client.create_dataset(
-        dataset_name=DATASET_NAME,
-        description=DATASET_DESC
+@lru_cache(maxsize=None)
+def get_dataset():
+    """
+    Sync the eval dataset to LangSmith on first use and return it.
+    Examples are only added or updated, never deleted, so an eval run cannot
+    remove examples another file or user added. Nothing is fetched when this module is imported.
+    """
+    dataset, _ = sync_dataset(
+        get_ls_client(), DATASET_NAME, load_examples(DATASET_FILE), description=DATASET_DESC, delete=False
     )
-    for ex in examples:
-        ls_client.create_example(inputs=ex["inputs"], outputs=ex["outputs"], dataset_id=dataset.id)
+    return dataset
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Sync a local JSONL/Parquet file to a LangSmith dataset.")
+    parser.add_argument(
+        "--file",
+        default=DATASET_FILE,
+        help=f"JSONL or Parquet file with the examples (default: {DATASET_FILE})"
+    )
+    parser.add_argument(
+        "--name",
+        default=DATASET_NAME,
+        help=f"LangSmith dataset name (default: {DATASET_NAME})"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report what would be created, updated and deleted"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    sync_dataset(
+        get_ls_client(),
+        args.name,
+        load_examples(args.file),
+        description=DATASET_DESC,
+        dry_run=args.dry_run,
+    )
+    log.info("Sync %s.", "planned" if args.dry_run else "complete")
@@ -0,0 +1,121 @@
+"""
+This file contains the engine that syncs a LangSmith dataset with a local
+JSONL or Parquet file. Every example is hashed, the remote examples are fetched
+in one paginated pass, and only the added, changed and removed examples are
+pushed, through the bulk create/update/delete APIs.
+"""
+import json
+import os
+from dataclasses import dataclass, field
+from langsmith.utils import LangSmithNotFoundError
+from config import log
+from evals_common.examples import HASH_KEY, hash_content, normalize_example
+
+# Examples sent per bulk create/update/delete request
+SYNC_BATCH_SIZE = 500
+
+
+def load_examples(path) -> list:
+    """Load examples from a JSONL file (one record per line) or a Parquet file with the same columns."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        with open(path, encoding="utf-8") as file:
+            records = [json.loads(line) for line in file if line.strip()]
+    elif extension == ".parquet":
+        try:
+            import pandas as pd  # pylint: disable=import-outside-toplevel
+        except ImportError as e:
+            raise ImportError("Reading Parquet datasets requires pandas and pyarrow") from e
+        records = pd.read_parquet(path).to_dict(orient="records")
+    else:
+        raise ValueError(f"Unsupported dataset file '{path}', expected .jsonl or .parquet")
+    return [normalize_example(record) for record in records]
+
+
+@dataclass
+class SyncPlan:
+    """The changes needed to bring a remote dataset in line with the local examples."""
+    create: list = field(default_factory=list)  # local examples
+    update: list = field(default_factory=list)  # local examples with the id of the remote example
+    delete: list = field(default_factory=list)  # remote example ids
+    unchanged: int = 0
+
+
+def plan_sync(local_examples, remote_examples) -> SyncPlan:
+    """
+    Match local and remote examples on the hash of their inputs, then compare
+    content hashes. Duplicate inputs are kept once on either side.
+    """
+    plan = SyncPlan()
+    remote_by_key = {}
+    for remote in remote_examples:
+        key = hash_content(remote.inputs)
+        if key in remote_by_key:
+            plan.delete.append(remote.id)
+        else:
+            remote_by_key[key] = remote
+
+    seen = set()
+    for example in local_examples:
+        key = hash_content(example["inputs"])
+        if key in seen:
+            log.warning("Skipping duplicate dataset example: %s", example["inputs"])
+            continue
+        seen.add(key)
+        remote = remote_by_key.pop(key, None)
+        if remote is None:
+            plan.create.append(example)
+        elif (remote.metadata or {}).get(HASH_KEY) != example["metadata"][HASH_KEY]:
+            plan.update.append({"id": remote.id, **example})
+        else:
+            plan.unchanged += 1
+    plan.delete.extend(remote.id for remote in remote_by_key.values())
+    return plan
+
+
+def batched(items, size):
+    """Yield successive chunks of at most `size` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def sync_dataset(
+    ls_client, dataset_name, examples, description=None, dry_run=False, delete=True, batch_size=SYNC_BATCH_SIZE
+):
+    """
+    Create the dataset if needed and push only the examples that changed.
+    Without `delete`, remote examples missing from `examples` are kept instead of deleted.
+    Returns (dataset, plan); with `dry_run` nothing is written and the dataset
+    is None when it does not exist yet.
+    """
+    try:
+        dataset = ls_client.read_dataset(dataset_name=dataset_name)
+        remote_examples = list(ls_client.list_examples(dataset_id=dataset.id))
+    except LangSmithNotFoundError:
+        dataset = None if dry_run else ls_client.create_dataset(dataset_name=dataset_name, description=description)
+        remote_examples = []
+
+    plan = plan_sync(examples, remote_examples)
+    if not delete and plan.delete:
+        log.info(
+            "Dataset '%s': keeping %d remote example(s) missing from the local file", dataset_name, len(plan.delete)
+        )
+        plan.delete = []
+    log.info(
+        "Dataset '%s': %d to create, %d to update, %d to delete, %d unchanged",
+        dataset_name,
+        len(plan.create),
+        len(plan.update),
+        len(plan.delete),
+        plan.unchanged,
+    )
+    if dry_run:
+        return dataset, plan
+
+    for batch in batched(plan.create, batch_size):
+        ls_client.create_examples(dataset_id=dataset.id, examples=batch)
+    for batch in batched(plan.update, batch_size):
+        ls_client.update_examples(dataset_id=dataset.id, updates=batch)
+    for batch in batched(plan.delete, batch_size):
+        ls_client.delete_examples(example_ids=batch)
+    return dataset, plan
@@ -1,10 +1,75 @@
 """
 This script defines an LLM-as-judge evaluators for the Langflow agent.
 """
-from config import openai_client # OpenAI client and logger
+import json
+from concurrent.futures import ThreadPoolExecutor
+from config import ( # OpenAI and LangSmith clients, judge verdict cache, cascade settings, retries and logger
+    call_with_retries,
+    get_circuit_breaker,
+    get_openai_client,
+    get_ls_client,
+    judge_cache,
+    judge_cascade_band,
+    judge_small_model,
+    log,
+)
+from evals_common.fused_judge import fan_out, render_prompt, response_format # Fused multi-criteria judge
+from evals_common.metrics import METRICS, compute_metrics # Vectorized local reference metrics
+from evals_common.cascade import JudgeCascade, cascade_stats, reference_check, reference_hint # Judge cascade
 
-def helpfulness(inputs: dict, outputs: dict, reference_outputs: dict) -> float:
-    """Check if the response is helpful compared to the reference answer."""
+HELPFULNESS_MODEL = "gpt-5.1-mini"
+HELPFULNESS_PROMPT = """
+        You are grading the helpfulness of the following response on a scale of 1–5.
+        Question:
+        {question}
+        Reference answer:
+        {answer}
+        Predicted answer:
+        {response}
+        Respond with a single number from 1 (not helpful) to 5 (very helpful):
+        Score:
+    """
+
+# Batched judge: K (question, reference, prediction) items are scored in one request
+HELPFULNESS_BATCH_PROMPT = """
+        You are grading the helpfulness of each of the following responses on a scale of 1–5,
+        compared to its reference answer.
+        Score every item independently, from 1 (not helpful) to 5 (very helpful),
+        and return one score per item id.
+        Items:
+        {items}
+    """
+HELPFULNESS_BATCH_SCHEMA = {
+    "name": "helpfulness_scores",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "scores": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "integer"},
+                        "score": {"type": "number"},
+                    },
+                    "required": ["id", "score"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["scores"],
+        "additionalProperties": False,
+    },
+}
+# Number of batch requests sent to the judge at once
+HELPFULNESS_BATCH_WORKERS = 4
+# Number of feedback requests sent to LangSmith at once by the reference metrics
+METRICS_FEEDBACK_WORKERS = 8
+
+
+def extract_triple(inputs: dict, outputs: dict, reference_outputs: dict) -> dict:
+    """Extract the (question, reference answer, response) triple that is judged."""
     # Extract question
     question = inputs.get("question")
     if question is None and "inputs" in inputs:
@@ -17,30 +82,203 @@ def helpfulness(inputs: dict, outputs: dict, reference_outputs: dict) -> float:
     answer = reference_outputs.get("answer")
     if answer is None and "outputs" in reference_outputs:
         answer = reference_outputs["outputs"].get("answer")
-    user_content = f"""
-        You are grading the helpfulness of the following response on a scale of 1–5.
-        Question:
-        {question}
-        Reference answer:
-        {answer}
-        Predicted answer:
-        {response}
-        Respond with a single number from 1 (not helpful) to 5 (very helpful):
-        Score:
-    """
-    response_score = openai_client.chat.completions.create(
-        model="gpt-5.1-mini",
-        temperature=0,
-        messages=[
+    return {"question": question, "answer": answer, "response": response}
+
+
+def judge_completion(messages: list, model: str = HELPFULNESS_MODEL, **kwargs) -> str:
+    """Send one request to the helpfulness judge (or `model`), retrying transient failures."""
+    return call_with_retries(
+        lambda: get_openai_client().chat.completions.create(
+            model=model,
+            temperature=0,
+            messages=messages,
+            **kwargs,
+        ),
+        get_circuit_breaker("judge", model),
+    ).choices[0].message.content
+
+
+def helpfulness(inputs: dict, outputs: dict, reference_outputs: dict) -> float:
+    """Check if the response is helpful compared to the reference answer."""
+    rendered = extract_triple(inputs, outputs, reference_outputs)
+    user_content = HELPFULNESS_PROMPT.format(**rendered)
+    # Reuse the verdict for an unchanged (question, reference, prediction) triple
+    response_score = judge_cache.verdict(
+        HELPFULNESS_MODEL,
+        HELPFULNESS_PROMPT,
+        rendered,
+        lambda: judge_completion([
             {"role": "user", "content": user_content},
-        ],
-    ).choices[0].message.content.strip()
+        ]).strip(),
+    )
     try:
         return float(response_score)
     except ValueError:
         return 0.0
 
 
+def fused_verdict(criteria, prompt, rendered, model=HELPFULNESS_MODEL) -> dict:
+    """Score every criterion in `criteria` in one structured-output request to `model`."""
+    user_content = prompt.format(
+        inputs=rendered["question"], outputs=rendered["response"], reference_outputs=rendered["answer"]
+    )
+    return judge_cache.verdict(
+        model,
+        prompt,
+        rendered,
+        lambda: json.loads(judge_completion(
+            [{"role": "user", "content": user_content}],
+            model=model,
+            response_format=response_format(criteria),
+        )),
+    )
+
+
+def create_fused_judge(criteria):
+    """
+    Create an evaluator that scores every criterion in `criteria` in one
+    structured-output judge request and returns one feedback key per criterion.
+    """
+    prompt = render_prompt(criteria)
+
+    def fused_judge(inputs: dict, outputs: dict, reference_outputs: dict) -> dict:
+        rendered = extract_triple(inputs, outputs, reference_outputs)
+        return {"results": fan_out(fused_verdict(criteria, prompt, rendered), criteria)}
+    return fused_judge
+
+
+def create_cascade_judge(criteria):
+    """
+    Create an evaluator that scores every criterion in `criteria` through the
+    judge cascade: the deterministic check, then one fused request to the small
+    judge, and one to the large judge only when a criterion is still unsettled,
+    i.e. its small score is uncertain or disagrees with the reference token F1.
+    """
+    prompt = render_prompt(criteria)
+    cascades = {name: JudgeCascade(name, judge_cascade_band, cascade_stats) for name in criteria}
+
+    def cascade_judge(inputs: dict, outputs: dict, reference_outputs: dict) -> dict:
+        rendered = extract_triple(inputs, outputs, reference_outputs)
+        verdicts = {}
+
+        def judge(model, name):
+            # One fused request per model and example, shared by all criteria
+            if model not in verdicts:
+                verdict = fused_verdict(criteria, prompt, rendered, model)
+                verdicts[model] = {result["key"]: result for result in fan_out(verdict, criteria)}
+            return verdicts[model].get(name)
+
+        results = [
+            cascades[name].run(
+                [
+                    ("check", lambda name=name: reference_check(name, rendered["response"], rendered["answer"])),
+                    ("small", lambda name=name: judge(judge_small_model, name)),
+                    ("large", lambda name=name: judge(HELPFULNESS_MODEL, name)),
+                ],
+                hint=reference_hint(name, rendered["response"], rendered["answer"]),
+            )
+            for name in criteria
+        ]
+        return {"results": [result for result in results if result is not None]}
+    return cascade_judge
+
+
+def judge_helpfulness_batch(items: list) -> list:
+    """
+    Score a batch of (question, answer, response) triples in one structured-output request.
+    Returns one score per item, with None for items whose score could not be parsed.
+    Items already in the judge cache are not sent again.
+    """
+    scores = [None] * len(items)
+    keys = {}
+    for i, item in enumerate(items):
+        key, cached = judge_cache.lookup(HELPFULNESS_MODEL, HELPFULNESS_BATCH_PROMPT, item)
+        if cached is not None:
+            scores[i] = cached
+        else:
+            keys[i] = key
+    if not keys:
+        return scores
+
+    user_content = HELPFULNESS_BATCH_PROMPT.format(
+        items=json.dumps([{"id": i, **items[i]} for i in keys], indent=2)
+    )
+    try:
+        content = judge_completion(
+            [{"role": "user", "content": user_content}],
+            response_format={"type": "json_schema", "json_schema": HELPFULNESS_BATCH_SCHEMA},
+        )
+        returned = json.loads(content).get("scores", [])
+    except Exception as e:
+        log.error("Batched helpfulness judge failed: %s", e)
+        return scores
+
+    for entry in returned:
+        try:
+            i, score = int(entry["id"]), float(entry["score"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if i in keys and 1.0 <= score <= 5.0:
+            scores[i] = score
+            judge_cache.store(keys[i], score)
+    return scores
+
+
+def create_batched_helpfulness(batch_size: int):
+    """
+    Create a LangSmith summary evaluator that judges helpfulness for the whole
+    experiment in batches of `batch_size` examples. Per-example scores are logged
+    as `helpfulness` feedback on each run, and items that could not be parsed
+    fall back to the single-example `helpfulness` judge.
+    """
+    def batched_helpfulness(runs: list, examples: list) -> dict:
+        triples = [
+            extract_triple(example.inputs or {}, run.outputs or {}, example.outputs or {})
+            for run, example in zip(runs, examples)
+        ]
+        batches = [triples[i:i + batch_size] for i in range(0, len(triples), batch_size)]
+        with ThreadPoolExecutor(max_workers=HELPFULNESS_BATCH_WORKERS) as executor:
+            scores = [score for batch in executor.map(judge_helpfulness_batch, batches) for score in batch]
+
+        fallbacks = 0
+        for run, example, score in zip(runs, examples, scores):
+            if score is None:
+                fallbacks += 1
+                score = helpfulness(example.inputs or {}, run.outputs or {}, example.outputs or {})
+            get_ls_client().create_feedback(run.id, key="helpfulness", score=score)
+        log.info(
+            "Batched helpfulness judged %d example(s) in %d batch(es), %d single-call fallback(s)",
+            len(runs),
+            len(batches),
+            fallbacks,
+        )
+        return {"key": "helpfulness_batch_fallbacks", "score": fallbacks}
+    return batched_helpfulness
+
+
+def reference_metrics(runs: list, examples: list) -> dict:
+    """
+    LangSmith summary evaluator that scores every run of the experiment with the
+    local reference metrics (exact match, token F1, ROUGE-L, TF-IDF cosine and
+    length ratio), computed in NumPy batches. Per-example scores are logged as
+    feedback on each run, and the experiment means are returned.
+    """
+    triples = [
+        extract_triple(example.inputs or {}, run.outputs or {}, example.outputs or {})
+        for run, example in zip(runs, examples)
+    ]
+    scores = compute_metrics([triple["response"] for triple in triples], [triple["answer"] for triple in triples])
+    feedback = [(run.id, name, float(scores[name][i])) for i, run in enumerate(runs) for name in METRICS]
+    with ThreadPoolExecutor(max_workers=METRICS_FEEDBACK_WORKERS) as executor:
+        list(executor.map(lambda item: get_ls_client().create_feedback(item[0], key=item[1], score=item[2]), feedback))
+    return {
+        "results": [
+            {"key": f"mean_{name}", "score": float(scores[name].mean()) if len(runs) else None}
+            for name in METRICS
+        ]
+    }
+
+
 def concision(outputs: dict, reference_outputs: dict) -> bool:
     """Check if the response is concise compared to the reference answer."""
     # Extract response
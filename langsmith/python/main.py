@@ -2,78 +2,338 @@
 This script runs a Langflow agent flow
 and evaluates its performance using LangSmith.
 """
+import argparse
+import asyncio
+import os
+import functools
+import inspect
+import time
 import uuid
-import requests
 from config import (
-    ls_client, # LangSmith client
-    langflow_api_key, # LangFlow API key
+    get_ls_client, # LangSmith client
+    langflow_client, # Pooled Langflow HTTP client
+    langflow_async_client, # Pooled async Langflow HTTP client
+    langflow_concurrency, # Default number of Langflow calls in flight
+    langflow_stream, # Default for streaming Langflow runs
+    langflow_stream_max_seconds, # Time budget of a streamed run
+    langflow_stream_max_tokens, # Token-event budget of a streamed run
+    langflow_cache_mode, # Default Langflow response cache mode
+    langflow_cache_path, # Langflow response cache location
+    langflow_cache_ttl, # Langflow response cache TTL in seconds
+    langflow_cache_max_mb, # Langflow response cache size limit
+    judge_batch_size, # Default number of examples per helpfulness judge request
+    judge_fused, # Score every judge criterion in one request per example
+    judge_criteria, # Criteria scored by the fused judge
+    judge_cascade, # Settle confident examples with the deterministic check or the small judge
     log, # Rich-formatted logger
     MODELS_TO_TEST, # List of models to test
+    run_journal, # Checkpoint journal of finished examples
+    session_registry, # Registry of the Langflow sessions this run creates
+    cleanup_sessions, # Default for deleting this run's sessions at the end
+    dataset_subset, # Default subset of the dataset to run
+    subset_strata, # Metadata keys the subsets are stratified by
+    subset_cache, # Cache of the example ids chosen for each subset
+    resilience, # Retry policy and circuit breakers
+    provider_limiters, # Per-provider limiters
+    get_provider_limiter, # Shared limiter of a provider
+    token_accountant, # Token counts of the current run
 )
-from dataset import dataset # LangSmith dataset
+from dataset import get_dataset # LangSmith dataset
 from judge import ( # LLM-as-judge evaluators
     helpfulness, # helpfulness evaluator
-    concision # concision evaluator
+    concision, # concision evaluator
+    create_batched_helpfulness, # batched helpfulness summary evaluator
+    create_fused_judge, # fused multi-criteria judge
+    create_cascade_judge, # check, small judge and large judge cascade
+    reference_metrics, # vectorized local reference metrics summary evaluator
 )
-from langsmith import traceable
+from langsmith import traceable, get_current_run_tree
+from langsmith.utils import LangSmithNotFoundError
+from evals_common.scheduler import ( # Matrix scheduler with per-provider limits
+    estimate_tokens,
+    run_matrix,
+)
+from evals_common.response_cache import NOT_LOOKED_UP, ResponseCache, CACHE_MODES # Langflow response cache
+from evals_common.streaming import LangflowStreamer # Streaming Langflow run API
+from evals_common.phases import latency_report # Per-phase latency instrumentation
+from evals_common.langflow import LangflowHooks, LangflowRunner # Request, stream, parse, retry and cache path
+from evals_common.cascade import cascade_stats # Hit rate of each judge cascade stage
+from evals_common.journal import OUTPUT, example_key # Checkpoint journal keys
+from evals_common.session_registry import delete_run_sessions # Deletes the sessions of a run
+from evals_common.subset import SUBSETS, langsmith_subset # Stratified, stable dataset subsets
 
 AGENT_ID = "Agent-AQzDw"
 ENDPOINT_NAME = "evals_in_langflow"
 
+# Persistent cache of Langflow responses (mode set with --cache)
+response_cache = ResponseCache(
+    langflow_cache_path,
+    mode=langflow_cache_mode,
+    ttl=langflow_cache_ttl,
+    max_bytes=int(langflow_cache_max_mb * 1024 * 1024),
+)
+
+# Streaming Langflow runs with time-to-first-token timings (enabled with --stream)
+langflow_streamer = LangflowStreamer(
+    enabled=langflow_stream,
+    max_seconds=langflow_stream_max_seconds,
+    max_tokens=langflow_stream_max_tokens,
+)
+
 # ===========================
 # Run the eval
 # ===========================
-@traceable(name="langflow_agent_run_api", client=ls_client)
-def call_langflow_api(input_value, provider, model_name, api_key):
+def build_tweaks(provider, model_name, api_key):
     """
-    Call the Langflow API to run the evals_in_langflow flow.
+    Build the agent tweaks that select the provider and model in Langflow.
     """
-    log.debug("call_langflow_api input_value: %s", input_value)  # Debug input
-    # API Configuration
-    url = f"http://127.0.0.1:7860/api/v1/run/{ENDPOINT_NAME}"
+    return {
+        AGENT_ID: {
+            "agent_llm": provider,
+            "model_name": model_name,
+            "api_key": api_key
+        }
+    }
 
-    # Request payload configuration
-    payload = {
+
+def build_payload(input_value, provider, model_name, api_key):
+    """
+    Build the Langflow run API request payload for one input.
+    """
+    return {
         "output_type": "chat",
         "input_type": "chat",
         "input_value": input_value,
         "session_id": str(uuid.uuid4()),
-        "tweaks": {
-            AGENT_ID: {
-                "agent_llm": provider,
-                "model_name": model_name,
-                "api_key": api_key
-            }
-        }
+        "tweaks": build_tweaks(provider, model_name, api_key)
     }
 
-    # Request headers
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": langflow_api_key  # Authentication key from environment variable
-    }
 
-    try:
-        # Send API request
-        result = requests.request("POST", url, json=payload, headers=headers, timeout=300)
-        result.raise_for_status()  # Raise exception for bad status codes
-
-        response_json = result.json()
-        output = (
-            response_json.get("outputs")[0]
-            .get("outputs")[0]
-            .get("results")
-            .get("message")
-            .get("data")
-            .get("text")
-        )
-        log.debug("call_langflow_api output: %s", output)  # Debug output
-        return output
+def cache_key(input_value, provider, model_name, api_key):
+    """
+    Build the response cache key for one Langflow request.
+    """
+    tweaks = build_tweaks(provider, model_name, api_key)
+    return ResponseCache.make_key(ENDPOINT_NAME, tweaks, provider, model_name, input_value)
+
+
+def mark_run_resumed():
+    """
+    Mark the current LangSmith run as replayed from the checkpoint journal.
+    """
+    run_tree = get_current_run_tree()
+    if run_tree is not None:
+        run_tree.add_metadata({"resumed": True})
+
+
+def journal_experiment(cell):
+    """
+    Record the LangSmith experiment of the current run as the one `cell` is sent to.
+    """
+    run_tree = get_current_run_tree()
+    if run_tree is not None and run_tree.session_name:
+        run_journal.set_experiment(cell, run_tree.session_name)
+
+
+def register_session(endpoint_name, payload):
+    """
+    Register the session of a Langflow request under this run, tagged with
+    the LangSmith experiment of the current run.
+    """
+    run_tree = get_current_run_tree()
+    experiment = run_tree.session_name if run_tree is not None else None
+    session_registry.add(endpoint_name, payload["session_id"], experiment)
+
+
+def mark_run_cached(cached):
+    """
+    Mark the current LangSmith run as served from the response cache (or not).
+    """
+    run_tree = get_current_run_tree()
+    if run_tree is not None:
+        run_tree.add_metadata({"cached": cached})
+
+
+def record_stream_timings(timings):
+    """
+    Record time-to-first-token, inter-token latency and total time of a
+    streamed run on the current LangSmith run.
+    """
+    run_tree = get_current_run_tree()
+    if run_tree is not None:
+        run_tree.add_metadata({f"stream.{name}": value for name, value in timings.metrics().items()})
+
+
+def record_token_usage(counts):
+    """
+    Record the token counts of a Langflow call on the current LangSmith run.
+    """
+    run_tree = get_current_run_tree()
+    if run_tree is not None:
+        run_tree.add_metadata({
+            "usage_metadata": {
+                "input_tokens": counts["prompt_tokens"],
+                "output_tokens": counts["completion_tokens"],
+                "total_tokens": counts["total_tokens"],
+            },
+            "token_source": counts["source"],
+        })
+
+
+def time_evaluator(evaluator, cell):
+    """
+    Wrap an evaluator so that its run time is recorded on its LangSmith run
+    and in the latency report as the `eval.<name>` phase.
+    """
+    phase = f"eval.{getattr(evaluator, '__name__', 'evaluator')}"
+
+    @functools.wraps(evaluator)
+    def timed_evaluator(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return evaluator(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            latency_report.record(cell, phase, seconds)
+            run_tree = get_current_run_tree()
+            if run_tree is not None:
+                run_tree.add_metadata({f"phase.{phase}_s": round(seconds, 4)})
+    return timed_evaluator
+
+
+def has_output(run) -> bool:
+    """Whether a run produced a response, rather than failing or returning None."""
+    return (run.outputs or {}).get("response") is not None
+
+
+def journal_evaluator(evaluator, cell):
+    """
+    Wrap an evaluator so that its result is recorded in the checkpoint journal,
+    and replayed without running the evaluator for an example that has one.
+    Scores of failed runs or runs without output are not journaled, so --resume
+    scores the retried run instead.
+    """
+    name = getattr(evaluator, "__name__", "evaluator")
+    parameters = inspect.signature(evaluator).parameters
+
+    def journaled_evaluator(run, example):
+        entry = f"score.{name}"
+        key = example_key(example.inputs)
+        result = run_journal.get(cell, key, entry)
+        if result is None:
+            arguments = {
+                "run": run,
+                "example": example,
+                "inputs": example.inputs,
+                "outputs": run.outputs,
+                "reference_outputs": example.outputs,
+            }
+            result = evaluator(**{parameter: arguments[parameter] for parameter in parameters})
+            if not run.error and has_output(run):
+                run_journal.put(cell, key, entry, result)
+        return result
+    journaled_evaluator.__name__ = name
+    return journaled_evaluator
+
+
+def parse_output(response_json):
+    """
+    Extract the chat message text from a Langflow run API response.
+    """
+    return (
+        response_json.get("outputs")[0]
+        .get("outputs")[0]
+        .get("results")
+        .get("message")
+        .get("data")
+        .get("text")
+    )
+
+
+class LangSmithHooks(LangflowHooks):
+    """
+    Record each Langflow call on the current LangSmith run: whether it was cached,
+    its session, its stream and phase timings and its token counts.
+    """
+
+    def cached(self, cell, counts):
+        mark_run_cached(True)
+        record_token_usage(counts)
 
-    except requests.exceptions.RequestException as e:
-        log.error("Error making API request: %s", e)
-    except ValueError as e:
-        log.error("Error parsing response: %s", e)
+    def sent(self, cell, payload):
+        mark_run_cached(False)
+        register_session(cell[0], payload)
+
+    def streamed(self, cell, timings):
+        record_stream_timings(timings)
+
+    def finished(self, cell, timer, counts):
+        run_tree = get_current_run_tree()
+        if run_tree is not None:
+            run_tree.add_metadata(timer.metadata())
+        record_token_usage(counts)
+
+
+# Request, stream, parse, retry and cache path of every Langflow call
+langflow_runner = LangflowRunner(
+    langflow_streamer,
+    resilience,
+    provider_limiters,
+    token_accountant,
+    parse_output,
+    hooks=LangSmithHooks(),
+    timeout=300,
+    log=log,
+)
+
+
+@traceable(name="langflow_agent_run_api")
+def call_langflow_api(input_value, provider, model_name, api_key):
+    """
+    Call the Langflow API to run the evals_in_langflow flow.
+    Raises LangflowCallError when the call failed after its retries.
+    """
+    return langflow_runner.call(
+        langflow_client,
+        response_cache,
+        (ENDPOINT_NAME, provider, model_name),
+        input_value,
+        build_payload(input_value, provider, model_name, api_key),
+        cache_key(input_value, provider, model_name, api_key),
+    )
+
+
+def trace_inputs(inputs):
+    """Leave the response the caller already looked up out of the traced inputs of a Langflow call."""
+    return {name: value for name, value in inputs.items() if name != "cached"}
+
+
+@traceable(name="langflow_agent_run_api", process_inputs=trace_inputs)
+async def acall_langflow_api(input_value, provider, model_name, api_key, cached=NOT_LOOKED_UP):
+    """
+    Async version of call_langflow_api using the pooled async Langflow client.
+    `cached` is the response the caller already looked up in the response cache
+    (None on a miss); by default it is looked up here, off the event loop.
+    """
+    return await langflow_runner.acall(
+        langflow_async_client,
+        response_cache,
+        (ENDPOINT_NAME, provider, model_name),
+        input_value,
+        build_payload(input_value, provider, model_name, api_key),
+        cache_key(input_value, provider, model_name, api_key),
+        cached=cached,
+    )
+
+
+def extract_question(inputs: dict):
+    """
+    Extract the question from the (possibly nested) example inputs.
+    """
+    question = inputs.get("question")
+    if question is None and "inputs" in inputs:
+        question = inputs["inputs"].get("question")
+    return question
 
 
 def create_ls_target(provider, model_name, api_key):
@@ -82,36 +342,260 @@ def create_ls_target(provider, model_name, api_key):
     """
     def ls_target(inputs: dict) -> dict:
         log.debug("ls_target received inputs: %s", inputs)
-        # Extract the question from the nested structure
-        question = inputs.get("question")
-        if question is None and "inputs" in inputs:
-            question = inputs["inputs"].get("question")
+        question = extract_question(inputs)
         return {"response": call_langflow_api(question, provider, model_name, api_key)}
     return ls_target
 
 
-if __name__ == "__main__":
-    log.info("\n[bold]Starting LangSmith Evals...[/bold]")
-    for model_config in MODELS_TO_TEST:
-        PROVIDER = model_config["provider"]
-        MODEL_NAME = model_config["model_name"]
-        API_KEY = model_config["api_key"]
+def create_async_ls_target(provider, model_name, api_key, semaphore):
+    """
+    Create an async LangSmith target function for the Langflow API.
+    The provider limiter is taken before the semaphore that bounds how many
+    Langflow calls are in flight, so a throttled provider never holds Langflow slots.
+    Cached responses skip both, and outputs already in the checkpoint journal
+    are replayed without calling Langflow at all.
+    A failed call raises LangflowCallError, so LangSmith records the run as failed.
+    """
+    limiter = get_provider_limiter(provider)
+    cell = (ENDPOINT_NAME, provider, model_name)
+    experiment_journaled = False
+
+    async def ls_target(inputs: dict) -> dict:
+        nonlocal experiment_journaled
+        log.debug("ls_target received inputs: %s", inputs)
+        key = example_key(inputs)
+        journaled = run_journal.get(cell, key)
+        if journaled is not None:
+            mark_run_resumed()
+            return {"response": journaled}
+        if not experiment_journaled:
+            journal_experiment(cell)
+            experiment_journaled = True
+        question = extract_question(inputs)
+        cached = await response_cache.aget(cache_key(question, provider, model_name, api_key))
+        if cached is not None:
+            response = await acall_langflow_api(question, provider, model_name, api_key, cached=cached)
+        else:
+            async with limiter.aslot(estimate_tokens(question)):
+                async with semaphore:
+                    response = await acall_langflow_api(question, provider, model_name, api_key, cached=None)
+                limiter.record_tokens(estimate_tokens(response))
+        run_journal.put(cell, key, OUTPUT, response)
+        return {"response": response}
+    return ls_target
+
+
+def build_evaluators(batch_size):
+    """
+    Return the (evaluators, summary_evaluators) for an experiment. The local
+    reference metrics are always computed, for the whole experiment at once.
+    With the judge cascade, the criteria in JUDGE_CRITERIA go to the large judge
+    only when the check and the small judge cannot settle them. With the fused
+    judge, they are scored in one request per example; otherwise with a batch
+    size, helpfulness is judged for K examples per request by a summary evaluator.
+    """
+    if judge_cascade:
+        return [concision, create_cascade_judge(judge_criteria)], [reference_metrics]
+    if judge_fused:
+        return [concision, create_fused_judge(judge_criteria)], [reference_metrics]
+    if batch_size > 0:
+        return [concision], [create_batched_helpfulness(batch_size), reference_metrics]
+    return [concision, helpfulness], [reference_metrics]
 
-        target_func = create_ls_target(PROVIDER, MODEL_NAME, API_KEY)
 
+def pending_examples(experiment, dataset_name, examples=None):
+    """
+    Return the examples of `dataset_name` (or of its subset `examples`) that have
+    no successful run in `experiment` yet. A run without a response is pending too.
+    """
+    client = get_ls_client()
+    finished = {
+        run.reference_example_id
+        for run in client.list_runs(project_name=experiment, is_root=True, error=False)
+        if has_output(run)
+    }
+    if examples is None:
+        examples = client.list_examples(dataset_name=dataset_name)
+    return [example for example in examples if example.id not in finished]
+
+
+async def run_model_eval(model_config, semaphore, concurrency, batch_size=0, resume=False, examples=None):
+    """
+    Run the eval for one model in MODELS_TO_TEST.
+    When resuming, the model's journaled experiment is extended with only the
+    examples it does not have yet. With `examples`, only that subset of the
+    dataset is run.
+    """
+    provider = model_config["provider"]
+    model_name = model_config["model_name"]
+    api_key = model_config["api_key"]
+
+    target_func = create_async_ls_target(provider, model_name, api_key, semaphore)
+    cell = (ENDPOINT_NAME, provider, model_name)
+    evaluators, summary_evaluators = build_evaluators(batch_size)
+    evaluators = [time_evaluator(journal_evaluator(evaluator, cell), cell) for evaluator in evaluators]
+    summary_evaluators = [time_evaluator(evaluator, cell) for evaluator in summary_evaluators]
+
+    log.info(
+        "Running evaluation for [bold blue]%s[/bold blue] - [bold green]%s[/bold green] - %s",
+        provider,
+        model_name,
+        api_key,
+    )
+    dataset_name = get_dataset().name
+    data = dataset_name if examples is None else examples
+    experiment_args = {"experiment_prefix": f"{ENDPOINT_NAME}-{provider}-{model_name}"}
+    journaled_experiment = run_journal.experiment(cell) if resume else None
+    if journaled_experiment is not None:
+        try:
+            data = pending_examples(journaled_experiment, dataset_name, examples)
+            experiment_args = {"experiment": journaled_experiment}
+        except LangSmithNotFoundError:
+            log.warning("Experiment %s no longer exists, starting a new one", journaled_experiment)
+        else:
+            log.info(
+                "Resuming %s: %d example(s) left, %d journaled",
+                journaled_experiment,
+                len(data),
+                run_journal.finished(cell),
+            )
+            if not data:
+                return None
+    return await get_ls_client().aevaluate(
+        target_func,  # your target function
+        data=data,  # dataset name, or the examples of the subset or left when resuming
+        evaluators=evaluators,  # list of evaluator funcs
+        summary_evaluators=summary_evaluators,  # experiment-level (batched) evaluators
+        metadata={
+            "llm.provider": provider,
+            "llm.model": model_name,
+        },
+        max_concurrency=concurrency,
+        **experiment_args,  # new experiment name in LangSmith, or the one being resumed
+    )
+
+
+async def run_evals(concurrency, batch_size=0, resume=False, subset="full"):
+    """
+    Run the eval for every model in MODELS_TO_TEST at once, with up to
+    `concurrency` Langflow calls in flight and per-provider limits applied.
+    Without `resume` the checkpoint journal is cleared first. A `subset` other
+    than "full" runs only its stratified sample of the dataset.
+    """
+    if not resume:
+        run_journal.reset()
+    examples = None
+    if subset != "full":
+        examples = langsmith_subset(get_ls_client(), get_dataset(), subset, subset_cache, subset_strata)
+        log.info("Running the %s subset: %d example(s)", subset, len(examples))
+    semaphore = asyncio.Semaphore(concurrency)
+    cells = [(model_config["provider"], model_config["model_name"]) for model_config in MODELS_TO_TEST]
+    models = dict(zip(cells, MODELS_TO_TEST))
+
+    async def run_cell(cell):
+        return await run_model_eval(models[cell], semaphore, concurrency, batch_size, resume, examples)
+
+    await run_matrix(cells, run_cell, log)
+    await langflow_async_client.aclose()
+    response_cache.close()
+    run_journal.close()
+
+
+def flush_traces():
+    """
+    Wait for the remaining LangSmith traces to be exported, recording
+    how long it took as the `trace_export` phase.
+    """
+    start = time.perf_counter()
+    get_ls_client().flush()
+    latency_report.record((ENDPOINT_NAME, "all", "all"), "trace_export", time.perf_counter() - start)
+
+
+def cleanup_run_sessions(cleanup, concurrency):
+    """
+    Delete the Langflow sessions this run created, or tell how to delete them later.
+    """
+    session_registry.flush()
+    if cleanup:
+        deleted, failed = delete_run_sessions(langflow_client, session_registry, concurrency=concurrency)
+        log.info("Deleted %d Langflow session(s) of run %s, %d failed", deleted, session_registry.run_id, failed)
+    else:
         log.info(
-            "Running evaluation for [bold blue]%s[/bold blue] - [bold green]%s[/bold green] - %s",
-            PROVIDER,
-            MODEL_NAME,
-            API_KEY,
+            "Langflow sessions of this run are registered as run %s. Delete them with: "
+            "python utils/delete_sessions.py --run %s --registry %s",
+            session_registry.run_id,
+            session_registry.run_id,
+            os.path.abspath(session_registry.path),
         )
-        experiment_results = ls_client.evaluate(
-            target_func,  # your target function
-            data=dataset.name,  # dataset name or ID
-            evaluators=[concision, helpfulness],  # list of evaluator funcs
-            metadata={
-                "llm.provider": PROVIDER,
-                "llm.model": MODEL_NAME,
-            },
-            experiment_prefix=f"{ENDPOINT_NAME}-{PROVIDER}-{MODEL_NAME}"  # experiment name in LangSmith
+    session_registry.close()
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Run LangSmith evals against a Langflow agent.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=langflow_concurrency,
+        help=f"Maximum number of Langflow calls in flight (default: {langflow_concurrency})"
+    )
+    parser.add_argument(
+        "--cache",
+        choices=CACHE_MODES,
+        default=langflow_cache_mode,
+        help=(
+            "Langflow response cache mode: 'read' serves and stores cached responses, "
+            "'write' refreshes them, 'off' bypasses the cache "
+            f"(default: {langflow_cache_mode})"
+        )
+    )
+    parser.add_argument(
+        "--stream",
+        action=argparse.BooleanOptionalAction,
+        default=langflow_stream,
+        help="Use Langflow's streaming run API and record time-to-first-token (default: LANGFLOW_STREAM)"
+    )
+    parser.add_argument(
+        "--judge-batch-size",
+        type=int,
+        default=judge_batch_size,
+        help=(
+            "Score helpfulness for this many examples per judge request, "
+            f"0 for one request per example (default: {judge_batch_size})"
+        )
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the previous run: skip finished examples and replay journaled results into the same experiments"
+    )
+    parser.add_argument(
+        "--subset",
+        choices=SUBSETS,
+        default=dataset_subset,
+        help=(
+            "Run a stratified, stable sample of the dataset: 'smoke' (5%%), 'medium' (25%%) "
+            f"or 'full' (default: {dataset_subset})"
         )
+    )
+    parser.add_argument(
+        "--cleanup-sessions",
+        action=argparse.BooleanOptionalAction,
+        default=cleanup_sessions,
+        help="Delete the Langflow sessions this run created when it finishes (default: LANGFLOW_CLEANUP_SESSIONS)"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    response_cache.mode = args.cache
+    langflow_streamer.enabled = args.stream
+    log.info("\n[bold]Starting LangSmith Evals...[/bold]")
+    asyncio.run(run_evals(args.concurrency, args.judge_batch_size, args.resume, args.subset))
+    cleanup_run_sessions(args.cleanup_sessions, args.concurrency)
+    langflow_client.close()
+    flush_traces()
+    latency_report.print_table()
+    token_accountant.print_table()
+    cascade_stats.print_table()
@@ -2,17 +2,30 @@
 This file contains the configuration for the Single vs Multi Agent evaluation.
 """
 import os
+import sys
 import logging
+from functools import lru_cache
+import httpx
 from rich.logging import RichHandler
 from rich.console import Console
 from dotenv import load_dotenv
-from openevals.llm import create_llm_as_judge
-from openevals.prompts import (
-    CORRECTNESS_PROMPT,
-    CONCISENESS_PROMPT,
-    HALLUCINATION_PROMPT
-)
-from langsmith import Client as LSClient
+
+# The modules shared by every harness live in the evals_common package at the repository root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+# pylint: disable=wrong-import-position
+from evals_common.judge_cache import JudgeCache
+from evals_common.fused_judge import SharedVerdicts, fan_out, fused_schema, parse_criteria, render_prompt
+from evals_common.cascade import JudgeCascade, cascade_stats, parse_band, reference_check
+from evals_common.journal import RunJournal
+from evals_common.session_registry import SessionRegistry
+from evals_common.subset import SUBSET_FRACTIONS, SubsetCache
+from evals_common.resilience import Resilience, RetryPolicy
+from evals_common.scheduler import ProviderLimiters
+from evals_common.tokens import TokenAccountant
+from math_check import DEFAULT_TOLERANCE, check_math
+# pylint: enable=wrong-import-position
 
 # Load environment variables from .env file
 load_dotenv()
@@ -23,35 +36,290 @@ langchain_project = os.getenv("LANGCHAIN_PROJECT")
 langflow_api_key = os.getenv("LANGFLOW_API_KEY")
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
-# initialize clients
-ls_client = LSClient(auto_batch_tracing=True)
+# Langflow connection settings
+langflow_url = os.getenv("LANGFLOW_URL", "http://localhost:7860")
+langflow_pool_size = int(os.getenv("LANGFLOW_POOL_SIZE", "10"))
+langflow_http2 = os.getenv("LANGFLOW_HTTP2", "false").lower() == "true"
+# Maximum number of Langflow calls in flight at once (overridable with --concurrency)
+langflow_concurrency = int(os.getenv("LANGFLOW_CONCURRENCY", "8"))
+
+# Retries of transient Langflow and judge failures (jittered exponential backoff),
+# and the circuit breaker that fails calls fast after consecutive failures
+retry_attempts = int(os.getenv("RETRY_ATTEMPTS", "4"))
+retry_base_delay = float(os.getenv("RETRY_BASE_DELAY", "0.5"))  # seconds
+retry_max_delay = float(os.getenv("RETRY_MAX_DELAY", "30"))  # seconds
+circuit_failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+circuit_reset_seconds = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Streaming run API settings (overridable with --stream). A streamed run is
+# cancelled once it exceeds the time or token-event budget (0 = unbounded).
+langflow_stream = os.getenv("LANGFLOW_STREAM", "false").lower() == "true"
+langflow_stream_max_seconds = float(os.getenv("LANGFLOW_STREAM_MAX_SECONDS", "300")) or None
+langflow_stream_max_tokens = int(os.getenv("LANGFLOW_STREAM_MAX_TOKENS", "0")) or None
+
+# Langflow response cache settings (mode overridable with --cache read|write|off)
+langflow_cache_mode = os.getenv("LANGFLOW_CACHE", "off")
+langflow_cache_path = os.getenv("LANGFLOW_CACHE_PATH", ".langflow_cache/responses.sqlite3")
+langflow_cache_ttl = float(os.getenv("LANGFLOW_CACHE_TTL", str(7 * 24 * 60 * 60)))  # seconds
+langflow_cache_max_mb = float(os.getenv("LANGFLOW_CACHE_MAX_MB", "256"))
+
+# LLM-as-judge verdict cache settings (read|write|off)
+judge_cache_mode = os.getenv("JUDGE_CACHE", "read")
+judge_cache_path = os.getenv("JUDGE_CACHE_PATH", ".langflow_cache/judges.sqlite3")
+judge_cache_max_mb = float(os.getenv("JUDGE_CACHE_MAX_MB", "64"))
+
+# Fused LLM-as-judge: score every criterion in one structured-output request per example
+judge_fused = os.getenv("JUDGE_FUSED", "false").lower() == "true"
+judge_criteria = parse_criteria(os.getenv("JUDGE_CRITERIA") or "correctness,conciseness,hallucination")
+
+# Judge cascade: deterministic check, then the small judge, then the large judge only
+# for scores inside the uncertainty band (low,high on the 0-1 scale)
+judge_cascade = os.getenv("JUDGE_CASCADE", "false").lower() == "true"
+judge_small_model = os.getenv("JUDGE_SMALL_MODEL", "openai:gpt-5-nano")
+judge_cascade_band = parse_band(os.getenv("JUDGE_CASCADE_BAND", "0.3,0.7"))
+
+# Paired mode: each example is sent to every endpoint at once, and the endpoints are
+# compared example by example (overridable with --paired)
+paired_mode = os.getenv("PAIRED_MODE", "false").lower() == "true"
+paired_wait_seconds = float(os.getenv("PAIRED_WAIT_SECONDS", "300"))  # longest wait for the other endpoints
+
+# Adaptive comparison: paired mode that stops once every endpoint's correctness and
+# latency differences against the first endpoint are settled (overridable with --adaptive)
+adaptive_mode = os.getenv("ADAPTIVE_MODE", "false").lower() == "true"
+adaptive_confidence = float(os.getenv("ADAPTIVE_CONFIDENCE", "0.95"))
+adaptive_min_pairs = int(os.getenv("ADAPTIVE_MIN_PAIRS", "20"))
+adaptive_score_margin = float(os.getenv("ADAPTIVE_SCORE_MARGIN", "0.05"))  # equivalence margin of correctness
+adaptive_latency_margin = float(os.getenv("ADAPTIVE_LATENCY_MARGIN", "1.0"))  # equivalence margin in seconds
+adaptive_seed = int(os.getenv("ADAPTIVE_SEED")) if os.getenv("ADAPTIVE_SEED") else None
+
+# Stratified subset a run is limited to: smoke, medium or full (overridable with --subset).
+# Examples are stratified by these metadata keys, where "length" buckets the question
+dataset_subset = os.getenv("SUBSET", "full")
+if dataset_subset not in SUBSET_FRACTIONS:
+    raise ValueError(f"Invalid SUBSET '{dataset_subset}', expected one of {', '.join(SUBSET_FRACTIONS)}")
+subset_strata = tuple(
+    key.strip() for key in os.getenv("SUBSET_STRATA", "Unit,Rounding,length").split(",") if key.strip()
+)
+subset_cache_path = os.getenv("SUBSET_CACHE_PATH", ".langflow_cache/subsets.json")  # ids chosen per subset
+
+# Local math checker: grade answers with a readable final number without the judge
+math_check = os.getenv("MATH_CHECK", "true").lower() == "true"
+math_check_tolerance = float(os.getenv("MATH_CHECK_TOLERANCE", str(DEFAULT_TOLERANCE)))  # relative
+
+# Checkpoint journal of finished examples, replayed by a run started with --resume
+run_journal_path = os.getenv("RUN_JOURNAL_PATH", ".langflow_cache/journal.sqlite3")
+
+# Registry of the Langflow sessions each run creates, and whether a run deletes
+# its own sessions when it finishes (overridable with --cleanup-sessions)
+session_registry_path = os.getenv("SESSION_REGISTRY_PATH", ".langflow_cache/sessions.sqlite3")
+cleanup_sessions = os.getenv("LANGFLOW_CLEANUP_SESSIONS", "false").lower() == "true"
+
+# Clients and judges are created on first use, so importing this module makes
+# no network calls and does not pay for the LangSmith and openevals/LangChain imports.
+@lru_cache(maxsize=None)
+def get_ls_client():
+    """Return the LangSmith client, which is also the one `@traceable` runs are sent with."""
+    # pylint: disable=import-outside-toplevel
+    from langsmith.run_trees import get_cached_client
+    return get_cached_client(auto_batch_tracing=True)
+
+
+# Pooled, keep-alive HTTP clients shared by every Langflow call so that
+# examples reuse open connections instead of paying a new TCP/TLS handshake.
+langflow_client_settings = {
+    "base_url": langflow_url,
+    "headers": {"x-api-key": langflow_api_key} if langflow_api_key else {},
+    "limits": httpx.Limits(
+        max_connections=langflow_pool_size,
+        max_keepalive_connections=langflow_pool_size,
+    ),
+    "http2": langflow_http2,
+}
+langflow_client = httpx.Client(**langflow_client_settings)
+langflow_async_client = httpx.AsyncClient(**langflow_client_settings)
+
+# Shared cache of LLM-as-judge verdicts, so unchanged outputs are never re-judged
+judge_cache = JudgeCache(
+    judge_cache_path,
+    mode=judge_cache_mode,
+    max_bytes=int(judge_cache_max_mb * 1024 * 1024),
+)
+
+# Shared checkpoint journal, so an interrupted run can be resumed where it stopped
+run_journal = RunJournal(run_journal_path)
+
+# Cache of the example ids chosen for each subset
+subset_cache = SubsetCache(subset_cache_path)
+
+# Registry of the sessions created by this run, tagged with its run id
+session_registry = SessionRegistry(session_registry_path)
 
 # Initialize evaluators
-if openai_api_key:
+JUDGE_MODEL = "openai:gpt-5-mini"
 
-    # Create the evaluators
-    CORRECTNESS_EVALUATOR = create_llm_as_judge(
-        prompt=CORRECTNESS_PROMPT,
-        feedback_key="correctness",
-        model="openai:gpt-5-mini",
-    )
 
-    CONCISENESS_EVALUATOR = create_llm_as_judge(
-        prompt=CONCISENESS_PROMPT,
-        feedback_key="conciseness",
-        model="openai:gpt-5-mini",
-    )
+@lru_cache(maxsize=None)
+def get_evaluators():
+    """
+    Return the (correctness, conciseness, hallucination) LLM-as-judge evaluators,
+    caching their verdicts, or Nones when no OpenAI key is set. With the fused
+    judge, the criteria in `judge_criteria` share one judge request per example.
+    With `math_check`, correctness is graded locally whenever it can be, and with
+    `judge_cascade` the small judge settles every example it is confident about.
+    """
+    if not openai_api_key:
+        return None, None, None
+    # pylint: disable=import-outside-toplevel
+    from openevals.llm import create_llm_as_judge
+    from openevals.prompts import CORRECTNESS_PROMPT, CONCISENESS_PROMPT, HALLUCINATION_PROMPT
+
+    def cached_judge(prompt, feedback_key, model=JUDGE_MODEL, **kwargs):
+        # Judge calls retry transient failures; verdicts are cached on success
+        return judge_cache.wrap(
+            with_retries(
+                create_llm_as_judge(prompt=prompt, feedback_key=feedback_key, model=model, **kwargs),
+                "judge",
+                model,
+            ),
+            model=model,
+            prompt_template=prompt,
+        )
+
+    def fused_judges(model, criteria):
+        # One evaluator per criterion, all reading the verdict of one structured-output request
+        fused_prompt = render_prompt(criteria)
+        fused = cached_judge(fused_prompt, "fused", model, output_schema=fused_schema(criteria))
+        verdicts = SharedVerdicts(len(criteria))
+
+        def criterion_judge(name):
+            def evaluator(*, inputs=None, outputs=None, reference_outputs=None, **kwargs):
+                rendered = {"inputs": inputs, "outputs": outputs, "reference_outputs": reference_outputs, **kwargs}
+                verdict = verdicts.get(
+                    judge_cache.make_judge_key(model, fused_prompt, rendered),
+                    lambda: fused(inputs=inputs, outputs=outputs, reference_outputs=reference_outputs, **kwargs),
+                )
+                results = fan_out(verdict, (name,))
+                if not results:
+                    raise ValueError(f"The fused judge returned no '{name}' score")
+                return results[0]
+            evaluator.__name__ = f"{name}_evaluator"
+            return evaluator
 
-    HALLUCINATION_EVALUATOR = create_llm_as_judge(
-        prompt=HALLUCINATION_PROMPT,
-        feedback_key="hallucination",
-        model="openai:gpt-5-mini",
+        return {name: criterion_judge(name) for name in criteria}
+
+    prompts = {
+        "correctness": CORRECTNESS_PROMPT,
+        "conciseness": CONCISENESS_PROMPT,
+        "hallucination": HALLUCINATION_PROMPT,
+    }
+    if judge_cascade:
+        # Both stages score from 0.0 to 1.0, so the uncertainty band applies to them
+        def structured_judges(model):
+            judges = fused_judges(model, judge_criteria) if judge_fused else {}
+            for name in prompts:
+                if name not in judges:
+                    judges[name] = fused_judges(model, (name,))[name]
+            return judges
+
+        small, large = structured_judges(judge_small_model), structured_judges(JUDGE_MODEL)
+        correctness, conciseness, hallucination = (cascade_judge(name, small[name], large[name]) for name in prompts)
+        return correctness, conciseness, hallucination
+    if not judge_fused:
+        correctness, conciseness, hallucination = (cached_judge(prompt, name) for name, prompt in prompts.items())
+        return math_first(correctness), conciseness, hallucination
+
+    judges = fused_judges(JUDGE_MODEL, judge_criteria)
+    correctness, conciseness, hallucination = (
+        with_test_feedback(judges[name]) if name in judges else cached_judge(prompt, name)
+        for name, prompt in prompts.items()
     )
-else:
-    # If no OpenAI key, set evaluators to None
-    CORRECTNESS_EVALUATOR = None
-    CONCISENESS_EVALUATOR = None
-    HALLUCINATION_EVALUATOR = None
+    return math_first(correctness), conciseness, hallucination
+
+
+def with_test_feedback(judge):
+    """Wrap an evaluator so its result is logged as feedback of the current LangSmith test."""
+    def evaluator(**kwargs):
+        result = judge(**kwargs)
+        log_test_feedback(result)
+        return result
+    evaluator.__name__ = judge.__name__
+    return evaluator
+
+
+def cascade_judge(name, small, large):
+    """
+    Chain the stages of one criterion: the math check for correctness (or the
+    empty/identical answer check), then the `small` judge, and the `large` judge
+    only when the small judge's score falls inside `judge_cascade_band`.
+    """
+    cascade = JudgeCascade(name, judge_cascade_band, cascade_stats)
+
+    def evaluator(*, inputs=None, outputs=None, reference_outputs=None, metadata=None, **kwargs):
+        if metadata is None and isinstance(inputs, dict):
+            metadata = inputs.get("metadata")
+        judge_kwargs = {"inputs": inputs, "outputs": outputs, "reference_outputs": reference_outputs, **kwargs}
+
+        def check():
+            if name == "correctness" and math_check:
+                return check_math(outputs, reference_outputs, metadata, math_check_tolerance)
+            return reference_check(name, outputs, reference_outputs)
+
+        result = cascade.run([
+            ("check", check),
+            ("small", lambda: small(**judge_kwargs)),
+            ("large", lambda: large(**judge_kwargs)),
+        ])
+        log_test_feedback(result)
+        return result
+    evaluator.__name__ = f"{name}_evaluator"
+    return evaluator
+
+
+def math_first(judge):
+    """
+    Wrap a correctness judge with the local math checker. Only answers it cannot
+    read a number from reach the judge. The example's Unit and Rounding come from
+    `metadata`, or from the "metadata" of the inputs when they are a dict.
+    """
+    if not math_check:
+        return judge
+
+    def evaluator(*, inputs=None, outputs=None, reference_outputs=None, metadata=None, **kwargs):
+        if metadata is None and isinstance(inputs, dict):
+            metadata = inputs.get("metadata")
+        result = check_math(outputs, reference_outputs, metadata, math_check_tolerance)
+        if result is None:
+            return judge(inputs=inputs, outputs=outputs, reference_outputs=reference_outputs, **kwargs)
+        log_test_feedback(result)
+        return result
+    evaluator.__name__ = getattr(judge, "__name__", "correctness_evaluator")
+    return evaluator
+
+
+def log_test_feedback(result):
+    """Log an evaluator result as feedback of the current @pytest.mark.langsmith test, if any."""
+    # pylint: disable=import-outside-toplevel
+    from langsmith import testing
+    try:
+        testing.log_feedback(key=result["key"], score=result["score"], comment=result["comment"])
+    except ValueError:
+        pass  # not inside a LangSmith-tracked test
+
+
+# Lazily created attributes, so `config.ls_client` and the evaluator constants keep working
+LAZY_ATTRIBUTES = {
+    "ls_client": get_ls_client,
+    "CORRECTNESS_EVALUATOR": lambda: get_evaluators()[0],
+    "CONCISENESS_EVALUATOR": lambda: get_evaluators()[1],
+    "HALLUCINATION_EVALUATOR": lambda: get_evaluators()[2],
+}
+
+
+def __getattr__(name):
+    """Create a lazily initialized client or evaluator the first time it is accessed."""
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # A list of models to test for single vs multi agent comparison
 # The `provider` should match the provider name in Langflow.
@@ -98,6 +366,34 @@ MODELS_TO_TEST = [
     #}
 ]
 
+# Per-provider limits used by the matrix scheduler so that a slow or throttled
+# provider does not hold up the others. `concurrency` is the starting number of
+# calls in flight; it adapts (AIMD) between 1 and `max_concurrency` (default:
+# `concurrency`) as calls succeed, fail or slow down. `requests_per_minute` and
+# `tokens_per_minute` cap throughput (None = unlimited).
+PROVIDER_LIMITS = {
+    "OpenAI": {
+        "concurrency": 8,
+        "max_concurrency": 16,
+        "requests_per_minute": 500,
+        "tokens_per_minute": 200000,
+    },
+    "Google Generative AI": {
+        "concurrency": 8,
+        "max_concurrency": 16,
+        "requests_per_minute": 300,
+        "tokens_per_minute": 250000,
+    },
+    "Anthropic": {
+        "concurrency": 4,
+        "max_concurrency": 8,
+        "requests_per_minute": 50,
+        "tokens_per_minute": 40000,
+    },
+    "Qwen": {"concurrency": 2},  # local model server
+}
+DEFAULT_PROVIDER_LIMITS = {"concurrency": 4, "requests_per_minute": None, "tokens_per_minute": None}
+
 # ==============================================================================
 # LOGGING
 # ==============================================================================
@@ -115,7 +411,7 @@ console_handler = RichHandler(
 )
 
 # CREATE A FILE HANDLER FOR DETAILED DEBUG LOGS
-file_handler = logging.FileHandler("single_vs_multi_agent_eval.log")
+file_handler = logging.FileHandler("single_vs_multi_agent_eval.log", delay=True)  # opened on the first record
 file_handler.setLevel(logging.DEBUG)
 
 # CREATE A FORMATTER FOR THE FILE HANDLER
@@ -125,4 +421,21 @@ file_handler.setFormatter(formatter)
 # ADD THE HANDLERS TO THE LOGGER
 log.addHandler(console_handler)
 log.addHandler(file_handler)
+
+# ==============================================================================
+# RETRIES, PROVIDER LIMITS AND TOKEN ACCOUNTING
+# ==============================================================================
+# The shared modules take this harness's settings and logger; everything else imports these from here
+resilience = Resilience(
+    RetryPolicy(retry_attempts, retry_base_delay, retry_max_delay),
+    circuit_failure_threshold,
+    circuit_reset_seconds,
+    log,
+)
+call_with_retries, acall_with_retries = resilience.call, resilience.acall
+get_circuit_breaker, with_retries = resilience.circuit_breaker, resilience.wrap
+provider_limiters = ProviderLimiters(PROVIDER_LIMITS, DEFAULT_PROVIDER_LIMITS, log)
+get_provider_limiter = provider_limiters.get
+# Token counts of the current run, shared by every call in the harness
+token_accountant = TokenAccountant(log=log)
 # ==============================================================================
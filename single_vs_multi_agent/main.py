@@ -2,17 +2,61 @@
 This script runs single vs multi agent evaluations
 and compares their performance using LangSmith.
 """
+import argparse
+import asyncio
+import os
+import time
 import uuid
 import logging
-import requests
 from rich.logging import RichHandler
 from rich.console import Console
-from langsmith import traceable
+from langsmith import traceable, get_current_run_tree
+from langsmith.utils import LangSmithNotFoundError
 from config import (
-    ls_client, # LangSmith client
-    langflow_api_key, # LangFlow API key
+    get_ls_client, # LangSmith client
+    langflow_client, # Pooled Langflow HTTP client
+    langflow_async_client, # Pooled async Langflow HTTP client
+    langflow_concurrency, # Default number of Langflow calls in flight
+    langflow_stream, # Default for streaming Langflow runs
+    langflow_stream_max_seconds, # Time budget of a streamed run
+    langflow_stream_max_tokens, # Token-event budget of a streamed run
+    langflow_cache_mode, # Default Langflow response cache mode
+    langflow_cache_path, # Langflow response cache location
+    langflow_cache_ttl, # Langflow response cache TTL in seconds
+    langflow_cache_max_mb, # Langflow response cache size limit
     log, # Rich-formatted logger
     MODELS_TO_TEST, # List of models to test
+    run_journal, # Checkpoint journal of finished examples
+    session_registry, # Registry of the Langflow sessions this run creates
+    cleanup_sessions, # Default for deleting this run's sessions at the end
+    paired_mode, # Default for sending each example to every endpoint at once
+    paired_wait_seconds, # Longest wait of an endpoint for the others in paired mode
+    adaptive_mode, # Default for stopping the paired comparison once it is settled
+    adaptive_confidence, # Confidence level of the adaptive comparison
+    adaptive_min_pairs, # Pairs compared before the adaptive comparison may stop
+    adaptive_score_margin, # Correctness difference within which endpoints are equivalent
+    adaptive_latency_margin, # Latency difference within which endpoints are equivalent
+    adaptive_seed, # Seed of the adaptive comparison's example order
+    dataset_subset, # Default subset of the dataset to run
+    subset_strata, # Metadata keys the subsets are stratified by
+    subset_cache, # Cache of the example ids chosen for each subset
+    resilience, # Retry policy and circuit breakers
+    provider_limiters, # Per-provider limiters
+    get_provider_limiter, # Shared limiter of a provider
+    token_accountant, # Token counts of the current run
+)
+from evals_common.response_cache import NOT_LOOKED_UP, ResponseCache, CACHE_MODES
+from evals_common.streaming import LangflowStreamer
+from evals_common.phases import latency_report
+from evals_common.langflow import LangflowHooks, LangflowRunner
+from evals_common.journal import OUTPUT, example_key
+from evals_common.session_registry import delete_run_sessions
+from paired import PairedComparison, create_paired_evaluator
+from sequential import AdaptiveStopping
+from evals_common.subset import SUBSETS, langsmith_subset
+from evals_common.scheduler import ( # Matrix scheduler with per-provider limits
+    estimate_tokens,
+    run_matrix,
 )
 
 # Create a minimal app logger for clean output
@@ -34,70 +78,249 @@ app_log.addHandler(minimal_handler)
 # Prevent propagation to parent logger to avoid duplicate output
 app_log.propagate = False
 
-# Load the Math Dataset for evaluation
-dataset = ls_client.read_dataset(dataset_name="Math Dataset")
+# Math Dataset used for evaluation, resolved by LangSmith when the experiment starts
+DATASET_NAME = "Math Dataset"
 
 # Configuration for single vs multi agent comparison
 AGENT_ID = "Agent-AQzDw"
 ENDPOINT_NAMES = ["math_eval_single_lms", "math_eval_noexp_lms", "math_eval_multi_lms"]
 
-@traceable(name="langflow_agent_run_api", client=ls_client)
-def call_langflow_api(input_value, provider, model_name, api_key, endpoint_name):
+
+# Persistent cache of Langflow responses (mode set with --cache)
+response_cache = ResponseCache(
+    langflow_cache_path,
+    mode=langflow_cache_mode,
+    ttl=langflow_cache_ttl,
+    max_bytes=int(langflow_cache_max_mb * 1024 * 1024),
+)
+
+# Streaming Langflow runs with time-to-first-token timings (enabled with --stream)
+langflow_streamer = LangflowStreamer(
+    enabled=langflow_stream,
+    max_seconds=langflow_stream_max_seconds,
+    max_tokens=langflow_stream_max_tokens,
+)
+
+def build_tweaks(provider, model_name, api_key):
     """
-    Call the Langflow API to run the specified endpoint.
+    Build the agent tweaks that select the provider and model in Langflow.
     """
-    app_log.debug("call_langflow_api input_value: %s", input_value)
+    return {
+        AGENT_ID: {
+            "agent_llm": provider,
+            "model_name": model_name,
+            "api_key": api_key
+        }
+    }
 
-    # API Configuration
-    url = f"http://localhost:7860/api/v1/run/{endpoint_name}"
 
-    # Request payload configuration
-    payload = {
+def build_payload(input_value, provider, model_name, api_key):
+    """
+    Build the Langflow run API request payload for one input.
+    """
+    return {
         "output_type": "chat",
         "input_type": "chat",
         "input_value": input_value,
         "session_id": str(uuid.uuid4()),
-        "tweaks": {
-            AGENT_ID: {
-                "agent_llm": provider,
-                "model_name": model_name,
-                "api_key": api_key
-            }
-        }
+        "tweaks": build_tweaks(provider, model_name, api_key)
     }
 
-    # Request headers
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": langflow_api_key
-    }
 
-    try:
-        # Send API request
-        result = requests.request("POST", url, json=payload, headers=headers, timeout=300)
-        result.raise_for_status()
-
-        response_json = result.json()
-        output = (
-            response_json.get("outputs")[0]
-            .get("outputs")[0]
-            .get("results")
-            .get("message")
-            .get("data")
-            .get("text")
-        )
-        app_log.debug("call_langflow_api output: %s", output)
-        return output
+def cache_key(input_value, provider, model_name, api_key, endpoint_name):
+    """
+    Build the response cache key for one Langflow request.
+    """
+    tweaks = build_tweaks(provider, model_name, api_key)
+    return ResponseCache.make_key(endpoint_name, tweaks, provider, model_name, input_value)
+
+
+def mark_run_resumed():
+    """
+    Mark the current LangSmith run as replayed from the checkpoint journal.
+    """
+    run_tree = get_current_run_tree()
+    if run_tree is not None:
+        run_tree.add_metadata({"resumed": True})
+
+
+def journal_experiment(cell):
+    """
+    Record the LangSmith experiment of the current run as the one `cell` is sent to.
+    """
+    run_tree = get_current_run_tree()
+    if run_tree is not None and run_tree.session_name:
+        run_journal.set_experiment(cell, run_tree.session_name)
+
+
+def register_session(endpoint_name, payload):
+    """
+    Register the session of a Langflow request under this run, tagged with
+    the LangSmith experiment of the current run.
+    """
+    run_tree = get_current_run_tree()
+    experiment = run_tree.session_name if run_tree is not None else None
+    session_registry.add(endpoint_name, payload["session_id"], experiment)
+
+
+def mark_run_cached(cached):
+    """
+    Mark the current LangSmith run as served from the response cache (or not).
+    """
+    run_tree = get_current_run_tree()
+    if run_tree is not None:
+        run_tree.add_metadata({"cached": cached})
+
+
+def record_stream_timings(timings):
+    """
+    Record time-to-first-token, inter-token latency and total time of a
+    streamed run on the current LangSmith run.
+    """
+    run_tree = get_current_run_tree()
+    if run_tree is not None:
+        run_tree.add_metadata({f"stream.{name}": value for name, value in timings.metrics().items()})
+
+
+def record_token_usage(counts):
+    """
+    Record the token counts of a Langflow call on the current LangSmith run.
+    """
+    run_tree = get_current_run_tree()
+    if run_tree is not None:
+        run_tree.add_metadata({
+            "usage_metadata": {
+                "input_tokens": counts["prompt_tokens"],
+                "output_tokens": counts["completion_tokens"],
+                "total_tokens": counts["total_tokens"],
+            },
+            "token_source": counts["source"],
+        })
+
+
+def parse_output(response_json):
+    """
+    Extract the chat message text from a Langflow run API response.
+    """
+    return (
+        response_json.get("outputs")[0]
+        .get("outputs")[0]
+        .get("results")
+        .get("message")
+        .get("data")
+        .get("text")
+    )
+
+
+class LangSmithHooks(LangflowHooks):
+    """
+    Record each Langflow call on the current LangSmith run: whether it was cached,
+    its session, its stream and phase timings and its token counts.
+    """
+
+    def cached(self, cell, counts):
+        mark_run_cached(True)
+        record_token_usage(counts)
+
+    def sent(self, cell, payload):
+        mark_run_cached(False)
+        register_session(cell[0], payload)
+
+    def streamed(self, cell, timings):
+        record_stream_timings(timings)
+
+    def finished(self, cell, timer, counts):
+        run_tree = get_current_run_tree()
+        if run_tree is not None:
+            run_tree.add_metadata(timer.metadata())
+        record_token_usage(counts)
+
+
+# Request, stream, parse, retry and cache path of every Langflow call
+langflow_runner = LangflowRunner(
+    langflow_streamer,
+    resilience,
+    provider_limiters,
+    token_accountant,
+    parse_output,
+    hooks=LangSmithHooks(),
+    timeout=300,
+    log=log,
+)
 
-    except requests.exceptions.RequestException as e:
-        log.error("Error making API request: %s", e)
-        return f"API Error: {str(e)}"
-    except (KeyError, IndexError, AttributeError, ValueError, TypeError) as e:
-        log.error("Error parsing API response: %s", e)
-        return f"Response parsing error: {str(e)}"
-    except Exception as e:
-        log.error("Unexpected error: %s", e)
-        return f"Unexpected error: {str(e)}"
+
+@traceable(name="langflow_agent_run_api")
+def call_langflow_api(input_value, provider, model_name, api_key, endpoint_name):
+    """
+    Call the Langflow API to run the specified endpoint.
+    Raises LangflowCallError when the call failed after its retries.
+    """
+    return langflow_runner.call(
+        langflow_client,
+        response_cache,
+        (endpoint_name, provider, model_name),
+        input_value,
+        build_payload(input_value, provider, model_name, api_key),
+        cache_key(input_value, provider, model_name, api_key, endpoint_name),
+    )
+
+
+def trace_inputs(inputs):
+    """Leave the response the caller already looked up out of the traced inputs of a Langflow call."""
+    return {name: value for name, value in inputs.items() if name != "cached"}
+
+
+@traceable(name="langflow_agent_run_api", process_inputs=trace_inputs)
+async def acall_langflow_api(input_value, provider, model_name, api_key, endpoint_name, cached=NOT_LOOKED_UP):
+    """
+    Async version of call_langflow_api using the pooled async Langflow client.
+    `cached` is the response the caller already looked up in the response cache
+    (None on a miss); by default it is looked up here, off the event loop.
+    """
+    return await langflow_runner.acall(
+        langflow_async_client,
+        response_cache,
+        (endpoint_name, provider, model_name),
+        input_value,
+        build_payload(input_value, provider, model_name, api_key),
+        cache_key(input_value, provider, model_name, api_key, endpoint_name),
+        cached=cached,
+    )
+
+
+def enhance_question(inputs: dict):
+    """
+    Extract the question from the example inputs and add the
+    unit/rounding metadata context when it is available.
+    """
+    # Extract the question from the nested structure
+    question = inputs.get("question")
+    if question is None and "inputs" in inputs:
+        question = inputs["inputs"].get("question")
+
+    # Extract metadata if available (for math problems with units/rounding)
+    metadata = inputs.get("metadata", {})
+    if not metadata and "metadata" in inputs:
+        metadata = inputs["metadata"]
+
+    # Enhance the question with metadata context if available
+    enhanced_question = question
+    if metadata:
+        unit = metadata.get("Unit")
+        rounding = metadata.get("Rounding")
+
+        if unit or rounding:
+            context_parts = []
+            if unit:
+                context_parts.append(f"Use units: {unit}")
+            if rounding:
+                context_parts.append(f"Rounding: {rounding}")
+
+            if context_parts:
+                enhanced_question = f"{question}\n\nContext: {' | '.join(context_parts)}"
+                app_log.debug("Enhanced question with metadata: %s", enhanced_question)
+
+    return enhanced_question
 
 
 def create_ls_target(provider, model_name, api_key, endpoint_name):
@@ -106,81 +329,352 @@ def create_ls_target(provider, model_name, api_key, endpoint_name):
     """
     def ls_target(inputs: dict) -> dict:
         app_log.debug("ls_target received inputs: %s", inputs)
+        enhanced_question = enhance_question(inputs)
+        return {"response": call_langflow_api(enhanced_question, provider, model_name, api_key, endpoint_name)}
 
-        # Extract the question from the nested structure
-        question = inputs.get("question")
-        if question is None and "inputs" in inputs:
-            question = inputs["inputs"].get("question")
-
-        # Extract metadata if available (for math problems with units/rounding)
-        metadata = inputs.get("metadata", {})
-        if not metadata and "metadata" in inputs:
-            metadata = inputs["metadata"]
-
-        # Enhance the question with metadata context if available
-        enhanced_question = question
-        if metadata:
-            unit = metadata.get("Unit")
-            rounding = metadata.get("Rounding")
-
-            if unit or rounding:
-                context_parts = []
-                if unit:
-                    context_parts.append(f"Use units: {unit}")
-                if rounding:
-                    context_parts.append(f"Rounding: {rounding}")
-
-                if context_parts:
-                    enhanced_question = f"{question}\n\nContext: {' | '.join(context_parts)}"
-                    app_log.debug("Enhanced question with metadata: %s", enhanced_question)
+    return ls_target
 
-        return {"response": call_langflow_api(enhanced_question, provider, model_name, api_key, endpoint_name)}
+
+def create_async_ls_target(provider, model_name, api_key, endpoint_name, semaphore, pairing=None):
+    """
+    Create an async LangSmith target function for the Langflow API.
+    The provider limiter is taken before the semaphore that bounds how many
+    Langflow calls are in flight, so a throttled provider never holds Langflow slots.
+    Cached responses skip both, and outputs already in the checkpoint journal
+    are replayed without calling Langflow at all. With a `pairing`, each example
+    waits for the other endpoints to reach it, and the latency of a Langflow call
+    sent together with the rest of its pair is recorded.
+    A failed call raises LangflowCallError, so LangSmith records the run as failed.
+    """
+    limiter = get_provider_limiter(provider)
+    cell = (endpoint_name, provider, model_name)
+    experiment_journaled = False
+
+    async def ls_target(inputs: dict) -> dict:
+        nonlocal experiment_journaled
+        app_log.debug("ls_target received inputs: %s", inputs)
+        key = example_key(inputs)
+        journaled = run_journal.get(cell, key)
+        if journaled is not None:
+            if pairing is not None:
+                pairing.check_in((provider, model_name), key, endpoint_name)
+            mark_run_resumed()
+            return {"response": journaled}
+        if not experiment_journaled:
+            journal_experiment(cell)
+            experiment_journaled = True
+        enhanced_question = enhance_question(inputs)
+        together = pairing is not None and await pairing.arrive((provider, model_name), key, endpoint_name)
+        call = (enhanced_question, provider, model_name, api_key, endpoint_name)
+        cached = await response_cache.aget(cache_key(*call))
+        if cached is not None:
+            response = await acall_langflow_api(*call, cached=cached)
+            latency = None  # a cache replay says nothing about the endpoint's latency
+        else:
+            async with limiter.aslot(estimate_tokens(enhanced_question)):
+                async with semaphore:
+                    # Timed once both slots are held, so queueing is not counted in the paired latency
+                    start = time.perf_counter()
+                    response = await acall_langflow_api(*call, cached=None)
+                    latency = time.perf_counter() - start
+                limiter.record_tokens(estimate_tokens(response))
+        if pairing is not None:
+            # Only calls sent together with the rest of their pair are compared on latency
+            pairing.record((provider, model_name), key, endpoint_name, latency=latency if together else None)
+        run_journal.put(cell, key, OUTPUT, response)
+        return {"response": response}
 
     return ls_target
 
 
-def run_evaluation_for_endpoint(endpoint_name):
+def pending_examples(experiment, dataset_name, examples=None):
     """
-    Run evaluation for a specific endpoint (single or multi agent).
+    Return the examples of `dataset_name` (or of its subset `examples`) that have
+    no successful run in `experiment` yet. A run without a response is pending too.
     """
-    log.info("Running evaluation for %s", endpoint_name)
+    client = get_ls_client()
+    finished = {
+        run.reference_example_id
+        for run in client.list_runs(project_name=experiment, is_root=True, error=False)
+        if (run.outputs or {}).get("response") is not None
+    }
+    if examples is None:
+        examples = client.list_examples(dataset_name=dataset_name)
+    return [example for example in examples if example.id not in finished]
 
-    for model_config in MODELS_TO_TEST:
-        provider = model_config["provider"]
-        model_name = model_config["model_name"]
-        if "api_key" in model_config:
-            api_key = model_config["api_key"]
+
+async def run_evaluation(
+    endpoint_name, model_config, semaphore, concurrency, resume=False, pairing=None, adaptive=None, examples=None
+):
+    """
+    Run evaluation for one model against a specific endpoint (single or multi agent).
+    When resuming, the cell's journaled experiment is extended with only the
+    examples it does not have yet. With a `pairing`, the runs are scored with the
+    local math check and the experiment is recorded for the paired comparison.
+    With `adaptive`, the examples are sent in its random order until the
+    comparison of the model is settled. With `examples`, only that subset of the
+    dataset is run.
+    """
+    provider = model_config["provider"]
+    model_name = model_config["model_name"]
+    if "api_key" in model_config:
+        api_key = model_config["api_key"]
+    else:
+        api_key = None
+
+    target_func = create_async_ls_target(provider, model_name, api_key, endpoint_name, semaphore, pairing)
+    cell = (endpoint_name, provider, model_name)
+    data = DATASET_NAME if examples is None else examples
+    experiment_args = {"experiment_prefix": f"{endpoint_name}-{provider}-{model_name}"}
+    journaled_experiment = run_journal.experiment(cell) if resume else None
+    if journaled_experiment is not None:
+        try:
+            data = pending_examples(journaled_experiment, DATASET_NAME, examples)
+            experiment_args = {"experiment": journaled_experiment}
+        except LangSmithNotFoundError:
+            log.warning("Experiment %s no longer exists, starting a new one", journaled_experiment)
         else:
-            api_key = None
+            log.info(
+                "Resuming %s: %d example(s) left, %d journaled",
+                journaled_experiment,
+                len(data),
+                run_journal.finished(cell),
+            )
+            if pairing is not None:
+                # Finished examples are not run again, so the other endpoints must not wait for them
+                pending = {example.id for example in data}
+                if examples is None:
+                    examples = get_ls_client().list_examples(dataset_name=DATASET_NAME)
+                for example in examples:
+                    if example.id not in pending:
+                        pairing.check_in((provider, model_name), example_key(example.inputs), endpoint_name)
+            if not data:
+                return None
+
+    log.info(
+        "Running evaluation for [bold blue]%s[/bold blue] - [bold green]%s[/bold green] - %s - %s",
+        provider,
+        model_name,
+        api_key,
+        endpoint_name,
+    )
+
+    if adaptive is not None:
+        pending = None if isinstance(data, str) else {example.id for example in data}
+        data = adaptive.stream(
+            (provider, model_name),
+            endpoint_name,
+            None if pending is None else [example for example in adaptive.examples if example.id in pending],
+        )
+    evaluators = []
+    if pairing is not None:
+        evaluators = [create_paired_evaluator(pairing, (provider, model_name), endpoint_name, example_key)]
+    results = await get_ls_client().aevaluate(
+        target_func,
+        data=data,
+        evaluators=evaluators,
+        metadata={
+            "llm.provider": provider,
+            "llm.model": model_name,
+            "endpoint.type": endpoint_name,
+            "paired": pairing is not None,
+        },
+        max_concurrency=concurrency,
+        **experiment_args,
+    )
+    if pairing is not None:
+        pairing.set_experiment((provider, model_name), endpoint_name, results.experiment_name)
+
+    log.info("Completed evaluation for %s - %s - %s", provider, model_name, endpoint_name)
+    return results
+
+
+async def run_evaluations(concurrency, resume=False, paired=False, adaptive=False, subset="full"):
+    """
+    Run the whole (endpoint x model) matrix at once, with up to `concurrency`
+    Langflow calls in flight and per-provider limits applied. Without `resume`
+    the checkpoint journal is cleared first. When `paired`, each example is sent
+    to every endpoint at once, and the experiments of each model are linked and
+    compared example by example with the first endpoint. When `adaptive`, the
+    paired examples are sent in random order and each model stops as soon as
+    its comparisons are settled. A `subset` other than "full" runs only its
+    stratified sample of the dataset.
+    """
+    if not resume:
+        run_journal.reset()
+    if paired or adaptive:
+        # Every endpoint of a model sends a paired example at once, so the limits must fit a whole pair
+        concurrency = max(concurrency, len(ENDPOINT_NAMES))
+        for model_config in MODELS_TO_TEST:
+            get_provider_limiter(model_config["provider"]).ensure_concurrency(len(ENDPOINT_NAMES))
+    semaphore = asyncio.Semaphore(concurrency)
+    cells = [
+        (endpoint_name, model_config["provider"], model_config["model_name"])
+        for endpoint_name in ENDPOINT_NAMES
+        for model_config in MODELS_TO_TEST
+    ]
+    models = {(model_config["provider"], model_config["model_name"]): model_config for model_config in MODELS_TO_TEST}
+
+    examples = None
+    if subset != "full":
+        dataset = get_ls_client().read_dataset(dataset_name=DATASET_NAME)
+        examples = langsmith_subset(get_ls_client(), dataset, subset, subset_cache, subset_strata)
+        log.info("Running the %s subset: %d example(s)", subset, len(examples))
+
+    stopping = None
+    if adaptive:
+        stopping = AdaptiveStopping(
+            ENDPOINT_NAMES,
+            confidence=adaptive_confidence,
+            min_pairs=adaptive_min_pairs,
+            margins={"score": adaptive_score_margin, "latency": adaptive_latency_margin},
+            seed=adaptive_seed,
+        )
+        stopping.shuffle(
+            get_ls_client().list_examples(dataset_name=DATASET_NAME) if examples is None else examples
+        )
+    pairing = None
+    if paired or adaptive:
+        pairing = PairedComparison(ENDPOINT_NAMES, paired_wait_seconds, stopping.add if stopping else None)
+
+    async def run_cell(cell):
+        endpoint_name, provider, model_name = cell
+        try:
+            return await run_evaluation(
+                endpoint_name,
+                models[(provider, model_name)],
+                semaphore,
+                concurrency,
+                resume,
+                pairing,
+                stopping,
+                examples,
+            )
+        finally:
+            if pairing is not None:
+                # The other endpoints stop waiting for a cell that finished or failed
+                pairing.leave((provider, model_name), endpoint_name)
+
+    await run_matrix(cells, run_cell, log)
+    if pairing is not None:
+        try:
+            pairing.link(get_ls_client(), DATASET_NAME)
+        except Exception as e:
+            log.error("Could not link the paired experiments: %s", e)
+        pairing.print_table()
+    if stopping is not None:
+        stopping.print_table()
+    await langflow_async_client.aclose()
+    response_cache.close()
+    run_journal.close()
+
+
+def flush_traces():
+    """
+    Wait for the remaining LangSmith traces to be exported, recording
+    how long it took as the `trace_export` phase.
+    """
+    start = time.perf_counter()
+    get_ls_client().flush()
+    latency_report.record(("all", "all", "all"), "trace_export", time.perf_counter() - start)
 
-        target_func = create_ls_target(provider, model_name, api_key, endpoint_name)
 
+def cleanup_run_sessions(cleanup, concurrency):
+    """
+    Delete the Langflow sessions this run created, or tell how to delete them later.
+    """
+    session_registry.flush()
+    if cleanup:
+        deleted, failed = delete_run_sessions(langflow_client, session_registry, concurrency=concurrency)
+        log.info("Deleted %d Langflow session(s) of run %s, %d failed", deleted, session_registry.run_id, failed)
+    else:
         log.info(
-            "Running evaluation for [bold blue]%s[/bold blue] - [bold green]%s[/bold green] - %s",
-            provider,
-            model_name,
-            api_key,
+            "Langflow sessions of this run are registered as run %s. Delete them with: "
+            "python utils/delete_sessions.py --run %s --registry %s",
+            session_registry.run_id,
+            session_registry.run_id,
+            os.path.abspath(session_registry.path),
         )
-
-        ls_client.evaluate(
-            target_func,
-            data=dataset.name,
-            metadata={
-                "llm.provider": provider,
-                "llm.model": model_name,
-                "endpoint.type": endpoint_name,
-            },
-            experiment_prefix=f"{endpoint_name}-{provider}-{model_name}"
+    session_registry.close()
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Compare single vs multi agent Langflow flows with LangSmith.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=langflow_concurrency,
+        help=f"Maximum number of Langflow calls in flight (default: {langflow_concurrency})"
+    )
+    parser.add_argument(
+        "--cache",
+        choices=CACHE_MODES,
+        default=langflow_cache_mode,
+        help=(
+            "Langflow response cache mode: 'read' serves and stores cached responses, "
+            "'write' refreshes them, 'off' bypasses the cache "
+            f"(default: {langflow_cache_mode})"
         )
-
-        log.info("Completed evaluation for %s - %s - %s", provider, model_name, endpoint_name)
+    )
+    parser.add_argument(
+        "--stream",
+        action=argparse.BooleanOptionalAction,
+        default=langflow_stream,
+        help="Use Langflow's streaming run API and record time-to-first-token (default: LANGFLOW_STREAM)"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the previous run: skip finished examples and replay journaled outputs into the same experiments"
+    )
+    parser.add_argument(
+        "--paired",
+        action=argparse.BooleanOptionalAction,
+        default=paired_mode,
+        help=(
+            "Send each example to every endpoint at once and report per-example latency and "
+            "correctness deltas against the first endpoint (default: PAIRED_MODE)"
+        )
+    )
+    parser.add_argument(
+        "--adaptive",
+        action=argparse.BooleanOptionalAction,
+        default=adaptive_mode,
+        help=(
+            "Run the paired comparison in random order and stop each model once every endpoint's "
+            "correctness and latency difference is settled (default: ADAPTIVE_MODE)"
+        )
+    )
+    parser.add_argument(
+        "--subset",
+        choices=SUBSETS,
+        default=dataset_subset,
+        help=(
+            "Run a stratified, stable sample of the dataset: 'smoke' (5%%), 'medium' (25%%) "
+            f"or 'full' (default: {dataset_subset})"
+        )
+    )
+    parser.add_argument(
+        "--cleanup-sessions",
+        action=argparse.BooleanOptionalAction,
+        default=cleanup_sessions,
+        help="Delete the Langflow sessions this run created when it finishes (default: LANGFLOW_CLEANUP_SESSIONS)"
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_arguments()
+    response_cache.mode = args.cache
+    langflow_streamer.enabled = args.stream
     log.info("\n[bold]Starting Single vs Multi Agent Evaluation...[/bold]")
 
-    # Run evaluations for both single and multi agent endpoints
-    for endpoint_name in ENDPOINT_NAMES:
-        run_evaluation_for_endpoint(endpoint_name)
+    asyncio.run(run_evaluations(args.concurrency, args.resume, args.paired, args.adaptive, args.subset))
+    cleanup_run_sessions(args.cleanup_sessions, args.concurrency)
+    langflow_client.close()
+    flush_traces()
+    latency_report.print_table()
+    token_accountant.print_table()
 
     log.info("\n[bold]Single vs Multi Agent Evaluation Complete![/bold]")
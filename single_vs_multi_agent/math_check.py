@@ -0,0 +1,215 @@
+"""
+This file contains the local correctness check for Math Dataset answers.
+The answer's number and unit are extracted from the response and the reference
+answer, the example's Rounding rule is applied to both, and the numbers are
+compared within a tolerance. Units of the same quantity are converted
+to a common base first. Answers without a number it can read, or with units it
+cannot compare, are left to the LLM-as-judge, so most math items are graded
+without a judge call.
+"""
+import math
+import re
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+# A signed number with optional thousands separators, decimals, exponent or fraction
+NUMBER = r"[-+−]?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?(?:[eE][-+]?\d+)?(?:\s*/\s*\d+(?:\.\d+)?)?|[-+−]?\.\d+"
+NUMBER_PATTERN = re.compile(rf"(?<![\w.])({NUMBER})(?:\s*(%|[^\W\d_][\w/^²³·*.-]*))?")
+# Explicit final-answer markers, strongest first; the first number after a marker is the answer.
+# A variable assignment such as "x = 3 + 4 = 7" is read after its last "=" on the line.
+FINAL_PATTERNS = (
+    re.compile(r"\\boxed\{([^{}]*)\}"),
+    re.compile(r"(?:final answer|answer)\s*(?:is|:|=)\s*([^\n]*)", re.IGNORECASE),
+    re.compile(r"(?<![\w.])[a-z]\s*=(?:[^=\n]*=)*\s*([^=\n]*)"),
+)
+# Echoes of the rounding instruction, e.g. "(rounded to 2 decimal places)", whose numbers are not answers
+ROUNDING_ECHO = re.compile(
+    r"[(,]?\s*\b(?:rounded\s+|correct\s+|accurate\s+)?(?:to|at)\s+(?:the\s+nearest\s+\w+(?:\s+number)?"
+    r"|\w+\s+(?:decimal\s+places?|decimals?|dp|significant\s+(?:figures?|digits?)|sig\.?\s*figs?))\s*\)?",
+    re.IGNORECASE,
+)
+# Unit spellings mapped to one canonical name
+UNIT_ALIASES = {
+    "%": "percent", "percent": "percent", "percentage": "percent",
+    "m": "m", "meter": "m", "metre": "m", "km": "km", "kilometer": "km", "kilometre": "km",
+    "cm": "cm", "centimeter": "cm", "centimetre": "cm", "mm": "mm", "millimeter": "mm", "millimetre": "mm",
+    "s": "s", "sec": "s", "second": "s", "min": "min", "minute": "min", "h": "h", "hr": "h", "hour": "h",
+    "g": "g", "gram": "g", "kg": "kg", "kilogram": "kg", "mg": "mg", "milligram": "mg",
+    "l": "l", "liter": "l", "litre": "l", "ml": "ml", "milliliter": "ml", "millilitre": "ml",
+    "n": "n", "newton": "n", "j": "j", "joule": "j", "w": "w", "watt": "w", "pa": "pa", "pascal": "pa",
+    "deg": "deg", "degree": "deg", "°": "deg", "rad": "rad", "radian": "rad",
+    "m/s": "m/s", "km/h": "km/h", "kph": "km/h", "mph": "mph", "m/s^2": "m/s^2", "m/s²": "m/s^2",
+    "usd": "usd", "dollar": "usd", "$": "usd", "cent": "cent",
+}
+# Canonical units mapped to (quantity, factor to the quantity's base unit)
+UNIT_SCALES = {
+    "m": ("length", 1.0), "km": ("length", 1000.0), "cm": ("length", 0.01), "mm": ("length", 0.001),
+    "s": ("time", 1.0), "min": ("time", 60.0), "h": ("time", 3600.0),
+    "g": ("mass", 1.0), "kg": ("mass", 1000.0), "mg": ("mass", 0.001),
+    "l": ("volume", 1.0), "ml": ("volume", 0.001),
+    "m/s": ("speed", 1.0), "km/h": ("speed", 1 / 3.6), "mph": ("speed", 0.44704),
+    "deg": ("angle", 1.0), "rad": ("angle", 180 / math.pi),
+    "usd": ("money", 1.0), "cent": ("money", 0.01),
+    "percent": ("percent", 1.0), "n": ("force", 1.0), "j": ("energy", 1.0), "w": ("power", 1.0),
+    "pa": ("pressure", 1.0), "m/s^2": ("acceleration", 1.0),
+}
+# Spelled-out counts in rounding rules such as "two decimal places"
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+COUNT_PATTERN = re.compile(rf"\b(\d+|{'|'.join(NUMBER_WORDS)})\b")
+ROUNDING_WORDS = {"integer": 0, "whole": 0, "unit": 0, "one": 0, "tenth": 1, "hundredth": 2, "thousandth": 3}
+# Relative tolerance when the example has no rounding rule
+DEFAULT_TOLERANCE = 1e-6
+
+
+def normalize_unit(unit):
+    """Return the canonical name of a unit, or None when it is not a known unit."""
+    if not unit:
+        return None
+    unit = unit.strip().lower().rstrip(".").replace("²", "^2").replace(" ", "")
+    if unit in UNIT_ALIASES:
+        return UNIT_ALIASES[unit]
+    if unit.endswith("s") and unit[:-1] in UNIT_ALIASES and len(unit) > 2:
+        return UNIT_ALIASES[unit[:-1]]
+    return None
+
+
+def parse_number(text) -> float:
+    """Parse a number matched by NUMBER, including fractions such as 3/4."""
+    text = text.replace(",", "").replace("−", "-").replace(" ", "")
+    if "/" in text:
+        numerator, denominator = text.split("/")
+        return float(numerator) / float(denominator)
+    return float(text)
+
+
+def read_number(number, unit, text, expected_unit=None):
+    """Return the (value, unit) of one NUMBER_PATTERN match, or None when it is not a valid number."""
+    try:
+        value = parse_number(number)
+    except (ValueError, ZeroDivisionError):
+        return None
+    canonical = normalize_unit(unit)
+    if canonical is None and expected_unit and unit.strip().lower() == str(expected_unit).strip().lower():
+        canonical = unit.strip().lower()
+    if canonical is None and "$" in text and not unit:
+        canonical = "usd"
+    return value, canonical
+
+
+def extract_answer(text, expected_unit=None):
+    """
+    Return the (value, unit) of the answer in `text`, or None when it has no
+    number or its answer is undetermined. Echoes of the rounding instruction are
+    dropped first. The first number after the strongest explicit answer marker
+    is the answer; without a marker, every number in the text is a candidate.
+    When the candidates disagree, the answer is undetermined and left to the judge.
+    The unit is None unless the word after the number is a known or expected unit.
+    """
+    if text is None:
+        return None
+    text = ROUNDING_ECHO.sub(" ", str(text))
+    segments, marked = [text], False
+    for pattern in FINAL_PATTERNS:
+        found = [segment for segment in pattern.findall(text) if NUMBER_PATTERN.search(segment.replace("$", ""))]
+        if found:
+            segments, marked = found, True
+            break
+    candidates = set()
+    for segment in segments:
+        matches = NUMBER_PATTERN.findall(segment.replace("$", ""))
+        for number, unit in matches[:1] if marked else matches:
+            candidate = read_number(number, unit, segment, expected_unit)
+            if candidate is not None:
+                candidates.add(candidate)
+    if len({value for value, _ in candidates}) != 1:
+        return None
+    units = {unit for _, unit in candidates if unit}
+    if len(units) > 1:
+        return None
+    return candidates.pop()[0], units.pop() if units else None
+
+
+def convert(value, unit, target):
+    """
+    Convert `value` from `unit` to `target`. Returns None when the units do not
+    measure the same quantity, or either is not a unit the check can convert.
+    """
+    if unit == target:
+        return value
+    if unit not in UNIT_SCALES or target not in UNIT_SCALES:
+        return None
+    (quantity, factor), (target_quantity, target_factor) = UNIT_SCALES[unit], UNIT_SCALES[target]
+    if quantity != target_quantity:
+        return None
+    return value * factor / target_factor
+
+
+def round_half_up(value, places) -> float:
+    """
+    Round `value` to `places` decimals (negative for tens, hundreds, ...) with
+    halves rounded away from zero, on its decimal digits rather than its binary
+    approximation, so 2.675 rounds to 2.68.
+    """
+    try:
+        return float(Decimal(str(value)).quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP))
+    except InvalidOperation:  # more digits than the decimal context holds
+        return value
+
+
+def parse_rounding(rounding):
+    """
+    Turn a Rounding rule such as "2 decimal places", "two decimal places",
+    "nearest tenth", "whole number" or "3 significant figures" into a function that rounds a value.
+    Returns None when there is no rule or it is not understood.
+    """
+    if not rounding:
+        return None
+    rule = str(rounding).lower()
+    match = COUNT_PATTERN.search(rule)
+    count = None if match is None else int(NUMBER_WORDS.get(match.group(1), match.group(1)))
+    if "significant" in rule or re.search(r"\bsig", rule):
+        if not count:
+            return None
+        figures = count
+        return lambda value: (
+            value if value == 0 else round_half_up(value, figures - 1 - math.floor(math.log10(abs(value))))
+        )
+    if "decimal" in rule or re.search(r"\bdp\b", rule):
+        places = count or 0
+        return lambda value: round_half_up(value, places)
+    for word, places in ROUNDING_WORDS.items():
+        if word in rule:
+            return lambda value, places=places: round_half_up(value, places)
+    return None
+
+
+def check_math(response, reference, metadata=None, tolerance=DEFAULT_TOLERANCE):
+    """
+    Grade a math answer locally. Returns a correctness result in the openevals
+    {key, score, comment} shape, or None when the response or the reference has
+    no number or their units cannot be compared, in which case the answer should
+    go to the LLM-as-judge. The response is converted to the reference's unit.
+    """
+    metadata = metadata or {}
+    expected_unit = metadata.get("Unit")
+    actual = extract_answer(response, expected_unit)
+    expected = extract_answer(reference, expected_unit)
+    if actual is None or expected is None:
+        return None
+    (value, unit), (reference_value, reference_unit) = actual, expected
+    reference_unit = reference_unit or normalize_unit(expected_unit)
+    if unit and reference_unit:
+        value = convert(value, unit, reference_unit)
+        if value is None:
+            return None
+    rounding = parse_rounding(metadata.get("Rounding"))
+    if rounding is not None:
+        value, reference_value = rounding(value), rounding(reference_value)
+    correct = math.isclose(value, reference_value, rel_tol=tolerance, abs_tol=1e-9)
+    return {
+        "key": "correctness",
+        "score": correct,
+        "comment": f"Local check: {value:g} {'matches' if correct else 'does not match'} {reference_value:g}",
+    }
@@ -0,0 +1,203 @@
+"""
+This file contains the paired comparison of the endpoints. Each example is sent
+to every endpoint at the same time, so the endpoints are compared under the same
+load. The latency and local math check score of every endpoint are then compared
+with those of the baseline endpoint (the first one) on the same example, and the
+experiments of a model are linked as one LangSmith comparative experiment with the
+per-example deltas as its feedback.
+"""
+import asyncio
+import statistics
+from collections import defaultdict
+from rich.console import Console
+from rich.table import Table
+from config import log, math_check_tolerance
+from math_check import check_math
+
+# Per-example deltas logged on the runs of the comparative experiment
+DELTA_KEYS = {"latency": "latency_delta_s", "score": "correctness_delta"}
+
+
+class PairedComparison:
+    """
+    Lines up the experiments of every endpoint of a model example by example.
+    The target of each endpoint waits at an example until the other endpoints
+    reach it too (or their experiment ended, or `wait_seconds` passed), so all
+    endpoints send it to Langflow together, each in its own LangSmith experiment.
+    """
+
+    def __init__(self, endpoints, wait_seconds=300.0, on_pair=None):
+        self.endpoints = tuple(endpoints)
+        self.baseline = self.endpoints[0]
+        self.wait_seconds = wait_seconds
+        self.on_pair = on_pair  # called with (model, endpoint, latency delta, score delta) per complete pair
+        self._paired = set()  # (model, key, endpoint) already passed to on_pair
+        self._arrivals = {}  # (model, key) -> (endpoints that arrived, event)
+        self._left = defaultdict(set)  # model -> endpoints whose experiment ended
+        self._runs = defaultdict(dict)  # (model, key) -> {endpoint: {"latency", "score", "run_id"}}
+        self._experiments = defaultdict(dict)  # model -> {endpoint: experiment name}
+
+    def _release(self, model, key):
+        arrived, event = self._arrivals[(model, key)]
+        if arrived | self._left[model] >= set(self.endpoints):
+            event.set()
+
+    def check_in(self, model, key, endpoint):
+        """Record that `endpoint` reached the example `key`, without waiting for the others."""
+        arrived, event = self._arrivals.setdefault((model, key), (set(), asyncio.Event()))
+        arrived.add(endpoint)
+        self._release(model, key)
+        return event
+
+    async def arrive(self, model, key, endpoint) -> bool:
+        """
+        Wait until every endpoint of `model` reached the example `key`. Returns
+        whether they all did, rather than some leaving or the wait timing out.
+        """
+        event = self.check_in(model, key, endpoint)
+        try:
+            await asyncio.wait_for(event.wait(), self.wait_seconds)
+        except asyncio.TimeoutError:
+            log.warning("Example %s of %s was not reached by every endpoint, sending it unpaired", key, model)
+        arrived, _ = self._arrivals[(model, key)]
+        return arrived >= set(self.endpoints)
+
+    def leave(self, model, endpoint):
+        """Stop waiting for `endpoint`, whose experiment for `model` ended."""
+        self._left[model].add(endpoint)
+        for pair_model, key in list(self._arrivals):
+            if pair_model == model:
+                self._release(model, key)
+
+    def record(self, model, key, endpoint, **values):
+        """
+        Record the latency, score or run id of one endpoint on one example, and
+        pass the pairs it completes to `on_pair`. A latency of None (a cached or
+        unpaired call) or a score of None reaches `on_pair` as a None delta.
+        """
+        runs = self._runs[(model, key)]
+        runs.setdefault(endpoint, {}).update(values)
+        if self.on_pair is None or not all(name in runs.get(self.baseline, {}) for name in DELTA_KEYS):
+            return
+        for other in self.endpoints[1:]:
+            if (model, key, other) in self._paired or not all(name in runs.get(other, {}) for name in DELTA_KEYS):
+                continue
+            self._paired.add((model, key, other))
+            self.on_pair(model, other, *(self._delta(runs[other], runs[self.baseline], name) for name in DELTA_KEYS))
+
+    @staticmethod
+    def _delta(values, baseline, name):
+        """Difference of one value against the baseline, None when either side is missing."""
+        if values.get(name) is None or baseline.get(name) is None:
+            return None
+        return float(values[name]) - float(baseline[name])
+
+    def set_experiment(self, model, endpoint, experiment_name):
+        """Record the LangSmith experiment an endpoint's runs of `model` went to."""
+        self._experiments[model][endpoint] = experiment_name
+
+    def deltas(self) -> list:
+        """
+        Return one row per (model, example, endpoint other than the baseline) with
+        the endpoint's latency and score minus the baseline's, None where either
+        side is missing.
+        """
+        rows = []
+        for (model, key), runs in self._runs.items():
+            baseline = runs.get(self.baseline)
+            if baseline is None:
+                continue
+            for endpoint in self.endpoints[1:]:
+                if endpoint not in runs:
+                    continue
+                row = {"model": model, "key": key, "endpoint": endpoint, "run_id": runs[endpoint].get("run_id")}
+                for name in DELTA_KEYS:
+                    row[name] = self._delta(runs[endpoint], baseline, name)
+                rows.append(row)
+        return rows
+
+    def link(self, client, dataset_name):
+        """
+        Link the experiments of each model as a comparative experiment and log the
+        per-example deltas on the runs of the non-baseline endpoints.
+        Returns {model: comparative experiment id}.
+        """
+        dataset = client.read_dataset(dataset_name=dataset_name)
+        deltas = self.deltas()
+        linked = {}
+        for model, experiments in self._experiments.items():
+            if len(experiments) < 2:
+                continue
+            names = [experiments[endpoint] for endpoint in self.endpoints if endpoint in experiments]
+            comparative = client.create_comparative_experiment(
+                name=f"paired-{'-'.join(model)}-{names[0]}",
+                experiments=[client.read_project(project_name=name).id for name in names],
+                reference_dataset=dataset.id,
+                description=f"Paired runs of {', '.join(self.endpoints)} against {self.baseline}",
+                metadata={"llm.provider": model[0], "llm.model": model[1], "baseline": self.baseline},
+            )
+            linked[model] = comparative.id
+            for row in deltas:
+                if row["model"] != model or row["run_id"] is None:
+                    continue
+                for name, key in DELTA_KEYS.items():
+                    if row[name] is not None:
+                        client.create_feedback(
+                            row["run_id"], key=key, score=row[name], comparative_experiment_id=comparative.id
+                        )
+            log.info(
+                "Linked the paired experiments of %s - %s as comparative experiment %s", *model, comparative.id
+            )
+        return linked
+
+    def print_table(self, console=None):
+        """Print the mean and median paired deltas of each endpoint against the baseline."""
+        groups = defaultdict(list)
+        for row in self.deltas():
+            groups[(row["model"], row["endpoint"])].append(row)
+        if not groups:
+            return
+        table = Table(title=f"Paired deltas against {self.baseline}")
+        for column in ("Provider", "Model", "Endpoint"):
+            table.add_column(column)
+        for column in ("Pairs", "Δ latency mean (s)", "Δ latency p50 (s)", "Δ correctness mean"):
+            table.add_column(column, justify="right")
+        for (model, endpoint), rows in sorted(groups.items()):
+            latency = [row["latency"] for row in rows if row["latency"] is not None]
+            score = [row["score"] for row in rows if row["score"] is not None]
+            table.add_row(
+                *model,
+                endpoint,
+                str(len(rows)),
+                f"{statistics.fmean(latency):+.3f}" if latency else "-",
+                f"{statistics.median(latency):+.3f}" if latency else "-",
+                f"{statistics.fmean(score):+.3f}" if score else "-",
+            )
+        (console or Console()).print(table)
+
+
+def create_paired_evaluator(pairing, model, endpoint, key_of):
+    """
+    Create a LangSmith evaluator that scores a run with the local math check and
+    records the score and run id of `endpoint` in `pairing`. Answers the check
+    cannot read are scored None, and failed runs are scored None without being
+    recorded, so they never make up a pair.
+    """
+    def paired_correctness(run, example) -> dict:
+        if run.error or not run.outputs:
+            return {"key": "correctness", "score": None, "comment": "The run failed"}
+        inputs = example.inputs or {}
+        result = check_math(
+            run.outputs.get("response"),
+            (example.outputs or {}).get("answer"),
+            inputs.get("metadata"),
+            math_check_tolerance,
+        )
+        score = None if result is None else float(result["score"])
+        pairing.record(model, key_of(inputs), endpoint, score=score, run_id=run.id)
+        return {
+            "key": "correctness",
+            "score": score,
+            "comment": "No number to check" if result is None else result["comment"],
+        }
+    return paired_correctness
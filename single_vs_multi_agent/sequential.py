@@ -0,0 +1,155 @@
+"""
+This file contains the adaptive comparison, which stops sending examples once
+the endpoints' paired differences are settled. The examples are sent in random
+order, and an anytime-valid confidence sequence of the mean correctness and
+latency difference of each endpoint against the baseline is updated after every
+pair, so the comparison can stop as soon as a difference or an equivalence is
+reached without inflating the error rate.
+"""
+import math
+import random
+from collections import Counter
+from rich.console import Console
+from rich.table import Table
+
+# Paired differences every comparison has to settle
+ADAPTIVE_METRICS = ("score", "latency")
+
+
+class SequentialTest:
+    """
+    Confidence sequence for the mean of paired differences, from a normal-mixture
+    sequential probability ratio test with the mixing variance set to the sample
+    variance. It holds at `confidence` however often it is looked at. The variance
+    is estimated with one extra deviation of `scale`, so a run of identical
+    differences does not end the test on its own.
+    """
+
+    def __init__(self, confidence=0.95, margin=0.0, scale=1.0, min_pairs=20):
+        self.alpha = 1.0 - confidence
+        self.margin = margin
+        self.scale = scale
+        self.min_pairs = min_pairs
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        """Add one paired difference (Welford's online mean and variance)."""
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    def interval(self) -> tuple:
+        """Return the (low, high) confidence interval of the mean difference."""
+        if self.n == 0:
+            return -math.inf, math.inf
+        variance = (self._m2 + self.scale ** 2) / self.n
+        half = math.sqrt(variance * (self.n + 1) / self.n ** 2 * math.log((self.n + 1) / self.alpha ** 2))
+        return self.mean - half, self.mean + half
+
+    def decision(self):
+        """Return "higher", "lower" or "equivalent" once settled, else None."""
+        if self.n < self.min_pairs:
+            return None
+        low, high = self.interval()
+        if low > 0:
+            return "higher"
+        if high < 0:
+            return "lower"
+        if -self.margin <= low and high <= self.margin:
+            return "equivalent"
+        return None
+
+
+class AdaptiveStopping:
+    """
+    Feeds the examples of each model to its endpoints in one shared random order
+    and stops once every endpoint's correctness and latency differences against
+    the baseline are settled. Counts the examples each endpoint was sent, so the
+    Langflow calls saved can be reported.
+    """
+
+    def __init__(self, endpoints, confidence=0.95, min_pairs=20, margins=None, seed=None):
+        self.endpoints = tuple(endpoints)
+        self.confidence = confidence
+        self.min_pairs = min_pairs
+        self.margins = {"score": 0.05, "latency": 1.0, **(margins or {})}
+        self.random = random.Random(seed)
+        self.examples = []
+        self._tests = {}  # (model, endpoint, metric) -> SequentialTest
+        self._sent = Counter()  # (model, endpoint) -> examples sent
+        self._total = Counter()  # (model, endpoint) -> examples it would have been sent
+
+    def shuffle(self, examples):
+        """Set the examples and the random order they are sent in."""
+        self.examples = list(examples)
+        self.random.shuffle(self.examples)
+
+    def _test(self, model, endpoint, metric):
+        key = (model, endpoint, metric)
+        if key not in self._tests:
+            # Scores differ by at most 1; latency deviations are scaled to the equivalence margin
+            scale = 1.0 if metric == "score" else self.margins[metric]
+            self._tests[key] = SequentialTest(self.confidence, self.margins[metric], scale, self.min_pairs)
+        return self._tests[key]
+
+    def add(self, model, endpoint, latency, score):
+        """Add the paired latency and score difference of one example; a None difference is skipped."""
+        for metric, value in (("latency", latency), ("score", score)):
+            if value is not None:
+                self._test(model, endpoint, metric).add(value)
+
+    def decided(self, model) -> bool:
+        """
+        Whether every comparison of `model` with the baseline is settled.
+        A comparison without any pair yet is not settled, and no test is created for it.
+        """
+        tests = (
+            self._tests.get((model, endpoint, metric))
+            for endpoint in self.endpoints[1:]
+            for metric in ADAPTIVE_METRICS
+        )
+        return all(test is not None and test.decision() is not None for test in tests)
+
+    async def stream(self, model, endpoint, examples=None):
+        """Yield the examples in the shared order until the comparison of `model` is settled."""
+        examples = self.examples if examples is None else list(examples)
+        self._total[(model, endpoint)] += len(examples)
+        for example in examples:
+            if self.decided(model):
+                return
+            self._sent[(model, endpoint)] += 1
+            yield example
+
+    def calls_saved(self) -> int:
+        """Number of Langflow calls not made because the comparisons stopped early."""
+        return sum(self._total.values()) - sum(self._sent.values())
+
+    def print_table(self, console=None):
+        """Print the confidence interval and decision of every comparison, and the calls saved."""
+        if not self._tests:
+            return
+        table = Table(title=f"Adaptive comparison ({self.confidence:.0%} confidence)")
+        for column in ("Provider", "Model", "Endpoint", "Metric"):
+            table.add_column(column)
+        for column in ("Pairs", "Mean Δ", "Interval", "Decision"):
+            table.add_column(column, justify="right")
+        for (model, endpoint, metric), test in sorted(self._tests.items()):
+            low, high = test.interval()
+            table.add_row(
+                *model,
+                endpoint,
+                metric,
+                str(test.n),
+                f"{test.mean:+.3f}",
+                f"[{low:+.3f}, {high:+.3f}]",
+                test.decision() or "undecided",
+            )
+        console = console or Console()
+        console.print(table)
+        console.print(
+            f"Sent {sum(self._sent.values())} of {sum(self._total.values())} example(s) across "
+            f"{len(self._total)} experiment(s), saving {self.calls_saved()} Langflow call(s)"
+        )
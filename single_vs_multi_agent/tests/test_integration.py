@@ -10,9 +10,13 @@ from ..config import (
     CORRECTNESS_EVALUATOR,
     CONCISENESS_EVALUATOR,
     MODELS_TO_TEST,
+    subset_cache,
+    subset_strata,
     #HALLUCINATION_EVALUATOR
 )
 from ..main import call_langflow_api
+from evals_common.cascade import cascade_stats
+from evals_common.subset import langsmith_subset
 
 # Skip all tests if Langflow API key is not available
 pytestmark = pytest.mark.skipif(
@@ -22,6 +26,12 @@ pytestmark = pytest.mark.skipif(
 
 DATASET_NAME = "Math Dataset"
 
+@pytest.fixture(scope="session", autouse=True)
+def cascade_report():
+    """Print the hit rate of each judge cascade stage once the tests finish."""
+    yield
+    cascade_stats.print_table()
+
 @pytest.fixture(scope="session")
 def dataset():
     """Load the dataset for evaluation tests."""
@@ -34,9 +44,8 @@ def dataset():
 def sample_dataset_examples(dataset):
     """Get a small sample of examples from the dataset for testing."""
     try:
-        all_examples = list(ls_client.list_examples(dataset_id=dataset.id))
-        # Return first 3 examples for faster test execution
-        return all_examples[:3]
+        # Return the first 3 examples of the stratified smoke subset for faster test execution
+        return langsmith_subset(ls_client, dataset, "smoke", subset_cache, subset_strata)[:3]
     except Exception as e:
         pytest.skip(f"Could not load dataset examples: {e}")
 
@@ -76,7 +85,8 @@ def test_single_agent_real_question(sample_dataset_examples, model_config, examp
             CORRECTNESS_EVALUATOR(
                 inputs=question,
                 outputs=response,
-                reference_outputs=expected_answer
+                reference_outputs=expected_answer,
+                metadata=example.inputs.get("metadata")
             )
         except Exception as e:
             print(f"Correctness evaluator error: {e}")
@@ -132,7 +142,8 @@ def test_multi_agent_real_question(sample_dataset_examples, model_config, exampl
             CORRECTNESS_EVALUATOR(
                 inputs=question,
                 outputs=response,
-                reference_outputs=expected_answer
+                reference_outputs=expected_answer,
+                metadata=example.inputs.get("metadata")
             )
         except Exception as e:
             print(f"Correctness evaluator error: {e}")
@@ -188,7 +199,8 @@ def test_noexp_agent_real_question(sample_dataset_examples, model_config, exampl
             CORRECTNESS_EVALUATOR(
                 inputs=question,
                 outputs=response,
-                reference_outputs=expected_answer
+                reference_outputs=expected_answer,
+                metadata=example.inputs.get("metadata")
             )
         except Exception as e:
             print(f"Correctness evaluator error: {e}")
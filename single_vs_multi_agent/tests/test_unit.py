@@ -2,26 +2,81 @@
 Unit tests for single vs multi agent evaluations.
 These tests use mocked dependencies and don't make external API calls.
 """
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
 from unittest.mock import patch, Mock
+import httpx
 import pytest
 from langsmith import testing as t
-from ..config import ls_client
-from ..main import call_langflow_api
+from ..config import get_ls_client, subset_cache, subset_strata
+from ..main import (
+    acall_langflow_api,
+    cache_key,
+    call_langflow_api,
+    create_async_ls_target,
+    parse_output,
+    pending_examples,
+)
+from evals_common import scheduler
+from evals_common.scheduler import ProviderLimiter, ProviderLimiters, run_matrix
+from evals_common.response_cache import ResponseCache
+from evals_common.judge_cache import JudgeCache
+from evals_common.streaming import LangflowStreamer
+from evals_common.phases import PhaseTimer, LatencyReport, percentile
+from evals_common.tokens import TokenAccountant, extract_usage
+from evals_common.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LangflowCallError,
+    Resilience,
+    call_with_retries,
+)
+from evals_common.langflow import LangflowRunner
+from evals_common.journal import RunJournal, example_key
+from evals_common.session_registry import SessionRegistry, delete_run_sessions
+from evals_common.fused_judge import SharedVerdicts, fan_out, fused_schema, parse_criteria, render_prompt
+from evals_common.metrics import compute_metrics, tokenize
+from evals_common.cascade import CascadeStats, JudgeCascade, parse_band, reference_check
+from ..paired import PairedComparison, create_paired_evaluator
+from ..sequential import AdaptiveStopping, SequentialTest
+from ..math_check import check_math, extract_answer, parse_rounding
+from evals_common.subset import SubsetCache, allocate, langsmith_subset, select_subset, subset_examples
 
 @pytest.fixture(scope="session")
 def dataset():
     """Load the dataset for evaluation tests."""
     try:
-        return ls_client.read_dataset(dataset_name="Math Dataset")
+        return get_ls_client().read_dataset(dataset_name="Math Dataset")
     except Exception as e:
         pytest.skip(f"Could not load dataset: {e}")
 
+
+@pytest.fixture(autouse=True)
+def run_journal(tmp_path):
+    """Give every test an empty checkpoint journal instead of the one in the working directory."""
+    journal = RunJournal(str(tmp_path / "journal.sqlite3"))
+    with patch('single_vs_multi_agent.main.run_journal', journal):
+        yield journal
+    journal.close()
+
+
+@pytest.fixture(autouse=True)
+def session_registry(tmp_path):
+    """Register the sessions of every test in a temporary session registry."""
+    registry = SessionRegistry(str(tmp_path / "sessions.sqlite3"), run_id="test-run")
+    with patch('single_vs_multi_agent.main.session_registry', registry):
+        yield registry
+    registry.close()
+
 @pytest.fixture(scope="session")
 def sample_dataset_examples(dataset):
     """Get a small sample of examples from the dataset for testing."""
     try:
-        all_examples = list(ls_client.list_examples(dataset_id=dataset.id))
-        return all_examples[:3]  # Use first 3 examples for unit tests
+        # Use the first 3 examples of the stratified smoke subset for unit tests
+        return langsmith_subset(get_ls_client(), dataset, "smoke", subset_cache, subset_strata)[:3]
     except Exception as e:
         pytest.skip(f"Could not load dataset examples: {e}")
 
@@ -45,7 +100,7 @@ class TestSingleAgent:
         t.log_reference_outputs({"answer": expected_answer})
 
         # Mock single agent response (more direct/concise)
-        with patch('requests.request') as mock_request:
+        with patch('single_vs_multi_agent.main.langflow_client') as mock_client:
             mock_response = Mock()
             mock_response.json.return_value = {
                 "outputs": [{
@@ -61,7 +116,7 @@ class TestSingleAgent:
                 }]
             }
             mock_response.raise_for_status.return_value = None
-            mock_request.return_value = mock_response
+            mock_client.post.return_value = mock_response
 
             result = call_langflow_api(
                 question,
@@ -75,7 +130,7 @@ class TestSingleAgent:
             t.log_outputs({"response": result})
 
             assert result == expected_answer
-            mock_request.assert_called_once()
+            mock_client.post.assert_called_once()
 
 
 class TestMultiAgent:
@@ -98,7 +153,7 @@ class TestMultiAgent:
         t.log_reference_outputs({"answer": expected_answer})
 
         # Mock multi-agent response (more detailed/collaborative)
-        with patch('requests.request') as mock_request:
+        with patch('single_vs_multi_agent.main.langflow_client') as mock_client:
             mock_response = Mock()
             mock_response.json.return_value = {
                 "outputs": [{
@@ -114,7 +169,7 @@ class TestMultiAgent:
                 }]
             }
             mock_response.raise_for_status.return_value = None
-            mock_request.return_value = mock_response
+            mock_client.post.return_value = mock_response
 
             result = call_langflow_api(
                 question,
@@ -130,4 +185,1029 @@ class TestMultiAgent:
             # Multi-agent response should contain the answer and be more verbose
             assert expected_answer in result
             assert len(result) > len(expected_answer)  # Should be more detailed
-            mock_request.assert_called_once()
+            mock_client.post.assert_called_once()
+
+
+def _langflow_response(text):
+    """Build a Langflow run API response body carrying ``text``."""
+    return {"outputs": [{"outputs": [{"results": {"message": {"data": {"text": text}}}}]}]}
+
+
+class TestLangflowClient:
+    """Test that Langflow calls go through the shared, pooled HTTP client."""
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_calls_reuse_shared_client(self):
+        """Every call should be sent through the same pooled client."""
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(200, json=_langflow_response("42"))
+
+        client = httpx.Client(base_url="http://langflow.test", transport=httpx.MockTransport(handler))
+        with patch('single_vs_multi_agent.main.langflow_client', client):
+            for _ in range(3):
+                result = call_langflow_api("6 * 7?", "Qwen", "qwen3-4b-2507", None, "math_eval_single_lms")
+                assert result == "42"
+
+        assert len(requests_seen) == 3
+        assert all(r.url.path == "/api/v1/run/math_eval_single_lms" for r in requests_seen)
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_http_error_is_reported(self):
+        """HTTP errors from Langflow should fail the call instead of being returned as the answer."""
+        client = httpx.Client(
+            base_url="http://langflow.test",
+            transport=httpx.MockTransport(lambda request: httpx.Response(500)),
+        )
+        with patch('single_vs_multi_agent.main.langflow_client', client), \
+                pytest.raises(LangflowCallError, match="API Error:"):
+            call_langflow_api("6 * 7?", "Qwen", "qwen3-4b-2507", None, "math_eval_single_lms")
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_runner_reports_calls_to_the_harness_hooks(self, tmp_path):
+        """A sent call and a cached call should each be reported to the harness's hooks."""
+        client = httpx.Client(
+            base_url="http://langflow.test",
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, json=_langflow_response("42"))),
+        )
+        cache = ResponseCache(str(tmp_path / "responses.sqlite3"), mode="read")
+        hooks = Mock()
+        runner = LangflowRunner(
+            LangflowStreamer(), Resilience(), ProviderLimiters(), TokenAccountant(), parse_output, hooks=hooks
+        )
+        cell = ("math_eval_single_lms", "Qwen", "qwen3-4b-2507")
+        payload = {"input_value": "6 * 7?", "session_id": "s1"}
+
+        assert runner.call(client, cache, cell, "6 * 7?", payload, "key") == "42"
+        assert runner.call(client, cache, cell, "6 * 7?", payload, "key") == "42"
+
+        hooks.sent.assert_called_once_with(cell, payload)
+        hooks.finished.assert_called_once()
+        hooks.cached.assert_called_once()
+
+
+class TestAsyncLangflowClient:
+    """Test the async Langflow call path and its concurrency bound."""
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_async_call_parses_output(self):
+        """The async call should parse the same response shape as the sync call."""
+        async def handler(request):
+            return httpx.Response(200, json=_langflow_response("42"))
+
+        async def run():
+            client = httpx.AsyncClient(base_url="http://langflow.test", transport=httpx.MockTransport(handler))
+            with patch('single_vs_multi_agent.main.langflow_async_client', client):
+                return await acall_langflow_api("6 * 7?", "Qwen", "qwen3-4b-2507", None, "math_eval_single_lms")
+
+        assert asyncio.run(run()) == "42"
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_semaphore_bounds_calls_in_flight(self):
+        """No more than `concurrency` Langflow calls should be in flight at once."""
+        in_flight = 0
+        max_in_flight = 0
+
+        async def handler(request):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return httpx.Response(200, json=_langflow_response("42"))
+
+        async def run():
+            client = httpx.AsyncClient(base_url="http://langflow.test", transport=httpx.MockTransport(handler))
+            target = create_async_ls_target("Qwen", "qwen3-4b-2507", None, "math_eval_single_lms", asyncio.Semaphore(2))
+            with patch('single_vs_multi_agent.main.langflow_async_client', client):
+                return await asyncio.gather(*(target({"question": f"{i} + 1?"}) for i in range(8)))
+
+        results = asyncio.run(run())
+        assert all(result == {"response": "42"} for result in results)
+        assert max_in_flight == 2
+
+
+class TestScheduler:
+    """Test the per-provider limiter and the matrix scheduler."""
+
+    @pytest.mark.unit
+    def test_limiter_caps_concurrency(self):
+        """A provider should never have more calls in flight than its concurrency limit."""
+        limiter = ProviderLimiter("Qwen", concurrency=2)
+        in_flight = 0
+        max_in_flight = 0
+
+        async def call():
+            nonlocal in_flight, max_in_flight
+            async with limiter.aslot():
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+
+        async def run():
+            await asyncio.gather(*(call() for _ in range(6)))
+
+        asyncio.run(run())
+        assert max_in_flight == 2
+
+    @pytest.mark.unit
+    def test_limiter_enforces_requests_per_window(self):
+        """Requests over the per-minute budget should wait for the window to slide."""
+        limiter = ProviderLimiter("OpenAI", concurrency=10, requests_per_minute=2)
+        with patch.object(scheduler, "RATE_WINDOW", 0.2):
+            assert limiter._try_acquire(0) == 0.0
+            assert limiter._try_acquire(0) == 0.0
+            assert limiter._try_acquire(0) > 0.0
+            limiter.acquire()  # blocks until the first requests leave the window
+
+    @pytest.mark.unit
+    def test_limiter_enforces_tokens_per_window(self):
+        """Requests over the per-minute token budget should wait."""
+        limiter = ProviderLimiter("OpenAI", concurrency=10, tokens_per_minute=100)
+        assert limiter._try_acquire(60) == 0.0
+        limiter.record_tokens(30)
+        assert limiter._try_acquire(20) > 0.0
+
+    @pytest.mark.unit
+    def test_matrix_runs_cells_concurrently_and_isolates_failures(self):
+        """Cells should overlap in time, and one failing cell should not stop the others."""
+        async def run_cell(cell):
+            await asyncio.sleep(0.1)
+            if cell == ("math_eval_multi_lms", "Qwen"):
+                raise RuntimeError("boom")
+            return cell
+
+        cells = [("math_eval_single_lms", "Qwen"), ("math_eval_multi_lms", "Qwen"), ("math_eval_noexp_lms", "Qwen")]
+        began = time.perf_counter()
+        results = asyncio.run(run_matrix(cells, run_cell))
+        elapsed = time.perf_counter() - began
+
+        assert results == [cells[0], None, cells[2]]
+        assert elapsed < 0.25
+
+    @pytest.mark.unit
+    def test_limiters_take_the_harness_limits_and_logger(self):
+        """Each provider should get one limiter built from the given limits, logging to the given logger."""
+        log = Mock()
+        limiters = ProviderLimiters({"Qwen": {"concurrency": 2}}, {"concurrency": 4}, log)
+
+        assert limiters.get("Qwen") is limiters.get("Qwen")
+        assert limiters.get("Qwen").concurrency == 2
+        assert limiters.get("OpenAI").concurrency == 4
+        limiters.get("Qwen").record_result(1.0, ok=False)
+        log.warning.assert_called_once()
+
+
+class TestResponseCache:
+    """Test the persistent Langflow response cache."""
+
+    @pytest.mark.unit
+    def test_key_depends_on_request_content(self):
+        """Keys should match for identical requests and differ when any part changes."""
+        tweaks = {"Agent-AQzDw": {"agent_llm": "Qwen", "model_name": "qwen3-4b-2507", "api_key": None}}
+        key = ResponseCache.make_key("math_eval_single_lms", tweaks, "Qwen", "qwen3-4b-2507", "6 * 7?")
+        assert key == ResponseCache.make_key("math_eval_single_lms", tweaks, "Qwen", "qwen3-4b-2507", "6 * 7?")
+        assert key != ResponseCache.make_key("math_eval_multi_lms", tweaks, "Qwen", "qwen3-4b-2507", "6 * 7?")
+        assert key != ResponseCache.make_key("math_eval_single_lms", tweaks, "Qwen", "qwen3-4b-2507", "6 * 8?")
+
+    @pytest.mark.unit
+    def test_modes(self, tmp_path):
+        """'read' serves hits, 'write' only stores, 'off' does neither."""
+        cache = ResponseCache(str(tmp_path / "responses.sqlite3"), mode="write")
+        cache.put("key", "42")
+        assert cache.get("key") is None
+        cache.mode = "read"
+        assert cache.get("key") == "42"
+        cache.mode = "off"
+        cache.put("other", "43")
+        cache.mode = "read"
+        assert cache.get("other") is None
+
+    @pytest.mark.unit
+    def test_ttl_expiry(self, tmp_path):
+        """Entries older than the TTL should be treated as misses."""
+        cache = ResponseCache(str(tmp_path / "responses.sqlite3"), mode="read", ttl=60)
+        with patch("time.time", return_value=1000.0):
+            cache.put("key", "42")
+        with patch("time.time", return_value=1030.0):
+            assert cache.get("key") == "42"
+        with patch("time.time", return_value=1100.0):
+            assert cache.get("key") is None
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_target_looks_up_once_off_the_loop(self, tmp_path):
+        """A cached response should be served with one cache lookup, made outside the event loop's thread."""
+        cache = ResponseCache(str(tmp_path / "responses.sqlite3"), mode="read")
+        cache.put(cache_key("6 * 7?", "Qwen", "qwen3-4b-2507", None, "math_eval_cached"), "42")
+        threads = []
+
+        def get(key):
+            threads.append(threading.get_ident())
+            return ResponseCache.get(cache, key)
+
+        async def run():
+            target = create_async_ls_target("Qwen", "qwen3-4b-2507", None, "math_eval_cached", asyncio.Semaphore(1))
+            with patch('single_vs_multi_agent.main.response_cache', cache), patch.object(cache, "get", get):
+                return await target({"question": "6 * 7?"})
+
+        assert asyncio.run(run()) == {"response": "42"}
+        assert len(threads) == 1
+        assert threads[0] != threading.get_ident()
+
+    @pytest.mark.unit
+    def test_lru_eviction(self, tmp_path):
+        """The least recently used entries should be evicted once the cache is over its size limit."""
+        cache = ResponseCache(str(tmp_path / "responses.sqlite3"), mode="read", max_bytes=20)
+        with patch("time.time", return_value=1.0):
+            cache.put("a", "x" * 8)
+        with patch("time.time", return_value=2.0):
+            cache.put("b", "y" * 8)
+        with patch("time.time", return_value=3.0):
+            assert cache.get("a") == "x" * 8  # "a" is now the most recently used
+        with patch("time.time", return_value=4.0):
+            cache.put("c", "z" * 8)
+        assert cache.get("a") == "x" * 8
+        assert cache.get("b") is None
+        assert cache.get("c") == "z" * 8
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_cache_hit_skips_langflow(self, tmp_path):
+        """A cached response should be returned without calling Langflow."""
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(200, json=_langflow_response("42"))
+
+        client = httpx.Client(base_url="http://langflow.test", transport=httpx.MockTransport(handler))
+        cache = ResponseCache(str(tmp_path / "responses.sqlite3"), mode="read")
+        with patch('single_vs_multi_agent.main.langflow_client', client), \
+                patch('single_vs_multi_agent.main.response_cache', cache):
+            first = call_langflow_api("6 * 7?", "Qwen", "qwen3-4b-2507", None, "math_eval_single_lms")
+            second = call_langflow_api("6 * 7?", "Qwen", "qwen3-4b-2507", None, "math_eval_single_lms")
+
+        assert first == second == "42"
+        assert len(requests_seen) == 1
+
+
+class TestJudgeCache:
+    """Test the LLM-as-judge verdict cache."""
+
+    @pytest.mark.unit
+    def test_wrapped_judge_is_called_once_per_triple(self, tmp_path):
+        """Judging the same (question, reference, prediction) triple again should not call the judge."""
+        cache = JudgeCache(str(tmp_path / "judges.sqlite3"), mode="read")
+        judge = Mock(return_value={"key": "correctness", "score": True, "comment": "Matches."})
+        evaluator = cache.wrap(judge, model="openai:gpt-5-mini", prompt_template="Grade {outputs}")
+
+        for _ in range(3):
+            result = evaluator(inputs="6 * 7?", outputs="42", reference_outputs="42")
+            assert result == {"key": "correctness", "score": True, "comment": "Matches."}
+        evaluator(inputs="6 * 7?", outputs="41", reference_outputs="42")
+
+        assert judge.call_count == 2
+
+    @pytest.mark.unit
+    def test_key_depends_on_model_and_template(self):
+        """Changing the judge model or the prompt template should invalidate cached verdicts."""
+        inputs = {"question": "6 * 7?", "answer": "42", "response": "42"}
+        key = JudgeCache.make_judge_key("gpt-5-mini", "Grade {response}", inputs)
+        assert key == JudgeCache.make_judge_key("gpt-5-mini", "Grade {response}", inputs)
+        assert key != JudgeCache.make_judge_key("gpt-5", "Grade {response}", inputs)
+        assert key != JudgeCache.make_judge_key("gpt-5-mini", "Score {response}", inputs)
+
+
+def _langflow_stream(*chunks, text=None):
+    """Build a Langflow streaming run API body: one token event per chunk, then the end event."""
+    events = [{"event": "add_message", "data": {"sender": "User", "text": "6 * 7?"}}]
+    events += [{"event": "token", "data": {"chunk": chunk}} for chunk in chunks]
+    if text is not None:
+        events.append({"event": "end", "data": {"result": _langflow_response(text)}})
+    return "\n\n".join(json.dumps(event) for event in events) + "\n\n"
+
+
+class TestStreaming:
+    """Test the streaming Langflow run API path."""
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_stream_records_timings_and_final_output(self):
+        """The final output should come from the end event, with a TTFT and inter-token latency."""
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(200, text=_langflow_stream("4", "2", text="42"))
+
+        client = httpx.Client(base_url="http://langflow.test", transport=httpx.MockTransport(handler))
+        output, timings = LangflowStreamer(enabled=True).run(
+            client, "/api/v1/run/math_eval_single_lms", {}, 5, parse_output
+        )
+        metrics = timings.metrics()
+
+        assert output == "42"
+        assert requests_seen[0].url.params["stream"] == "true"
+        assert metrics["token_events"] == 2
+        assert 0 <= metrics["ttft_s"] <= metrics["total_s"]
+        assert metrics["inter_token_latency_s"] is not None
+        assert metrics["cancelled"] is False
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_runaway_stream_is_cancelled(self):
+        """A run past its token budget should be cut short and return the partial answer."""
+        client = httpx.Client(
+            base_url="http://langflow.test",
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, text=_langflow_stream(*"abcdef"))),
+        )
+        output, timings = LangflowStreamer(enabled=True, max_tokens=3).run(
+            client, "/api/v1/run/math_eval_single_lms", {}, 5, parse_output
+        )
+
+        assert output == "abc"
+        assert timings.metrics()["cancelled"] is True
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_cancelled_call_fails_and_is_not_cached(self, tmp_path):
+        """A Langflow call cut short by its stream budget should fail instead of returning the partial answer."""
+        client = httpx.Client(
+            base_url="http://langflow.test",
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, text=_langflow_stream(*"abcdef"))),
+        )
+        cache = ResponseCache(str(tmp_path / "responses.sqlite3"), mode="read")
+        with patch('single_vs_multi_agent.main.langflow_client', client), \
+                patch('single_vs_multi_agent.main.response_cache', cache), \
+                patch('single_vs_multi_agent.main.langflow_streamer.enabled', True), \
+                patch('single_vs_multi_agent.main.langflow_streamer.max_tokens', 3), \
+                pytest.raises(LangflowCallError, match="cancelled"):
+            call_langflow_api("6 * 7?", "Qwen", "qwen3-4b-2507", None, "math_eval_single_lms")
+
+        assert cache.get(cache_key("6 * 7?", "Qwen", "qwen3-4b-2507", None, "math_eval_single_lms")) is None
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_silent_stream_is_cancelled_on_time(self):
+        """A stream that stops sending lines should still be cancelled once its time budget runs out."""
+        async def body():
+            yield (json.dumps({"event": "token", "data": {"chunk": "a"}}) + "\n\n").encode()
+            await asyncio.sleep(10)
+
+        async def run():
+            client = httpx.AsyncClient(
+                base_url="http://langflow.test",
+                transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body())),
+            )
+            return await LangflowStreamer(enabled=True, max_seconds=0.2).arun(
+                client, "/api/v1/run/math_eval_single_lms", {}, 5, parse_output
+            )
+
+        output, timings = asyncio.run(run())
+        assert output == "a"
+        assert timings.metrics()["cancelled"] is True
+        assert timings.metrics()["total_s"] < 2
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_streamed_call_is_used_when_enabled(self):
+        """Async calls should go through the streaming API when streaming is on, and report errors."""
+        async def handler(request):
+            body = _langflow_stream("4", "2", text="42")
+            if "error" in request.content.decode():
+                body = json.dumps({"event": "error", "data": {"error": "agent failed"}}) + "\n\n"
+            return httpx.Response(200, text=body)
+
+        async def run():
+            client = httpx.AsyncClient(base_url="http://langflow.test", transport=httpx.MockTransport(handler))
+            with patch('single_vs_multi_agent.main.langflow_async_client', client), \
+                    patch('single_vs_multi_agent.main.langflow_streamer.enabled', True):
+                ok = await acall_langflow_api("6 * 7?", "Qwen", "qwen3-4b-2507", None, "math_eval_single_lms")
+                with pytest.raises(LangflowCallError, match="Langflow run error: agent failed"):
+                    await acall_langflow_api("error", "Qwen", "qwen3-4b-2507", None, "math_eval_single_lms")
+            return ok
+
+        assert asyncio.run(run()) == "42"
+
+
+class TestPhases:
+    """Test the per-phase latency instrumentation."""
+
+    @pytest.mark.unit
+    def test_trace_events_are_grouped_into_phases(self):
+        """httpcore trace events should add up into connect, send, server and receive phases."""
+        timer = PhaseTimer()
+        for operation in ("connection.connect_tcp", "http11.send_request_headers",
+                          "http11.receive_response_headers", "http11.receive_response_body"):
+            timer.trace(f"{operation}.started", {})
+            timer.trace(f"{operation}.complete", {})
+        timer.trace("http11.response_closed.started", {})
+        with timer.phase("parse"):
+            pass
+        phases = timer.finish()
+
+        assert set(phases) == {"connect", "send", "server", "receive", "parse", "total"}
+        assert timer.metadata()["phase.total_s"] >= 0
+
+    @pytest.mark.unit
+    def test_report_percentiles_per_cell(self):
+        """The report should give nearest-rank p50/p90/p99 per (endpoint, provider, model) and phase."""
+        assert percentile([3, 1, 2, 4], 50) == 2
+        assert percentile([], 50) is None
+        report = LatencyReport()
+        for seconds in range(1, 101):
+            report.record(("math_eval_single_lms", "Qwen", "qwen3-4b-2507"), "server", seconds / 100)
+        report.record(("math_eval_single_lms", "Qwen", "qwen3-4b-2507"), "connect", 0.01)
+
+        rows = report.rows()
+        assert [row[1] for row in rows] == ["connect", "server"]
+        assert rows[1][2:] == (100, 0.5, 0.9, 0.99)
+
+    @pytest.mark.unit
+    def test_retry_backoff_is_its_own_phase(self):
+        """Waits between retries should be recorded as the backoff phase and left out of the total."""
+        timer = PhaseTimer()
+        breaker = CircuitBreaker("math_eval - Qwen")
+        attempt = Mock(side_effect=[httpx.ConnectError("down"), "ok"])
+        with patch('random.uniform', return_value=0.2):
+            assert call_with_retries(attempt, breaker, on_backoff=timer.backoff) == "ok"
+        phases = timer.finish()
+
+        assert phases["backoff"] == pytest.approx(0.2)
+        assert phases["total"] < 0.1
+
+
+class TestTokens:
+    """Test the token accounting."""
+
+    @pytest.mark.unit
+    def test_langflow_usage_is_preferred(self):
+        """Usage reported by Langflow should be used as is, without counting the texts."""
+        response = _langflow_response("42")
+        response["outputs"][0]["outputs"][0]["results"]["message"]["data"]["properties"] = {
+            "usage": {"input_tokens": 12, "output_tokens": 3}
+        }
+        usage = extract_usage(response)
+        accountant = TokenAccountant()
+        prompt = accountant.count("Qwen", "qwen3-4b-2507", "What is 6 * 7?")
+        counts = accountant.measure(("math_eval_single_lms", "Qwen", "qwen3-4b-2507"), "Qwen", "qwen3-4b-2507",
+                                    prompt, "42", usage)
+
+        assert extract_usage(_langflow_response("42")) is None
+        assert counts == {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15, "source": "langflow"}
+
+    @pytest.mark.unit
+    def test_texts_are_counted_in_the_background(self):
+        """Without usage, prompt and completion should be counted off-thread and summed per cell."""
+        cell = ("math_eval_single_lms", "Qwen", "qwen3-4b-2507")
+        accountant = TokenAccountant()
+
+        async def run():
+            prompt = accountant.count("Qwen", "qwen3-4b-2507", "x" * 40)
+            return await accountant.ameasure(cell, "Qwen", "qwen3-4b-2507", prompt, "y" * 8)
+
+        counts = asyncio.run(run())
+        assert counts == {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12, "source": "estimate"}
+        assert accountant.rows() == [(cell, {"calls": 1, "estimate": 1, "prompt_tokens": 10,
+                                             "completion_tokens": 2, "total_tokens": 12})]
+
+
+class TestResilience:
+    """Test retries, circuit breaking and adaptive concurrency."""
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_transient_errors_are_retried(self):
+        """A 503 from Langflow should be retried, and the retried answer returned."""
+        statuses = [503, 200]
+
+        async def handler(request):
+            status = statuses.pop(0)
+            return httpx.Response(status, json=_langflow_response("42") if status == 200 else {})
+
+        async def run():
+            client = httpx.AsyncClient(base_url="http://langflow.test", transport=httpx.MockTransport(handler))
+            with patch('single_vs_multi_agent.main.langflow_async_client', client), \
+                    patch('random.uniform', return_value=0):
+                return await acall_langflow_api("6 * 7?", "Qwen", "qwen3-4b-2507", None, "math_eval_retry")
+
+        assert asyncio.run(run()) == "42"
+        assert statuses == []
+
+    @pytest.mark.unit
+    def test_breaker_opens_and_probes(self):
+        """Consecutive failures should open the breaker, and one probe should close it again."""
+        breaker = CircuitBreaker("math_eval - Qwen", failure_threshold=2, reset_seconds=0)
+        failing = Mock(side_effect=httpx.ConnectError("down"))
+        for _ in range(2):
+            with patch('random.uniform', return_value=0), pytest.raises(httpx.ConnectError):
+                call_with_retries(failing, breaker)
+        assert breaker.state == "open"
+
+        breaker.reset_seconds = 60
+        with pytest.raises(CircuitOpenError):
+            call_with_retries(failing, breaker)
+        breaker.reset_seconds = 0
+        assert call_with_retries(lambda: "ok", breaker) == "ok"
+        assert breaker.state == "closed"
+
+    @pytest.mark.unit
+    def test_concurrency_adapts(self):
+        """The limit should grow additively on healthy calls and halve on failures."""
+        limiter = ProviderLimiter("OpenAI", concurrency=4, max_concurrency=8)
+        for _ in range(20):
+            limiter.record_result(1.0)
+        assert 6 <= limiter.limit <= 8
+
+        limiter.record_result(1.0, ok=False)
+        assert 3 <= limiter.limit <= 4
+        limiter.record_result(1.0, ok=False)  # same burst, not halved again
+        assert limiter.limit >= 3
+
+
+class TestJournal:
+    """Test the checkpoint journal that makes runs resumable."""
+
+    @pytest.mark.unit
+    def test_entries_and_experiments(self, tmp_path):
+        """Recorded entries should survive a reopen, and reset() should forget them."""
+        cell = ("math_eval_single_lms", "Qwen", "qwen3-4b-2507")
+        journal = RunJournal(str(tmp_path / "journal.sqlite3"))
+        key = example_key({"question": "6 * 7?"})
+        journal.put(cell, key, "output", "42")
+        journal.put(cell, key, "score.correctness", {"score": True})
+        journal.put(cell, example_key({"question": "1 + 1?"}), "output", None)
+        journal.set_experiment(cell, "math_eval_single_lms-Qwen-qwen3-4b-2507-1a2b")
+        journal.close()
+
+        assert journal.get(cell, key) == "42"
+        assert journal.get(cell, key, "score.correctness") == {"score": True}
+        assert journal.get(("math_eval_multi_lms", "Qwen", "qwen3-4b-2507"), key) is None
+        assert journal.finished(cell) == 1
+        assert journal.experiment(cell) == "math_eval_single_lms-Qwen-qwen3-4b-2507-1a2b"
+        journal.reset()
+        assert journal.get(cell, key) is None
+        assert journal.experiment(cell) is None
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_journaled_outputs_are_replayed(self, run_journal):
+        """A finished example should be replayed without Langflow; a failed one should be retried."""
+        statuses = [200, 400, 200]
+
+        async def handler(request):
+            status = statuses.pop(0)
+            return httpx.Response(status, json=_langflow_response("42") if status == 200 else {})
+
+        async def run(question):
+            client = httpx.AsyncClient(base_url="http://langflow.test", transport=httpx.MockTransport(handler))
+            target = create_async_ls_target("Qwen", "qwen3-4b-2507", None, "math_eval_journal", asyncio.Semaphore(2))
+            with patch('single_vs_multi_agent.main.langflow_async_client', client):
+                return await target({"question": question})
+
+        assert asyncio.run(run("6 * 7?")) == {"response": "42"}
+        assert asyncio.run(run("6 * 7?")) == {"response": "42"}
+        with pytest.raises(LangflowCallError, match="API Error:"):
+            asyncio.run(run("1 + 1?"))
+        assert asyncio.run(run("1 + 1?")) == {"response": "42"}
+        assert statuses == []
+        assert run_journal.finished(("math_eval_journal", "Qwen", "qwen3-4b-2507")) == 2
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_message_without_text_is_not_journaled(self, run_journal):
+        """A message without text should be returned as None, as before, and not be journaled."""
+        async def handler(request):
+            return httpx.Response(200, json=_langflow_response(None))
+
+        async def run():
+            client = httpx.AsyncClient(base_url="http://langflow.test", transport=httpx.MockTransport(handler))
+            target = create_async_ls_target("Qwen", "qwen3-4b-2507", None, "math_eval_empty", asyncio.Semaphore(2))
+            with patch('single_vs_multi_agent.main.langflow_async_client', client):
+                return await target({"question": "6 * 7?"})
+
+        assert asyncio.run(run()) == {"response": None}
+        assert run_journal.finished(("math_eval_empty", "Qwen", "qwen3-4b-2507")) == 0
+
+    @pytest.mark.unit
+    def test_runs_without_a_response_are_pending(self):
+        """Resuming should retry examples whose run returned no response, not only failed ones."""
+        client = Mock()
+        client.list_runs.return_value = [
+            SimpleNamespace(reference_example_id="done", outputs={"response": "42"}),
+            SimpleNamespace(reference_example_id="empty", outputs={"response": None}),
+        ]
+        examples = [SimpleNamespace(id=example_id) for example_id in ("done", "empty", "new")]
+        with patch('single_vs_multi_agent.main.get_ls_client', return_value=client):
+            assert [example.id for example in pending_examples("experiment", "Math Dataset", examples)] == [
+                "empty", "new",
+            ]
+
+
+class TestSessionRegistry:
+    """Test the registry of the Langflow sessions a run creates."""
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_calls_register_their_sessions(self, session_registry):
+        """Each Langflow request should register the session id it sent."""
+        sent = []
+
+        def handler(request):
+            sent.append(json.loads(request.content)["session_id"])
+            return httpx.Response(200, json=_langflow_response("42"))
+
+        client = httpx.Client(base_url="http://langflow.test", transport=httpx.MockTransport(handler))
+        with patch('single_vs_multi_agent.main.langflow_client', client):
+            call_langflow_api("6 * 7?", "Qwen", "qwen3-4b-2507", None, "math_eval_single_lms")
+            call_langflow_api("1 + 1?", "Qwen", "qwen3-4b-2507", None, "math_eval_single_lms")
+
+        assert session_registry.sessions() == sent
+        assert len(set(sent)) == 2
+
+    @pytest.mark.unit
+    @pytest.mark.mock
+    def test_run_sessions_are_deleted_without_scanning(self, tmp_path):
+        """Only the run's own sessions should be deleted, and deleted ones forgotten."""
+        registry = SessionRegistry(str(tmp_path / "sessions.sqlite3"), run_id="run-1", flush_every=2)
+        for session_id in ("a", "b", "c"):
+            registry.add("math_eval_single_lms", session_id)
+        other_run = SessionRegistry(registry.path, run_id="run-2")
+        other_run.add("math_eval_single_lms", "other")
+        other_run.close()
+        assert registry.latest_run() == "run-2"
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append((request.method, request.url.path))
+            return httpx.Response(500 if request.url.path.endswith("/c") else 204)
+
+        client = httpx.Client(base_url="http://langflow.test", transport=httpx.MockTransport(handler))
+        assert delete_run_sessions(client, registry, concurrency=2) == (2, 1)
+        assert sorted(requests_seen) == [
+            ("DELETE", f"/api/v1/monitor/messages/session/{session_id}") for session_id in ("a", "b", "c")
+        ]
+        assert registry.sessions() == ["c"]
+        assert registry.sessions("run-2") == ["other"]
+        registry.close()
+
+
+class TestFusedJudge:
+    """Test the fused multi-criteria judge."""
+
+    @pytest.mark.unit
+    def test_verdict_fans_out_per_criterion(self):
+        """Every criterion should get its own clamped result, and unscored ones none."""
+        criteria = parse_criteria("correctness, conciseness,hallucination")
+        prompt = render_prompt(criteria)
+        assert "- conciseness:" in prompt and "{outputs}" in prompt
+        assert fused_schema(criteria)["required"] == list(criteria)
+        verdict = {
+            "correctness": {"reasoning": "Right answer", "score": 1.5},
+            "conciseness": {"reasoning": "Rambles", "score": 0.25},
+            "hallucination": {"reasoning": "No score"},
+        }
+        assert fan_out(verdict, criteria) == [
+            {"key": "correctness", "score": 1.0, "comment": "Right answer"},
+            {"key": "conciseness", "score": 0.25, "comment": "Rambles"},
+        ]
+        with pytest.raises(ValueError):
+            parse_criteria("correctness,tone")
+
+    @pytest.mark.unit
+    def test_criteria_share_one_judge_call(self):
+        """Concurrent evaluators of the same example should make a single judge call."""
+        verdicts = SharedVerdicts(readers=3)
+        calls = []
+
+        async def judge():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"correctness": {"reasoning": "ok", "score": 1.0}}
+
+        async def evaluate_example():
+            return await asyncio.gather(*(verdicts.aget("example", judge) for _ in range(3)))
+
+        results = asyncio.run(evaluate_example())
+        assert len(calls) == 1
+        assert all(result == results[0] for result in results)
+        # The verdict is dropped once every criterion has read it
+        assert not verdicts._entries  # pylint: disable=protected-access
+
+
+class TestMetrics:
+    """Test the vectorized local reference metrics."""
+
+    @pytest.mark.unit
+    def test_scores_against_reference(self):
+        """Each metric should score outputs against their own reference answer."""
+        scores = compute_metrics(
+            ["The answer is 42.", "It is 41", ""],
+            ["the answer is 42", "The answer is 42", "42"],
+        )
+        assert scores["exact_match"].tolist() == [1.0, 0.0, 0.0]
+        assert scores["token_f1"][1] == pytest.approx(2 * 1 / 7)  # only "is" is shared
+        assert scores["length_ratio"].tolist() == pytest.approx([1.0, 0.75, 0.0])
+        assert scores["tfidf_cosine"][0] == pytest.approx(1.0)
+        assert 0.0 < scores["tfidf_cosine"][1] < 1.0
+        assert scores["rouge_l"][2] == 0.0
+
+    @pytest.mark.unit
+    def test_rouge_l_matches_dynamic_programming(self):
+        """The batched ROUGE-L should equal a per-pair LCS across chunk boundaries."""
+        def lcs(a, b):
+            table = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+            for i, token_a in enumerate(a):
+                for j, token_b in enumerate(b):
+                    if token_a == token_b:
+                        table[i + 1][j + 1] = table[i][j] + 1
+                    else:
+                        table[i + 1][j + 1] = max(table[i][j + 1], table[i + 1][j])
+            return table[-1][-1]
+
+        words = "a b c d e".split()
+        outputs = [" ".join(words[(i * 3 + k) % 5] for k in range(i % 7)) for i in range(40)]
+        references = [" ".join(words[(i + k * 2) % 5] for k in range(i % 5 + 1)) for i in range(40)]
+        scores = compute_metrics(outputs, references, chunk_size=16)
+        for output, reference, score in zip(outputs, references, scores["rouge_l"]):
+            a, b = tokenize(output), tokenize(reference)
+            assert score == pytest.approx(2 * lcs(a, b) / (len(a) + len(b)))
+
+
+class TestMathCheck:
+    """Test the local math answer checker."""
+
+    @pytest.mark.unit
+    def test_extracts_final_number_and_unit(self):
+        """The final answer should win over intermediate numbers, with its unit normalized."""
+        assert extract_answer("Step 1 gives 7, so the final answer is 1,234.5 meters.") == (1234.5, "m")
+        assert extract_answer("The answer is \\boxed{3/4}. We used 2 steps.") == (0.75, None)
+        assert extract_answer("I cannot solve this.") is None
+        assert parse_rounding("3 significant figures")(12345) == 12300
+        assert parse_rounding("nearest tenth")(2.46) == 2.5
+
+    @pytest.mark.unit
+    def test_reads_the_marked_answer(self):
+        """The first number after an answer marker is the answer, and rounding echoes are not answers."""
+        assert extract_answer("The answer is 12.35 (rounded to 2 decimal places).") == (12.35, None)
+        assert extract_answer("Total cost is $12.35, rounded to 2 decimal places.") == (12.35, "usd")
+        assert extract_answer("The answer is 5 and the remainder is 0") == (5.0, None)
+        assert extract_answer("x = 7 in 2024") == (7.0, None)
+        assert extract_answer("x = 3 + 4 = 7") == (7.0, None)
+        # Unmarked numbers that disagree leave the answer to the judge
+        assert extract_answer("Step 1 gives 7, then 9") is None
+        assert check_math("The answer is 12.35 (rounded to 2 decimal places).", "12.35")["score"] is True
+
+    @pytest.mark.unit
+    def test_rounds_half_up_on_decimal_digits(self):
+        """Halves should round up on the written digits, not on their binary approximation."""
+        assert parse_rounding("2 decimal places")(2.675) == 2.68
+        assert parse_rounding("nearest tenth")(-0.25) == -0.3
+        assert parse_rounding("2 significant figures")(0.0125) == 0.013
+        assert check_math("2.675", "2.68", {"Rounding": "2 decimal places"})["score"] is True
+
+    @pytest.mark.unit
+    def test_applies_rounding_and_units(self):
+        """Answers should be rounded per the example and converted to the reference's unit."""
+        metadata = {"Unit": "m/s", "Rounding": "2 decimal places"}
+        assert check_math("The speed is 3.14159 m/s", "3.14", metadata)["score"] is True
+        assert check_math("The speed is 3.2 m/s", "3.14", metadata)["score"] is False
+        assert check_math("12.3", "12.35", {"Rounding": "two decimal places"})["score"] is False
+        assert check_math("12.3456", "12.35", {"Rounding": "two decimal places"})["score"] is True
+        assert check_math("It takes 5 minutes", "300 s")["score"] is True
+        assert check_math("It takes 12 minutes", "12 seconds", {"Unit": "s"})["score"] is False
+        # Answers without a number or with units of another quantity are left to the LLM-as-judge
+        assert check_math("It depends on the mass.", "3.14", metadata) is None
+        assert check_math("It weighs 5 kg", "300 s") is None
+
+
+class TestJudgeCascade:
+    """Test the check, small judge and large judge cascade."""
+
+    @staticmethod
+    def stage(calls, name, score):
+        """Return a judge for `name` that records its calls and returns `score`."""
+        def judge():
+            calls.append(name)
+            return None if score is None else {"key": "correctness", "score": score, "comment": name}
+        return judge
+
+    @pytest.mark.unit
+    def test_escalates_only_uncertain_examples(self):
+        """The large judge should only be called when the earlier stages are not confident."""
+        stats = CascadeStats()
+        cascade = JudgeCascade("correctness", parse_band("0.3,0.7"), stats)
+        for check, small in ((1.0, 0.5), (None, 0.9), (None, 0.5), (None, 0.1)):
+            calls = []
+            result = cascade.run([
+                ("check", self.stage(calls, "check", check)),
+                ("small", self.stage(calls, "small", small)),
+                ("large", self.stage(calls, "large", 0.8)),
+            ])
+            assert result["comment"] == calls[-1]
+            assert ("large" in calls) == (check is None and small == 0.5)
+        assert stats.hit_rates()["correctness"] == {"check": 0.25, "small": 0.5, "large": 0.25}
+
+    @pytest.mark.unit
+    def test_escalates_on_disagreement(self):
+        """A confident small verdict that contradicts a confident hint should reach the large judge."""
+        cascade = JudgeCascade("correctness", (0.3, 0.7), CascadeStats())
+        calls = []
+        stages = [("small", self.stage(calls, "small", 1.0)), ("large", self.stage(calls, "large", 0.0))]
+        assert cascade.run(stages, hint=0.1)["score"] == 0.0
+        assert cascade.run(stages, hint=0.5)["score"] == 1.0  # an uncertain hint is ignored
+        assert calls == ["small", "large", "small"]
+        assert reference_check("correctness", "The answer is 42.", "the answer is 42")["score"] == 1.0
+        assert reference_check("conciseness", "", "42") is None
+        with pytest.raises(ValueError):
+            parse_band("0.8,0.2")
+
+
+class TestPaired:
+    """Test the paired comparison of the endpoints."""
+
+    @pytest.mark.unit
+    def test_endpoints_wait_for_each_other(self):
+        """An example should only be sent once every endpoint reached it or left."""
+        pairing = PairedComparison(["single", "multi"], wait_seconds=5)
+        model = ("Qwen", "qwen3-4b-2507")
+
+        async def run():
+            first = asyncio.create_task(pairing.arrive(model, "a", "single"))
+            await asyncio.sleep(0.01)
+            assert not first.done()
+            await pairing.arrive(model, "a", "multi")
+            await asyncio.wait_for(first, 1)
+            # An endpoint whose experiment ended is no longer waited for
+            waiting = asyncio.create_task(pairing.arrive(model, "b", "single"))
+            await asyncio.sleep(0.01)
+            pairing.leave(model, "multi")
+            await asyncio.wait_for(waiting, 1)
+
+        asyncio.run(run())
+
+    @pytest.mark.unit
+    def test_paired_deltas(self):
+        """Latency and correctness deltas should be taken against the first endpoint on the same example."""
+        pairing = PairedComparison(["single", "multi"])
+        model = ("Qwen", "qwen3-4b-2507")
+        example = SimpleNamespace(inputs={"question": "6 * 7?"}, outputs={"answer": "42"})
+        for endpoint, latency, response in (("single", 1.5, "It is 41"), ("multi", 4.0, "The answer is 42")):
+            pairing.record(model, "6 * 7?", endpoint, latency=latency)
+            evaluator = create_paired_evaluator(pairing, model, endpoint, lambda inputs: inputs["question"])
+            run = SimpleNamespace(id=endpoint, outputs={"response": response}, error=None)
+            assert evaluator(run, example)["score"] == (1.0 if endpoint == "multi" else 0.0)
+
+        assert pairing.deltas() == [{
+            "model": model, "key": "6 * 7?", "endpoint": "multi", "run_id": "multi", "latency": 2.5, "score": 1.0,
+        }]
+
+        # A failed run is scored None and never recorded, so it makes no pair with the baseline
+        pairing.record(model, "1 + 1?", "single", latency=1.0, score=1.0, run_id="single")
+        failed = SimpleNamespace(inputs={"question": "1 + 1?"}, outputs={"answer": "2"})
+        evaluator = create_paired_evaluator(pairing, model, "multi", lambda inputs: inputs["question"])
+        run = SimpleNamespace(id="failed", outputs=None, error="LangflowCallError: API Error: 500")
+        assert evaluator(run, failed)["score"] is None
+        assert len(pairing.deltas()) == 1
+
+    @pytest.mark.unit
+    def test_limits_fit_a_pair(self):
+        """A provider limiter sized for a pair should never adapt below the number of endpoints."""
+        limiter = ProviderLimiter("Qwen", concurrency=1)
+        limiter.ensure_concurrency(2)
+        limiter.record_result(1.0, ok=False)
+        assert limiter.limit == 2
+        assert limiter.max_concurrency == 2
+
+
+class TestAdaptive:
+    """Test the sequential early stopping of the paired comparison."""
+
+    @pytest.mark.unit
+    def test_sequential_decisions(self):
+        """A clear difference should be detected, and ties only count as equivalent after enough pairs."""
+        better = SequentialTest(confidence=0.95, margin=0.05, min_pairs=5)
+        for value in [1.0, 0.0, 1.0, 1.0] * 10:
+            better.add(value)
+        assert better.decision() == "higher"
+        assert better.interval()[0] > 0
+
+        ties = SequentialTest(confidence=0.95, margin=0.05, min_pairs=5)
+        decisions = []
+        for _ in range(1000):
+            ties.add(0.0)
+            decisions.append(ties.decision())
+        assert decisions[20] is None
+        assert decisions[-1] == "equivalent"
+
+    @pytest.mark.unit
+    def test_stops_streaming_once_settled(self):
+        """Examples should stop being sent once every comparison is settled, and the saved calls counted."""
+        stopping = AdaptiveStopping(["single", "multi"], min_pairs=3, seed=7)
+        stopping.shuffle(range(100))
+        model = ("Qwen", "qwen3-4b-2507")
+
+        async def run():
+            sent = []
+            async for example in stopping.stream(model, "multi"):
+                sent.append(example)
+                stopping.add(model, "multi", latency=5.0 + example % 2, score=1.0)
+            return sent
+
+        sent = asyncio.run(run())
+        assert 3 <= len(sent) < 100
+        assert sent == stopping.examples[:len(sent)]
+        assert stopping.calls_saved() == 100 - len(sent)
+
+    @pytest.mark.unit
+    def test_unseen_model_is_undecided_without_creating_tests(self):
+        """Asking about a model without pairs should not settle it nor add empty rows to the report."""
+        stopping = AdaptiveStopping(["single", "multi"], min_pairs=3)
+
+        assert not stopping.decided(("Qwen", "qwen3-4b-2507"))
+        assert not stopping._tests
+
+
+    @pytest.mark.unit
+    def test_only_paired_calls_feed_latency(self):
+        """Cache replays and unpaired calls should add to the score test but not to the latency test."""
+        stopping = AdaptiveStopping(["single", "multi"], min_pairs=3)
+        pairing = PairedComparison(["single", "multi"], wait_seconds=0.01, on_pair=stopping.add)
+        model = ("Qwen", "qwen3-4b-2507")
+
+        async def run():
+            assert not await pairing.arrive(model, "a", "single")  # "multi" never came
+            pairing.check_in(model, "b", "multi")
+            assert await pairing.arrive(model, "b", "single")
+
+        asyncio.run(run())
+        pairing.record(model, "a", "single", latency=None, score=1.0)
+        pairing.record(model, "a", "multi", latency=None, score=0.0)
+        pairing.record(model, "b", "single", latency=1.0, score=1.0)
+        pairing.record(model, "b", "multi", latency=3.0, score=1.0)
+        assert stopping._test(model, "multi", "score").n == 2
+        assert stopping._test(model, "multi", "latency").n == 1
+        assert stopping._test(model, "multi", "latency").mean == 2.0
+
+
+class TestSubset:
+    """Test the stratified, stable subset builder."""
+
+    @staticmethod
+    def records(units, count=40):
+        return [
+            (f"id-{i}", {"question": f"Question {i}?", "metadata": {"Unit": units[i % len(units)]}},
+             {"Unit": units[i % len(units)]})
+            for i in range(count)
+        ]
+
+    @pytest.mark.unit
+    def test_select_is_stratified_and_stable(self):
+        """Every stratum should be sampled, and growing the dataset should keep the chosen examples of a stratum."""
+        assert allocate({("a",): 30, ("b",): 8, ("c",): 2}, 6) == {("a",): 3, ("b",): 2, ("c",): 1}
+        records = self.records(["m", "s", "kg"])
+        chosen = select_subset(records, 0.1, ["Unit"])
+        assert len(chosen) == 4
+        units = {record[2]["Unit"] for record in records if record[0] in chosen}
+        assert units == {"m", "s", "kg"}
+        assert select_subset(list(reversed(records)), 0.1, ["Unit"]) == chosen
+
+    @pytest.mark.unit
+    def test_cached_ids_until_dataset_changes(self, tmp_path):
+        """Cached ids of a dataset version should be read without listing the dataset, and a new version re-chosen."""
+        cache = SubsetCache(str(tmp_path / "subsets.json"))
+        examples = [
+            SimpleNamespace(id=record[0], inputs=record[1], metadata={}) for record in self.records(["m", "s"])
+        ]
+        by_id = {example.id: example for example in examples}
+        list_examples = Mock(return_value=examples)
+
+        def subset(name, version="v1", keys=("Unit", "length")):
+            return subset_examples(
+                "dataset-id", version, name, cache, keys, list_examples, lambda ids: [by_id[i] for i in ids]
+            )
+
+        smoke = subset("smoke")
+        assert 0 < len(smoke) < len(examples)
+        list_examples.reset_mock()
+        with patch('evals_common.subset.select_subset') as select:
+            assert subset("smoke") == smoke
+            select.assert_not_called()
+        list_examples.assert_not_called()
+        assert subset("full") == examples
+
+        # A new version or other strata choose the subset again
+        list_examples.reset_mock()
+        list_examples.return_value = [SimpleNamespace(id="new", inputs={"question": "?"}, metadata={})]
+        assert [example.id for example in subset("smoke", version="v2")] == ["new"]
+        assert cache.get("dataset-id", "v2", "smoke", ["Unit"]) is None
+        list_examples.assert_called_once()
@@ -1,12 +1,28 @@
 """
 This script deletes all sessions for a given flow endpoint name.
+Message pages are fetched by a producer while a pool of workers deletes the
+sessions found so far over one pooled connection, at a bounded rate. Deleting
+messages shifts the pages still to be fetched, so the flow is scanned again
+until a pass finds no new sessions.
+With `--run <id>` only the sessions a harness run registered in its session
+registry are deleted, without scanning the flow's messages at all.
 """
 import os
 import sys
+import time
+import asyncio
 import argparse
-import requests
+import httpx
 from dotenv import load_dotenv
 
+# The session registry lives in the evals_common package at the repository root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+# pylint: disable=wrong-import-position
+from evals_common.session_registry import SessionRegistry, adelete_session
+# pylint: enable=wrong-import-position
+
 # Load environment variables from .env file in the project root
 # This allows the script to be run from any directory
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
@@ -21,6 +37,13 @@ API_KEY = os.getenv("LANGFLOW_API_KEY")
 
 # Default flow endpoint name (can be overridden by command line argument)
 DEFAULT_FLOW_ENDPOINT_NAME = os.getenv("FLOW_ENDPOINT_NAME", "evals_in_langflow")
+
+# Deletions in flight at once, and most deletions per second (0 = unbounded)
+DEFAULT_CONCURRENCY = int(os.getenv("DELETE_CONCURRENCY", "8"))
+DEFAULT_RATE = float(os.getenv("DELETE_RATE", "20"))
+
+# Session registry written by the harnesses (relative to the directory a harness runs in)
+DEFAULT_REGISTRY = os.getenv("SESSION_REGISTRY_PATH", ".langflow_cache/sessions.sqlite3")
 # ────────────────────────────────────────────────────────────────────────────────
 
 HEADERS = {
@@ -28,10 +51,58 @@ HEADERS = {
     "x-api-key": API_KEY,
 }
 
-def get_flow_id_by_name(endpoint_name: str) -> str | None:
-    """Fetch the ID of a flow by its endpoint name."""
+# Messages fetched per page
+PER_PAGE = 50
+# Seconds between progress lines
+PROGRESS_INTERVAL = 2.0
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart; a rate of 0 means unbounded."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        """Wait for the next free slot."""
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Progress:
+    """Counts of the sessions found, deleted and failed, with a throughput line."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.pages = 0
+        self.found = 0
+        self.deleted = 0
+        self.failed = 0
+        self.cleared = []
+
+    def line(self) -> str:
+        """Return a one-line summary of the progress so far."""
+        seconds = time.perf_counter() - self.start
+        rate = self.deleted / seconds if seconds > 0 else 0.0
+        scanned = f"{self.pages} page(s) scanned, " if self.pages else ""
+        return (
+            f"{scanned}{self.found} session(s) found, "
+            f"{self.deleted} deleted, {self.failed} failed ({rate:.1f} sessions/s, {seconds:.1f}s)"
+        )
+
+
+async def get_flow_id_by_name(client: httpx.AsyncClient, endpoint_name: str) -> str | None:
+    """Fetch the ID of a flow by its endpoint name, listing flow headers only."""
     print(f"Searching for flow with endpoint name: {endpoint_name}")
-    resp = requests.get(f"{LANGFLOW_URL}/api/v1/flows/", headers=HEADERS, timeout=30)
+    resp = await client.get("/api/v1/flows/", params={"header_flows": "true", "get_all": "true"}, timeout=30)
     resp.raise_for_status()
     flows = resp.json()  # The endpoint returns a list directly
     for flow in flows:
@@ -41,20 +112,114 @@ def get_flow_id_by_name(endpoint_name: str) -> str | None:
     print("Flow not found.")
     return None
 
-def delete_session_messages(session_id: str):
-    """Delete all stored messages for one session."""
-    resp = requests.delete(
-        f"{LANGFLOW_URL}/api/v1/monitor/messages/session/{session_id}",
-        headers={"x-api-key": API_KEY},
-        timeout=30
-    )
-    # A 204 No Content status is a success for DELETE operations.
-    if resp.status_code == 200 or resp.status_code == 204:
-        print(f"✔ Cleared messages for session {session_id}")
-        return True
-    else:
-        print(f"✖ Failed to clear {session_id}: {resp.status_code} {resp.text}")
-        return False
+
+async def produce_sessions(client, flow_id, queue, seen, progress, per_page=PER_PAGE) -> int:
+    """Page through the flow's messages and queue each session not seen before; returns how many were queued."""
+    queued = 0
+    page = 1
+    while True:
+        resp = await client.get(
+            "/api/v1/monitor/messages",
+            params={"flow_id": flow_id, "page": page, "per_page": per_page},
+            timeout=60,  # Increased timeout for potentially slower API calls
+        )
+        resp.raise_for_status()
+        messages = resp.json()
+        progress.pages += 1
+        for msg in messages:
+            session_id = msg.get("session_id") if isinstance(msg, dict) else None
+            if session_id and session_id not in seen:
+                seen.add(session_id)
+                progress.found += 1
+                queued += 1
+                await queue.put(session_id)  # waits while the workers are behind
+        # If we received fewer messages than we asked for, we're on the last page
+        if len(messages) < per_page:
+            return queued
+        page += 1
+
+
+async def delete_worker(client, queue, limiter, progress, dry_run):
+    """Delete queued sessions until cancelled."""
+    while True:
+        session_id = await queue.get()
+        try:
+            if dry_run:
+                print(f"Would clear messages for session {session_id}")
+                progress.deleted += 1
+                continue
+            await limiter.wait()
+            if await adelete_session(client, session_id):
+                progress.deleted += 1
+                progress.cleared.append(session_id)
+            else:
+                print(f"✖ Failed to clear {session_id}")
+                progress.failed += 1
+        finally:
+            queue.task_done()
+
+
+async def report_progress(progress):
+    """Print a progress line every PROGRESS_INTERVAL seconds until cancelled."""
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        print(f"… {progress.line()}")
+
+
+async def queue_sessions(session_ids, queue, progress) -> int:
+    """Queue known session ids, e.g. those of a registered run; returns how many were queued."""
+    for session_id in session_ids:
+        progress.found += 1
+        await queue.put(session_id)
+    return len(session_ids)
+
+
+def registered_sessions(registry, run_id):
+    """
+    Return the (run id, session ids) of a run in a harness session registry;
+    a run id of `latest` selects the most recent run.
+    """
+    if run_id == "latest":
+        run_id = registry.latest_run()
+        if run_id is None:
+            return None, []
+    return run_id, registry.sessions(run_id)
+
+
+async def delete_sessions(client, flow_id, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                          dry_run=False, per_page=PER_PAGE, session_ids=None) -> Progress:
+    """
+    Delete every session of a flow, deleting while the next pages are fetched,
+    or only the given `session_ids` without scanning the flow.
+    A dry run only lists the sessions of a single pass.
+    """
+    progress = Progress()
+    queue = asyncio.Queue(maxsize=concurrency * 4)
+    limiter = RateLimiter(rate)
+    seen = set()
+    workers = [
+        asyncio.create_task(delete_worker(client, queue, limiter, progress, dry_run))
+        for _ in range(concurrency)
+    ]
+    reporter = asyncio.create_task(report_progress(progress))
+    try:
+        if session_ids is not None:
+            await queue_sessions(session_ids, queue, progress)
+            await queue.join()
+        while session_ids is None:
+            pages = progress.pages
+            queued = await produce_sessions(client, flow_id, queue, seen, progress, per_page)
+            await queue.join()
+            # A single page cannot have shifted under the deletions
+            if dry_run or not queued or progress.pages - pages == 1:
+                break
+            print(f"Queued {queued} session(s), scanning again for messages on shifted pages...")
+    finally:
+        for task in (*workers, reporter):
+            task.cancel()
+        await asyncio.gather(*workers, reporter, return_exceptions=True)
+    return progress
+
 
 def parse_arguments():
     """Parse command line arguments."""
@@ -65,6 +230,9 @@ def parse_arguments():
 Examples:
   python delete_sessions.py                           # Use default from environment
   python delete_sessions.py my_flow_endpoint          # Delete sessions for specific flow
+  python delete_sessions.py --dry-run                 # List the sessions without deleting them
+  python delete_sessions.py --concurrency 16 --rate 50
+  python delete_sessions.py --run latest --registry ../langsmith/python/.langflow_cache/sessions.sqlite3
   python delete_sessions.py --help                    # Show this help message
         """
     )
@@ -74,70 +242,108 @@ Examples:
         default=DEFAULT_FLOW_ENDPOINT_NAME,
         help=f"Flow endpoint name to delete sessions for (default: {DEFAULT_FLOW_ENDPOINT_NAME})"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--flow-id",
+        help="ID of the flow, which skips looking it up by endpoint name"
+    )
+    parser.add_argument(
+        "--run",
+        help="Delete only the sessions a harness run registered (a run id, or 'latest') instead of scanning the flow"
+    )
+    parser.add_argument(
+        "--registry",
+        default=DEFAULT_REGISTRY,
+        help=f"Session registry of the harness, used with --run (default: {DEFAULT_REGISTRY})"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Deletions in flight at once (default: {DEFAULT_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help=f"Most deletions per second, 0 for unbounded (default: {DEFAULT_RATE:g})"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only list the sessions that would be deleted"
+    )
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.run and not os.path.exists(args.registry):
+        parser.error(f"session registry {args.registry} not found, pass the one of the harness with --registry")
+    return args
 
-def main():
-    if not API_KEY or not LANGFLOW_URL:
-        print("❌ Error: LANGFLOW_URL or LANGFLOW_API_KEY is not configured.", file=sys.stderr)
-        print("Please set the following environment variables:", file=sys.stderr)
-        print("  - LANGFLOW_URL: Your Langflow instance URL (e.g., from Phoenix Cloud).", file=sys.stderr)
-        print("  - LANGFLOW_API_KEY: Your Langflow API key.", file=sys.stderr)
-        sys.exit(1)
 
-    # Parse command line arguments
-    args = parse_arguments()
-    flow_endpoint_name = args.flow_endpoint_name
+async def delete_registered_run(client, args) -> Progress | None:
+    """Delete the sessions of a registered harness run and drop them from the registry."""
+    registry = SessionRegistry(args.registry)
+    try:
+        run_id, session_ids = registered_sessions(registry, args.run)
+        if not session_ids:
+            print(f"No sessions registered for run '{args.run}' in {args.registry}.")
+            return None
+        action = "Listing" if args.dry_run else "Deleting"
+        print(
+            f"{action} {len(session_ids)} session(s) of run {run_id} "
+            f"({args.concurrency} workers, rate {args.rate:g}/s)..."
+        )
+        progress = await delete_sessions(
+            client, None, args.concurrency, args.rate, args.dry_run, session_ids=session_ids
+        )
+        registry.forget(progress.cleared, run_id)
+        return progress
+    finally:
+        registry.close()
 
-    print(f"Fetching ID for flow with endpoint name '{flow_endpoint_name}'…")
-    flow_id = get_flow_id_by_name(flow_endpoint_name)
 
+async def delete_flow_sessions(client, args) -> Progress | None:
+    """Delete every session of the flow, scanning its messages."""
+    flow_id = args.flow_id
     if not flow_id:
-        print(f"No flow found with endpoint name '{flow_endpoint_name}'.")
-        return
-
-    print(f"Starting to fetch and delete sessions for flow {flow_id} in batches...")
-
-    processed_session_ids = set()
-    total_deleted = 0
-    page = 1
-    per_page = 50 # Process 50 messages at a time
+        print(f"Fetching ID for flow with endpoint name '{args.flow_endpoint_name}'…")
+        flow_id = await get_flow_id_by_name(client, args.flow_endpoint_name)
+        if not flow_id:
+            print(f"No flow found with endpoint name '{args.flow_endpoint_name}'.")
+            return None
+    action = "Listing" if args.dry_run else "Deleting"
+    print(f"{action} sessions for flow {flow_id} ({args.concurrency} workers, rate {args.rate:g}/s)...")
+    return await delete_sessions(client, flow_id, args.concurrency, args.rate, args.dry_run)
 
-    while True:
-        print(f"Fetching page {page} of messages...")
-        resp = requests.get(
-            f"{LANGFLOW_URL}/api/v1/monitor/messages",
-            headers=HEADERS,
-            params={"flow_id": flow_id, "page": page, "per_page": per_page},
-            timeout=60, # Increased timeout for potentially slower API calls
-        )
-        resp.raise_for_status()
-        messages = resp.json()
-
-        if not messages:
-            print("No more messages found.")
-            break
 
-        session_ids_on_page = {msg["session_id"] for msg in messages if isinstance(msg, dict) and "session_id" in msg}
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 1, max_keepalive_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=LANGFLOW_URL, headers=HEADERS, limits=limits) as client:
+        if args.run:
+            progress = await delete_registered_run(client, args)
+        else:
+            progress = await delete_flow_sessions(client, args)
+    if progress is None:
+        return
 
-        new_sessions_to_delete = session_ids_on_page - processed_session_ids
+    if args.dry_run:
+        print(f"\n✨ Dry run complete. {progress.found} session(s) would be cleared.")
+    else:
+        print(f"\n✨ Process complete. {progress.line()}")
 
-        if new_sessions_to_delete:
-            print(f"Found {len(new_sessions_to_delete)} new session(s) to delete on this page.")
-            for session_id in new_sessions_to_delete:
-                if delete_session_messages(session_id):
-                    total_deleted += 1
-                processed_session_ids.add(session_id)
-        else:
-            print("No new sessions found on this page.")
 
-        # If we received fewer messages than we asked for, we're on the last page
-        if len(messages) < per_page:
-            print("Finished fetching all pages.")
-            break
+def main():
+    if not API_KEY or not LANGFLOW_URL:
+        print("❌ Error: LANGFLOW_URL or LANGFLOW_API_KEY is not configured.", file=sys.stderr)
+        print("Please set the following environment variables:", file=sys.stderr)
+        print("  - LANGFLOW_URL: Your Langflow instance URL (e.g., from Phoenix Cloud).", file=sys.stderr)
+        print("  - LANGFLOW_API_KEY: Your Langflow API key.", file=sys.stderr)
+        sys.exit(1)
 
-        page += 1
+    # Parse command line arguments
+    args = parse_arguments()
+    asyncio.run(run(args))
 
-    print(f"\n✨ Process complete. Total unique sessions cleared: {total_deleted}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,92 @@
+"""
+This script measures the cold-start import time of each harness.
+Every module is imported in a fresh interpreter with `python -X importtime`, so
+the wall time includes any network calls made at import. Run it before and after
+a change (e.g. with `git stash`) to compare startup times.
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Harness directory and the modules to import, in the order the harness imports them
+HARNESSES = {
+    "langsmith": ("langsmith/python", ["config", "dataset", "judge", "main"]),
+    "arize": ("arize", ["config", "dataset", "judge", "main"]),
+    "single_vs_multi_agent": ("single_vs_multi_agent", ["config", "main"]),
+}
+
+def parse_importtime(stderr: str) -> list:
+    """Return (cumulative microseconds, nesting depth, module) for every line of `-X importtime` output."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        depth = (len(module) - len(module.lstrip()) - 1) // 2
+        imports.append((int(cumulative), depth, module.strip()))
+    return imports
+
+def measure_import(directory: str, module: str, timeout: float) -> dict:
+    """Import `module` in a fresh interpreter and return its wall time and heaviest imports."""
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=os.path.join(ROOT, directory),
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            check=False,
+        )
+    except subprocess.TimeoutExpired:
+        return {"seconds": time.perf_counter() - start, "error": f"timed out after {timeout:.0f}s", "imports": []}
+    seconds = time.perf_counter() - start
+    error = None
+    if result.returncode != 0:
+        lines = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        error = lines[-1] if lines else f"exit code {result.returncode}"
+    return {"seconds": seconds, "error": error, "imports": parse_importtime(result.stderr)}
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Measure the cold-start import time of each harness.")
+    parser.add_argument(
+        "harnesses",
+        nargs="*",
+        default=list(HARNESSES),
+        help=f"Harnesses to measure, any of {', '.join(HARNESSES)} (default: all)"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Imports per module; the fastest is reported (default: 3)")
+    parser.add_argument("--top", type=int, default=3, help="Heaviest imports to list per module (default: 3)")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds before an import is abandoned (default: 120)")
+    args = parser.parse_args()
+    unknown = set(args.harnesses) - set(HARNESSES)
+    if unknown:
+        parser.error(f"unknown harness(es): {', '.join(sorted(unknown))}")
+    return args
+
+def main():
+    args = parse_arguments()
+    print(f"{'harness':<24}{'module':<10}{'wall (s)':>10}  heaviest imports (cumulative s)")
+    for harness in args.harnesses:
+        directory, modules = HARNESSES[harness]
+        for module in modules:
+            runs = [measure_import(directory, module, args.timeout) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run["seconds"])
+            if best["error"]:
+                print(f"{harness:<24}{module:<10}{best['seconds']:>10.2f}  ✖ {best['error']}")
+                continue
+            # Direct imports of the measured module, heaviest first
+            heaviest = sorted(
+                ((micros, name) for micros, depth, name in best["imports"] if depth == 1),
+                reverse=True,
+            )[:args.top]
+            summary = ", ".join(f"{name} {micros / 1e6:.2f}" for micros, name in heaviest)
+            print(f"{harness:<24}{module:<10}{best['seconds']:>10.2f}  {summary}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+This script runs a local stand-in for Langflow's run API, so the harnesses can
+be exercised without a live Langflow or LLM provider.
+`POST /api/v1/run/{endpoint}` answers with the same nested
+`outputs[0].outputs[0].results.message.data.text` shape as Langflow (or, with
+`?stream=true`, with `token` events followed by an `end` event), after a latency
+drawn from a configurable distribution. A share of requests can be answered with
+500 or 429 errors, and the answer size is configurable.
+
+    python utils/mock_langflow.py --port 7861 --latency lognormal:0.2,0.5 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+RUN_PATH = re.compile(r"^/api/v1/run/(?P<endpoint>[^/]+)$")
+# Words the mock answers are made of
+WORDS = "the agent looked at the question and worked out the answer step by step".split()
+
+
+def mock_text(chars: int) -> str:
+    """Return the deterministic answer of `chars` characters sent by the mock server."""
+    text = ""
+    while len(text) < chars:
+        text += " ".join(WORDS) + " "
+    return text[:chars]
+
+
+def parse_latency(spec: str):
+    """
+    Parse a latency distribution into a function returning seconds:
+    `fixed:S`, `uniform:LOW,HIGH`, `exponential:MEAN` or `lognormal:MEDIAN,SIGMA`.
+    """
+    kind, _, args = spec.partition(":")
+    try:
+        values = [float(value) for value in args.split(",")] if args else []
+    except ValueError as e:
+        raise ValueError(f"Invalid latency distribution '{spec}'") from e
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exponential" and len(values) == 1:
+        return lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: values[0] * rng.lognormvariate(0, values[1])
+    raise ValueError(
+        f"Invalid latency distribution '{spec}', expected fixed:S, uniform:LOW,HIGH, "
+        "exponential:MEAN or lognormal:MEDIAN,SIGMA"
+    )
+
+
+def run_response(text, session_id=None) -> dict:
+    """Build a Langflow run API response carrying `text`."""
+    return {
+        "session_id": session_id,
+        "outputs": [{"inputs": {}, "outputs": [{"results": {"message": {"data": {"text": text}}}}]}],
+    }
+
+
+class MockLangflowServer:
+    """
+    Threaded HTTP server mimicking Langflow's run API.
+    `start()` serves in a background thread and returns the base URL; `stop()` shuts it down.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency="fixed:0", error_rate=0.0,
+                 throttle_rate=0.0, payload_chars=200, token_chars=4, seed=None):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.payload_chars = payload_chars
+        self.token_chars = max(1, token_chars)
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _draw(self):
+        """Draw the latency and outcome of one request."""
+        with self._lock:
+            self.requests += 1
+            latency = max(0.0, self.latency(self._rng))
+            roll = self._rng.random()
+        if roll < self.error_rate:
+            return latency, 500
+        if roll < self.error_rate + self.throttle_rate:
+            return latency, 429
+        return latency, 200
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Request handler; keeps connections alive like Langflow behind uvicorn."""
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body are written separately
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+            def _send(self, status, body, content_type="application/json", headers=None):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                if urlparse(self.path).path == "/health":
+                    self._send(200, json.dumps({"status": "ok", "requests": server.requests}))
+                else:
+                    self._send(404, json.dumps({"detail": "Not Found"}))
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if not RUN_PATH.match(url.path):
+                    self._send(404, json.dumps({"detail": "Not Found"}))
+                    return
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError:
+                    self._send(422, json.dumps({"detail": "Invalid JSON body"}))
+                    return
+                latency, status = server._draw()  # pylint: disable=protected-access
+                time.sleep(latency)
+                if status == 429:
+                    self._send(429, json.dumps({"detail": "Rate limit exceeded"}), headers={"Retry-After": "1"})
+                    return
+                if status != 200:
+                    self._send(status, json.dumps({"detail": "Mock Langflow error"}))
+                    return
+                text = mock_text(server.payload_chars)
+                response = run_response(text, payload.get("session_id"))
+                if parse_qs(url.query).get("stream", ["false"])[0].lower() == "true":
+                    events = [
+                        {"event": "token", "data": {"chunk": text[start:start + server.token_chars]}}
+                        for start in range(0, len(text), server.token_chars)
+                    ]
+                    events.append({"event": "end", "data": {"result": response}})
+                    self._send(200, "".join(json.dumps(event) + "\n\n" for event in events), "application/x-ndjson")
+                else:
+                    self._send(200, json.dumps(response))
+
+        return Handler
+
+    def start(self) -> str:
+        """Serve in a background thread and return the base URL."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-langflow", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted."""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+
+def add_server_arguments(parser):
+    """Add the mock server options to an argument parser."""
+    parser.add_argument(
+        "--latency",
+        default="fixed:0",
+        help="Latency distribution: fixed:S, uniform:LOW,HIGH, exponential:MEAN or lognormal:MEDIAN,SIGMA (default: fixed:0)"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500 (default: 0)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with a 429 (default: 0)")
+    parser.add_argument("--payload-chars", type=int, default=200, help="Characters in each answer (default: 200)")
+    parser.add_argument("--token-chars", type=int, default=4, help="Characters per streamed token event (default: 4)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible latencies and errors")
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Run a local mock of Langflow's run API.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=7861, help="Port to listen on (default: 7861)")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    try:
+        parse_latency(args.latency)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def main():
+    args = parse_arguments()
+    server = MockLangflowServer(
+        args.host, args.port, args.latency, args.error_rate, args.throttle_rate,
+        args.payload_chars, args.token_chars, args.seed,
+    )
+    print(f"Mock Langflow listening on {server.url} (latency {args.latency}, error rate {args.error_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+This script measures the throughput of each harness's own Langflow call path
+against the local mock Langflow server (mock_langflow.py), so harness overhead
+can be tracked without a live Langflow or LLM provider.
+For every harness and concurrency level a fresh interpreter imports the harness
+and sends `--requests` calls through its async Langflow call (caching, retries,
+token accounting and phase timing included; LangSmith tracing off), reporting
+requests/s, CPU time and peak RSS. Save a run with `--save` and compare a later
+run against it with `--compare` to catch throughput regressions.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import importlib
+import subprocess
+import tempfile
+from types import SimpleNamespace
+from mock_langflow import MockLangflowServer, add_server_arguments, mock_text, parse_latency
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Provider and model sent with every benchmark call
+PROVIDER = "Benchmark"
+MODEL_NAME = "mock-model"
+
+# Harness directory and how to call its async Langflow call path with a question
+HARNESSES = {
+    "langsmith": (
+        "langsmith/python",
+        lambda main, question: main.acall_langflow_api(question, PROVIDER, MODEL_NAME, None),
+    ),
+    "arize": (
+        "arize",
+        lambda main, question: main.acall_langflow_api(
+            SimpleNamespace(input={"question": question}), PROVIDER, MODEL_NAME, None
+        ),
+    ),
+    "single_vs_multi_agent": (
+        "single_vs_multi_agent",
+        lambda main, question: main.acall_langflow_api(question, PROVIDER, MODEL_NAME, None, "benchmark"),
+    ),
+}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_worker(harness, concurrency, requests, payload_chars):
+    """Drive one harness in this process and print its results as JSON."""
+    directory, call = HARNESSES[harness]
+    sys.path.insert(0, os.path.join(ROOT, directory))
+    main = importlib.import_module("main")
+    expected = mock_text(payload_chars)
+
+    async def drive():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            async with semaphore:
+                return await call(main, f"Benchmark question {i}")
+
+        # A failed call raises LangflowCallError, which counts as an error
+        return await asyncio.gather(*(one(i) for i in range(requests)), return_exceptions=True)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    outputs = asyncio.run(drive())
+    seconds = time.perf_counter() - start
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (end_usage.ru_utime - usage.ru_utime) + (end_usage.ru_stime - usage.ru_stime)
+    print(json.dumps({
+        "requests": requests,
+        "errors": sum(output != expected for output in outputs),
+        "seconds": seconds,
+        "rps": requests / seconds,
+        "cpu_s": cpu,
+        "rss_mb": peak_rss_mb(),
+    }))
+
+
+def measure(harness, concurrency, requests, server, stream, timeout) -> dict:
+    """Run a worker for one (harness, concurrency) pair in a fresh interpreter."""
+    env = {
+        **os.environ,
+        "LANGFLOW_URL": server.url,
+        "LANGFLOW_CACHE": "off",
+        "LANGFLOW_STREAM": "true" if stream else "false",
+        "LANGSMITH_TRACING": "false",
+        "LANGCHAIN_TRACING_V2": "false",
+    }
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker", harness,
+        "--requests", str(requests), "--concurrency", str(concurrency),
+        "--payload-chars", str(server.payload_chars),
+    ]
+    # Run from a scratch directory so log files and caches stay out of the repo
+    with tempfile.TemporaryDirectory() as scratch:
+        try:
+            result = subprocess.run(
+                command, cwd=scratch, env=env, capture_output=True, text=True, timeout=timeout, check=False
+            )
+        except subprocess.TimeoutExpired:
+            return {"error": f"timed out after {timeout:.0f}s"}
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        errors = result.stderr.strip().splitlines()
+        return {"error": errors[-1] if errors else f"exit code {result.returncode}"}
+    return json.loads(lines[-1])
+
+
+def compare(results, baseline, tolerance) -> list:
+    """Return the (harness, concurrency, rps, baseline rps) rows that regressed beyond `tolerance`."""
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if not previous or "rps" not in previous or "rps" not in result:
+            continue
+        if result["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append((key, result["rps"], previous["rps"]))
+    return regressions
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Measure harness throughput against a mock Langflow server.")
+    parser.add_argument(
+        "harnesses",
+        nargs="*",
+        default=list(HARNESSES),
+        help=f"Harnesses to measure, any of {', '.join(HARNESSES)} (default: all)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 8, 64],
+        help="Concurrency levels to measure (default: 1 8 64)"
+    )
+    parser.add_argument("--requests", type=int, default=200, help="Calls per concurrency level (default: 200)")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming run API")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds before a run is abandoned (default: 300)")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare requests/s with the results in this JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed drop in requests/s before --compare reports a regression (default: 0.2)"
+    )
+    parser.add_argument("--worker", choices=list(HARNESSES), help=argparse.SUPPRESS)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    unknown = set(args.harnesses) - set(HARNESSES)
+    if unknown:
+        parser.error(f"unknown harness(es): {', '.join(sorted(unknown))}")
+    try:
+        parse_latency(args.latency)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def main():
+    args = parse_arguments()
+    if args.worker:
+        run_worker(args.worker, args.concurrency[0], args.requests, args.payload_chars)
+        return
+
+    server = MockLangflowServer(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        payload_chars=args.payload_chars,
+        token_chars=args.token_chars,
+        seed=args.seed,
+    )
+    server.start()
+    results = {}
+    print(f"{'harness':<24}{'conc':>6}{'req/s':>10}{'errors':>8}{'CPU (s)':>10}{'CPU %':>8}{'RSS (MB)':>10}")
+    try:
+        for harness in args.harnesses:
+            for concurrency in args.concurrency:
+                result = measure(harness, concurrency, args.requests, server, args.stream, args.timeout)
+                results[f"{harness}@{concurrency}"] = result
+                if "error" in result:
+                    print(f"{harness:<24}{concurrency:>6}  ✖ {result['error']}")
+                    continue
+                print(
+                    f"{harness:<24}{concurrency:>6}{result['rps']:>10.1f}{result['errors']:>8}"
+                    f"{result['cpu_s']:>10.2f}{100 * result['cpu_s'] / result['seconds']:>8.0f}"
+                    f"{result['rss_mb']:>10.1f}"
+                )
+    finally:
+        server.stop()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for key, rps, previous in regressions:
+            print(f"✖ {key}: {rps:.1f} req/s, down from {previous:.1f} req/s")
+        if regressions:
+            sys.exit(1)
+        print(f"No throughput regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()